@@ -3,6 +3,7 @@ import mimeparse
 from django.contrib.auth.models import AnonymousUser
 
 from hyperadmin.states import State
+from hyperadmin.instrumentation import SQLInstrumentation, AllocationCounter, count_allocation, null_phase
 
 
 class APIRequest(object):
@@ -169,6 +170,85 @@ class APIRequest(object):
     def reverse(self, name, *args, **kwargs):
         return self.get_site().reverse(name, *args, **kwargs)
 
+    def instrumentation_header_sent(self):
+        """
+        Returns True if a staff user sent the instrumentation header
+        """
+        from hyperadmin import app_settings
+        if self.META.get(app_settings.INSTRUMENT_SQL_HEADER, None):
+            user = getattr(self, 'user', None)
+            return bool(user and getattr(user, 'is_staff', False))
+        return False
+
+    def instrumentation_requested(self):
+        """
+        Returns True if the SQL of this request should be instrumented.
+        Enabled by the `HYPERADMIN_INSTRUMENT_SQL` setting or by a staff user
+        sending the instrumentation header.
+        """
+        from hyperadmin import app_settings
+        return app_settings.INSTRUMENT_SQL or self.instrumentation_header_sent()
+
+    def allocation_counting_requested(self):
+        """
+        Returns True if the allocations of this request should be counted.
+        Enabled by the `HYPERADMIN_COUNT_ALLOCATIONS` setting or by a staff user
+        sending the instrumentation header.
+        """
+        from hyperadmin import app_settings
+        return app_settings.COUNT_ALLOCATIONS or self.instrumentation_header_sent()
+
+    def get_allocation_counter(self):
+        """
+        Returns the active allocation counter or None
+
+        :rtype: AllocationCounter
+        """
+        return self.session_state.get('allocations', None)
+
+    def start_allocation_counter(self):
+        """
+        Starts counting the allocations of the request if requested and not already counting
+
+        :rtype: AllocationCounter or None
+        """
+        if self.get_allocation_counter() is not None or not self.allocation_counting_requested():
+            return None
+        counter = AllocationCounter()
+        counter.start()
+        self.session_state['allocations'] = counter
+        return counter
+
+    def get_instrumentation(self):
+        """
+        Returns the active instrumentation or None
+
+        :rtype: SQLInstrumentation
+        """
+        return self.session_state.get('instrumentation', None)
+
+    def start_instrumentation(self):
+        """
+        Starts instrumenting the request if requested and not already instrumented
+
+        :rtype: SQLInstrumentation or None
+        """
+        if self.get_instrumentation() is not None or not self.instrumentation_requested():
+            return None
+        instrumentation = SQLInstrumentation()
+        instrumentation.start()
+        self.session_state['instrumentation'] = instrumentation
+        return instrumentation
+
+    def instrument(self, phase):
+        """
+        Returns a context manager attributing the enclosed queries to the phase
+        """
+        instrumentation = self.get_instrumentation()
+        if instrumentation is None or not instrumentation.active:
+            return null_phase()
+        return instrumentation.phase(phase)
+
 class InternalAPIRequest(APIRequest):
     """
     An Internal API Request
@@ -278,6 +358,7 @@ class HTTPAPIRequest(APIRequest):
 
 class NamespaceAPIRequest(InternalAPIRequest):
     def __init__(self, api_request, **kwargs):
+        count_allocation('NamespaceAPIRequest')
         self.original_api_request = api_request
         kwargs.setdefault('full_path', self.original_api_request.get_full_path())
         kwargs.setdefault('site', api_request.site)
@@ -300,6 +381,7 @@ class Namespace(object):
     Namespaced data is provided by another resource through an internal api request
     """
     def __init__(self, name, endpoint, state_data={}):
+        count_allocation('Namespace')
         self.name = name
         self.api_request = NamespaceAPIRequest(endpoint.api_request)
         self.state_data = state_data
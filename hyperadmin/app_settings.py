@@ -7,3 +7,53 @@ path, classname = path.rsplit('.', 1)
 
 DEFAULT_API_REQUEST_CLASS = getattr(import_module(path), classname)
 
+INSTRUMENT_SQL = getattr(settings, 'HYPERADMIN_INSTRUMENT_SQL', False)
+'''Instrument the SQL of every api request'''
+
+INSTRUMENT_SQL_HEADER = getattr(settings, 'HYPERADMIN_INSTRUMENT_SQL_HEADER', 'HTTP_X_HYPERADMIN_INSTRUMENT')
+'''META key of the header with which staff users may request instrumentation'''
+
+COLLECT_TIMINGS = getattr(settings, 'HYPERADMIN_COLLECT_TIMINGS', False)
+'''Aggregate the phase timings of endpoints for the hyperadmin_timings command'''
+
+COUNT_ALLOCATIONS = getattr(settings, 'HYPERADMIN_COUNT_ALLOCATIONS', False)
+'''Count the forks, links, forms and states constructed by every api request'''
+
+PROFILE_SAMPLE_RATE = getattr(settings, 'HYPERADMIN_PROFILE_SAMPLE_RATE', 0)
+'''Fraction of the requests to profile'''
+
+PROFILE_THRESHOLD = getattr(settings, 'HYPERADMIN_PROFILE_THRESHOLD', None)
+'''Profile every request and keep those taking longer than this many seconds'''
+
+PROFILE_STORAGE = getattr(settings, 'HYPERADMIN_PROFILE_STORAGE', None)
+'''Dotted path to the storage class profiles are saved to, defaults to an unserved directory in the temporary directory'''
+
+LAZY_AUTOLOAD = getattr(settings, 'HYPERADMIN_LAZY_AUTOLOAD', False)
+'''Register the resources autoloaded by `install_models_from_site` lazily'''
+
+STREAM_DATATAPS = getattr(settings, 'HYPERADMIN_STREAM_DATATAPS', False)
+'''Stream the responses of datatap media types, ie JSON, one item at a time'''
+
+
+METRICS = getattr(settings, 'HYPERADMIN_METRICS', False)
+'''Record request, throttle and cache metrics for the metrics resource'''
+
+METRICS_DIRECTORY = getattr(settings, 'HYPERADMIN_METRICS_DIRECTORY', None)
+'''Directory shared by the server processes to aggregate their metrics'''
+
+MEDIA_TYPES = getattr(settings, 'HYPERADMIN_MEDIA_TYPES', {
+    'application/vnd.Collection+JSON': 'hyperadmin.mediatypes.collectionjson.CollectionJSON',
+    'application/vnd.collection+json': 'hyperadmin.mediatypes.collectionjson.CollectionJSON',
+    'application/vnd.Collection.next+JSON': 'hyperadmin.mediatypes.collectionjson.CollectionNextJSON',
+    'application/vnd.Collection.hyperadmin+JSON': 'hyperadmin.mediatypes.collectionjson.CollectionHyperAdminJSON',
+    'text/html': 'hyperadmin.mediatypes.html5.Html5MediaType',
+    'text/plain': 'hyperadmin.mediatypes.html5.Html5MediaType',
+    'application/xhtml+xml': 'hyperadmin.mediatypes.html5.Html5MediaType',
+    'application/text-html': 'hyperadmin.mediatypes.html5.Html5MediaType',
+    'application/x-www-form-urlencoded': 'hyperadmin.mediatypes.html5.Html5MediaType',
+    'multipart/form-data': 'hyperadmin.mediatypes.html5.Html5MediaType',
+    'application/json': 'hyperadmin.mediatypes.json.JSON',
+    'text/javascript': 'hyperadmin.mediatypes.json.JSONP',
+    'text/html-iframe-transport;level=1': 'hyperadmin.mediatypes.iframe.IframeMediaType',
+})
+'''Dotted paths of the media type classes registered by `register_builtin_media_types`, keyed by content type'''
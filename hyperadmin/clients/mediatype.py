@@ -48,7 +48,7 @@ class MediaTypeClient(Client):
         self.endpoints[self.site.get_url_name()] = self.site
     
     def get_media_types(self):
-        media_types = dict(self.api_endpoint.media_types)
+        media_types = dict(self.api_endpoint.media_types.items())
         for media_type_handler in self.media_types:
             for media_type in media_type_handler.recognized_media_types:
                 media_types[media_type] = media_type_handler
@@ -8,13 +8,8 @@ GET_VARIABLE = '_API_KEY'
 class APIKeyMixin(object):
     def get_session_data_from_request(self, request):
         data = super(APIKeyMixin, self).get_session_data_from_request(request)
-        if HTTP_HEADER in request.META:
-            key = request.META[HTTP_HEADER]
-            user = authenticate(key)
-            if user:
-                data['auth'] = user
-        if GET_VARIABLE in request.GET:
-            key = request.GET[HTTP_HEADER]
+        key = request.GET.get(GET_VARIABLE, request.META.get(HTTP_HEADER))
+        if key:
             user = authenticate(key)
             if user:
                 data['auth'] = user
@@ -1,9 +1,101 @@
-from hyperadmin.contrib.apikey.models import ApiKey
+import threading
+import time
+try:
+    from collections import OrderedDict
+except ImportError:
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+
+from hyperadmin.contrib.apikey.models import ApiKey, hash_key
+from hyperadmin.metrics import record_cache_lookup
+
+
+CACHE_SIZE = getattr(settings, 'HYPERADMIN_APIKEY_CACHE_SIZE', 1000)
+CACHE_TIMEOUT = getattr(settings, 'HYPERADMIN_APIKEY_CACHE_TIMEOUT', 300)
+
+class KeyCache(object):
+    """
+    Least recently used cache of key hashes to the id of their user, or
+    None for unknown and inactive keys. Entries expire after `timeout`
+    seconds which bounds how long changes made by other processes go unseen,
+    changes made in this process are invalidated through signals.
+    """
+    def __init__(self, max_size=CACHE_SIZE, timeout=CACHE_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+    
+    def get(self, key_hash):
+        '''
+        Returns (found, user id)
+        '''
+        with self.lock:
+            if key_hash not in self.entries:
+                return False, None
+            user_id, expires = self.entries.pop(key_hash)
+            if expires < time.time():
+                return False, None
+            self.entries[key_hash] = (user_id, expires)
+            return True, user_id
+    
+    def set(self, key_hash, user_id):
+        with self.lock:
+            self.entries.pop(key_hash, None)
+            while len(self.entries) >= self.max_size:
+                del self.entries[iter(self.entries).next()]
+            self.entries[key_hash] = (user_id, time.time() + self.timeout)
+    
+    def invalidate(self, key_hash):
+        with self.lock:
+            self.entries.pop(key_hash, None)
+    
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for key_hash, (entry_user_id, expires) in self.entries.items():
+                if entry_user_id == user_id:
+                    del self.entries[key_hash]
+    
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+
+key_cache = KeyCache()
+
+def get_user_id(key):
+    key_hash = hash_key(key)
+    found, user_id = key_cache.get(key_hash)
+    record_cache_lookup('apikey', found)
+    if not found:
+        try:
+            user_id = ApiKey.objects.filter(key_hash=key_hash, active=True).values_list('user_id', flat=True)[0]
+        except IndexError:
+            user_id = None
+        key_cache.set(key_hash, user_id)
+    return user_id
 
 def authenticate(key):
+    user_id = get_user_id(key)
+    if user_id is None:
+        return None
     try:
-        entry = ApiKey.objects.get(key=key, active=True)
-    except ApiKey.DoesNotExist:
+        return User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        key_cache.invalidate(hash_key(key))
         return None
-    return entry.user
 
+def invalidate_api_key(sender, instance, **kwargs):
+    key_cache.invalidate(instance.key_hash)
+    #the hash of a key may have changed
+    key_cache.invalidate_user(instance.user_id)
+
+def invalidate_user(sender, instance, **kwargs):
+    key_cache.invalidate_user(instance.pk)
+
+post_save.connect(invalidate_api_key, sender=ApiKey)
+post_delete.connect(invalidate_api_key, sender=ApiKey)
+post_save.connect(invalidate_user, sender=User)
+post_delete.connect(invalidate_user, sender=User)
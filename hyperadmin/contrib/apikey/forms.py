@@ -0,0 +1,28 @@
+from django import forms
+
+from hyperadmin.contrib.apikey.models import ApiKey
+
+
+class ApiKeyForm(forms.ModelForm):
+    '''
+    The key is only shown by the form of the instance that generated or was
+    assigned it, ie in the response to its creation
+    '''
+    key = forms.CharField(required=False, max_length=100,
+                          help_text='Leave blank to generate a key, it is only shown once')
+    
+    class Meta:
+        model = ApiKey
+    
+    def __init__(self, *args, **kwargs):
+        super(ApiKeyForm, self).__init__(*args, **kwargs)
+        if self.instance.key:
+            self.initial['key'] = self.instance.key
+    
+    def save(self, commit=True):
+        instance = super(ApiKeyForm, self).save(commit=False)
+        if self.cleaned_data.get('key'):
+            instance.key = self.cleaned_data['key']
+        if commit:
+            instance.save()
+        return instance
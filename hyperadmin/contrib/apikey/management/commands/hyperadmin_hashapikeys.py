@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+
+from hyperadmin.contrib.apikey.models import ApiKey, hash_key
+
+
+class Command(BaseCommand):
+    help = ('Replaces the api key table created before keys were hashed, the '
+            'keys are kept as their hash so issued keys keep authenticating')
+
+    def handle(self, *args, **options):
+        using = router.db_for_write(ApiKey)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        table = ApiKey._meta.db_table
+        cursor = connection.cursor()
+        columns = [column[0] for column in connection.introspection.get_table_description(cursor, table)]
+        if 'key_hash' in columns:
+            self.stdout.write('The api keys of %s are already hashed\n' % table)
+            return
+
+        style = no_style()
+        with transaction.commit_on_success(using=using):
+            cursor.execute('SELECT %s FROM %s' % (
+                ', '.join([qn(column) for column in ('id', 'key', 'user_id', 'active')]), qn(table)))
+            rows = cursor.fetchall()
+            cursor.execute('DROP TABLE %s' % qn(table))
+            statements, pending = connection.creation.sql_create_model(ApiKey, style, set([User]))
+            statements += connection.creation.sql_indexes_for_model(ApiKey, style)
+            for statement in statements:
+                cursor.execute(statement)
+            for pk, key, user_id, active in rows:
+                ApiKey(pk=pk, key_hash=hash_key(key), user_id=user_id, active=bool(active)).save(
+                    force_insert=True, using=using)
+            for statement in connection.ops.sequence_reset_sql(style, [ApiKey]):
+                cursor.execute(statement)
+        self.stdout.write('Hashed %s api keys of %s\n' % (len(rows), table))
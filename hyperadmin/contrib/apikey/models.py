@@ -1,12 +1,44 @@
+import binascii
+import hashlib
+import os
+
 from django.db import models
 from django.contrib.auth.models import User
 
 
+def hash_key(key):
+    '''
+    Returns the hex digest stored in place of the key
+    '''
+    if isinstance(key, unicode):
+        key = key.encode('utf8')
+    return hashlib.sha256(key).hexdigest()
+
+def generate_key():
+    return binascii.hexlify(os.urandom(20))
+
 class ApiKey(models.Model):
-    key = models.CharField(max_length=100, unique=True)
+    '''
+    Only the hash of the key is stored, the key itself is available as
+    `key` on the instance that generated or was assigned it
+    '''
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
     user = models.ForeignKey(User)
     active = models.BooleanField(default=True)
     
+    def get_key(self):
+        return getattr(self, '_key', None)
+    
+    def set_key(self, key):
+        self._key = key
+        self.key_hash = hash_key(key)
+    
+    key = property(get_key, set_key)
+    
+    def save(self, *args, **kwargs):
+        if not self.key_hash:
+            self.key = generate_key()
+        return super(ApiKey, self).save(*args, **kwargs)
+    
     def __unicode__(self):
-        return self.key
-
+        return self.key_hash
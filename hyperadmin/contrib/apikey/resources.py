@@ -1,11 +1,28 @@
 from hyperadmin import site
 from hyperadmin.resources.models import ModelResource
 
+from hyperadmin.contrib.apikey.forms import ApiKeyForm
 from hyperadmin.contrib.apikey.models import ApiKey
 
 
 class ApiKeyResource(ModelResource):
     model = ApiKey
+    form_class = ApiKeyForm
+    list_display = ['__str__', 'user', 'active', 'issued_key']
+    
+    def issued_key(self, instance):
+        '''
+        The key of an instance that was just created, keys are not stored
+        '''
+        return instance.key or ''
+    
+    def on_create_success(self, item):
+        '''
+        Responds with the form of the created item, the only response
+        carrying the generated key
+        '''
+        link = super(ApiKeyResource, self).on_create_success(item) or item.get_link()
+        return link.clone(form=item.get_form())
 
 site.register(ApiKey, ApiKeyResource, app_name='apikey')
 
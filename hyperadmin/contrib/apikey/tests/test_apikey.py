@@ -1,16 +1,22 @@
+from StringIO import StringIO
+
 from django.utils import unittest
 from django.contrib.auth.models import User
 from django.http import HttpResponse
 from django.test.client import RequestFactory
+from django.core.management import call_command
+from django.db import connection
 
 from hyperadmin.resources.models import ModelResource
 from hyperadmin.sites import ResourceSite
 from hyperadmin.apirequests import InternalAPIRequest, NamespaceAPIRequest
 from hyperadmin.endpoints import RootEndpoint
 from hyperadmin.contrib.apikey.apirequests import HTTPAPIKeyRequest
-from hyperadmin.contrib.apikey.models import ApiKey
+from hyperadmin.contrib.apikey.common import authenticate, key_cache, KeyCache
+from hyperadmin.contrib.apikey.models import ApiKey, hash_key
+from hyperadmin.contrib.apikey.resources import ApiKeyResource
 
-from hyperadmin.tests.common import GenericURLResolver, SuperUserRequestFactory
+from hyperadmin.tests.common import GenericURLResolver, SuperUserRequestFactory, count_queries
 
 from mock import MagicMock
 
@@ -29,8 +35,9 @@ class ResourceTestCase(unittest.TestCase):
         self.user = User.objects.get_or_create(username='superuser', is_staff=True, is_active=True, is_superuser=True)[0]
         self.resource = self.register_resource()
         
-        self.api_key_instance = ApiKey.objects.get_or_create(user=self.user, key='foobar')[0]
-        self.api_key = self.api_key_instance.key
+        self.api_key = 'foobar'
+        self.api_key_instance = ApiKey.objects.get_or_create(user=self.user, key_hash=hash_key(self.api_key))[0]
+        key_cache.clear()
         self.factory = RequestFactory(HTTP_ACCEPT='text/html', API_KEY=self.api_key)
         
         self.resolver = GenericURLResolver(r'^', self.site.get_urls())
@@ -83,3 +90,95 @@ class APIKeyTestCase(ResourceTestCase):
     def test_user_lookup(self):
         api_request = self.get_api_request()
         self.assertEqual(self.user, api_request.user)
+    
+    def test_key_lookup_is_cached(self):
+        self.assertEqual(authenticate(self.api_key), self.user)
+        with count_queries() as queries:
+            self.assertEqual(authenticate(self.api_key), self.user)
+        #only the user is loaded
+        self.assertEqual(len(queries), 1)
+    
+    def test_invalidation(self):
+        self.assertEqual(authenticate(self.api_key), self.user)
+        self.api_key_instance.active = False
+        self.api_key_instance.save()
+        try:
+            self.assertEqual(authenticate(self.api_key), None)
+        finally:
+            self.api_key_instance.active = True
+            self.api_key_instance.save()
+        self.assertEqual(authenticate(self.api_key), self.user)
+        
+        other = ApiKey.objects.create(user=self.user)
+        self.assertEqual(len(other.key), 40)
+        self.assertEqual(other.key_hash, hash_key(other.key))
+        self.assertEqual(authenticate(other.key), self.user)
+        other.delete()
+        self.assertEqual(authenticate(other.key), None)
+    
+    def test_key_cache(self):
+        cache = KeyCache(max_size=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), (True, 1))
+        cache.set('c', 3)
+        #b was the least recently used
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+        cache.invalidate_user(1)
+        self.assertEqual(cache.get('a'), (False, None))
+        
+        cache.timeout = -1
+        cache.set('d', None)
+        self.assertEqual(cache.get('d'), (False, None))
+
+class APIKeyResourceTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(ApiKey, ApiKeyResource, app_name='apikey')
+        return self.site.registry[ApiKey]
+    
+    def create_key(self, data, endpoint_name='add'):
+        api_request = InternalAPIRequest(site=self.site, user=self.user, method='POST',
+                                         payload={'data': data}, request=self.factory.post('/'))
+        api_request.generate_response = MagicMock(return_value=HttpResponse())
+        endpoint = self.resource.endpoints[endpoint_name].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        return api_request.generate_response.call_args[1]['link']
+    
+    def test_create_returns_key_once(self):
+        link = self.create_key({'user': self.user.pk, 'active': 'on'})
+        key = link.form.initial['key']
+        self.assertEqual(len(key), 40)
+        instance = ApiKey.objects.get(key_hash=hash_key(key))
+        self.assertEqual(authenticate(key), self.user)
+        
+        self.assertFalse(self.resource.get_resource_item(ApiKey.objects.get(pk=instance.pk)).form.initial.get('key'))
+        instance.delete()
+        
+        link = self.create_key({'user': self.user.pk, 'active': 'on', 'key': 'chosenkey'})
+        self.assertEqual(link.form.initial['key'], 'chosenkey')
+        self.assertEqual(authenticate('chosenkey'), self.user)
+        ApiKey.objects.filter(key_hash=hash_key('chosenkey')).delete()
+        
+        link = self.create_key({'user': self.user.pk, 'active': 'on'}, endpoint_name='list')
+        key = link.form.initial['issued_key']
+        self.assertEqual(authenticate(key), self.user)
+        ApiKey.objects.filter(key_hash=hash_key(key)).delete()
+    
+    def test_hash_legacy_keys(self):
+        ApiKey.objects.all().delete()
+        cursor = connection.cursor()
+        cursor.execute('DROP TABLE apikey_apikey')
+        cursor.execute('CREATE TABLE apikey_apikey (id integer NOT NULL PRIMARY KEY, '
+                       '"key" varchar(100) NOT NULL UNIQUE, user_id integer NOT NULL, active bool NOT NULL)')
+        cursor.execute('INSERT INTO apikey_apikey (id, "key", user_id, active) VALUES (7, %s, %s, 1)',
+                       ['legacykey', self.user.pk])
+        
+        call_command('hyperadmin_hashapikeys', stdout=StringIO())
+        
+        self.assertEqual(ApiKey.objects.get(pk=7).key_hash, hash_key('legacykey'))
+        self.assertEqual(authenticate('legacykey'), self.user)
+        self.assertNotEqual(ApiKey.objects.create(user=self.user).pk, 7)
+        output = StringIO()
+        call_command('hyperadmin_hashapikeys', stdout=output)
+        self.assertTrue('already hashed' in output.getvalue())
@@ -1,3 +1,5 @@
+import collections
+
 #from django.core.files import File
 
 from hyperadmin.links import Link
@@ -12,7 +14,7 @@ class HypermediaFormDataTap(DataTap):
     def get_domain(self):
         if self.instream is None: #no instream, I guess we write?
             return 'deserialized_form'
-        if isinstance(self.instream, (list, tuple)):
+        if isinstance(self.instream, (list, tuple, collections.Iterator)):
             return 'primitive'
         if self.instream.domain == 'primitive':
             return 'deserialized_form'
@@ -24,10 +26,8 @@ class HypermediaFormDataTap(DataTap):
         return self.serialize_forms(instream)
 
     def serialize_forms(self, item_list):
-        serializable_items = list()
         for item in item_list:
-            serializable_items.append(self.serialize_form(item))
-        return serializable_items
+            yield self.serialize_form(item)
 
     #CONSIDER this is redundant in mediatype. Should factor this out
     def serialize_form(self, item):
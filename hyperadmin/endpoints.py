@@ -2,19 +2,35 @@ from django.conf.urls.defaults import url, patterns, include
 from django.core.urlresolvers import reverse
 from django.views.generic import View
 from django.utils.datastructures import MultiValueDict
+from django.utils.importlib import import_module
 
 from hyperadmin.links import Link, LinkCollection, LinkCollectorMixin, LinkNotAvailable
 from hyperadmin.app_settings import DEFAULT_API_REQUEST_CLASS
 from hyperadmin.apirequests import InternalAPIRequest
 from hyperadmin.hyperobjects import Item
+from hyperadmin.instrumentation import count_allocation, timed_phase
+from hyperadmin.metrics import record_cache_lookup
 from hyperadmin.states import EndpointState
 from hyperadmin.views import EndpointViewMixin
 from hyperadmin.signals import endpoint_event
 
+import collections
 import logging
+import sys
 import urlparse
 
 
+def iter_instances(instances):
+    '''
+    Iterates unevaluated querysets with `iterator` so their rows are not
+    cached, querysets prefetching related objects are iterated as is
+    '''
+    if (hasattr(instances, 'iterator') and
+        getattr(instances, '_result_cache', None) is None and
+        not getattr(instances, '_prefetch_related_lookups', None)):
+        return instances.iterator()
+    return iter(instances)
+
 class BaseEndpoint(LinkCollectorMixin, View):
     """
     Represents an API Endpoint
@@ -286,6 +302,7 @@ class BaseEndpoint(LinkCollectorMixin, View):
         """
         :rtype: endpoint
         """
+        count_allocation('fork')
         params = dict(self._init_kwargs)
         params.update(kwargs)
         return type(self)(**params)
@@ -326,8 +343,17 @@ class BaseEndpoint(LinkCollectorMixin, View):
 
         :rtype: list of resource items
         """
-        instances = self.get_instances()
-        return [self.get_resource_item(instance) for instance in instances]
+        return list(self.iter_resource_items())
+
+    def iter_resource_items(self):
+        """
+        Yields the resource items available for this request one at a time,
+        querysets are read in chunks with `iterator`.
+
+        :rtype: iterator of resource items
+        """
+        for instance in iter_instances(self.get_instances()):
+            yield self.get_resource_item(instance)
 
     def get_form_class(self):
         return self.form_class
@@ -403,7 +429,16 @@ class BaseEndpoint(LinkCollectorMixin, View):
         return self.site.api_permission_check(api_request, endpoint)
 
     def generate_response(self, link):
-        return self.api_request.generate_response(link=link, state=self.state)
+        instrumentation = self.api_request.get_instrumentation()
+        if instrumentation is not None:
+            #summarized by the encoder so serialization queries are included
+            self.state.meta['sql'] = instrumentation
+        allocations = self.api_request.get_allocation_counter()
+        if allocations is not None:
+            self.state.meta['allocations'] = allocations
+        with timed_phase(self, 'serialize'):
+            with self.api_request.instrument('serialization'):
+                return self.api_request.generate_response(link=link, state=self.state)
 
     def generate_options_response(self, links):
         return self.api_request.generate_options_response(links=links, state=self.state)
@@ -439,12 +474,12 @@ class BaseEndpoint(LinkCollectorMixin, View):
         '''
         Returns a datatap that can serialize hypermedia items and deserialize to native instances
 
-        :param instream: A list of resource items or a primitive datatap
+        :param instream: A list or iterator of resource items or a primitive datatap
         '''
         if instream is None:
             #open for read; give primitives
             return self.get_native_datatap(**kwargs)
-        elif isinstance(instream, (list, tuple)):
+        elif isinstance(instream, (list, tuple, collections.Iterator)):
             #list of resource items; give primitives
             native_instream = self.get_native_datatap_instream_from_items(instream)
             return self.get_native_datatap(instream=native_instream, **kwargs)
@@ -456,7 +491,7 @@ class BaseEndpoint(LinkCollectorMixin, View):
         '''
         Makes an instream of item forms
         '''
-        return [item.form for item in items]
+        return (item.form for item in items)
 
     def get_native_datatap(self, instream=None, **kwargs):
         '''
@@ -465,7 +500,7 @@ class BaseEndpoint(LinkCollectorMixin, View):
         from hyperadmin.datataps import HypermediaFormDataTap
         #if there is no instream, read from the global resource items
         if instream is None:
-            instream = self.get_resource_items()
+            instream = self.get_native_datatap_instream_from_items(self.iter_resource_items())
         return HypermediaFormDataTap(instream, **kwargs)
 
 class VirtualEndpoint(BaseEndpoint):
@@ -487,8 +522,41 @@ class VirtualEndpoint(BaseEndpoint):
     def get_extra_urls(self):
         return patterns('',)
 
+    def get_url_cache(self):
+        '''
+        Returns the dictionary of the site memoizing url patterns, None disables memoizing
+        '''
+        return getattr(self._site, 'url_cache', None)
+
+    def get_url_cache_key(self):
+        return (type(self), self.get_url_name())
+
+    def get_cached_urls(self):
+        '''
+        Returns the url patterns of `get_urls`, built once until the
+        registrations of the site change
+        '''
+        url_cache = self.get_url_cache()
+        if url_cache is None:
+            return self.get_urls()
+        key = self.get_url_cache_key()
+        urlpatterns = url_cache.get(key)
+        record_cache_lookup('urls', urlpatterns is not None)
+        if urlpatterns is None:
+            urlpatterns = self.get_urls()
+            url_cache[key] = urlpatterns
+        return urlpatterns
+
+    def invalidate_urls(self):
+        '''
+        Discards the memoized url patterns of the site
+        '''
+        url_cache = self.get_url_cache()
+        if url_cache is not None:
+            url_cache.clear()
+
     def urls(self):
-        return self.get_urls(), self.app_name, None
+        return self.get_cached_urls(), self.app_name, None
     urls = property(urls)
 
     def dynamic_urls(self):
@@ -496,7 +564,7 @@ class VirtualEndpoint(BaseEndpoint):
 
     @property
     def urlpatterns(self):
-        return self.get_urls()
+        return self.get_cached_urls()
 
     def get_url_object(self):
         return url(self.get_url_suffix(), include(self.urls))
@@ -545,10 +613,79 @@ class GlobalSiteMixin(object):
 
     def urls(self):
         if self.global_endpoint:
-            return self.get_urls(), self.app_name, self.site.namespace
-        return self.get_urls(), self.app_name, None
+            return self.get_cached_urls(), self.app_name, self.site.namespace
+        return self.get_cached_urls(), self.app_name, None
     urls = property(urls)
 
+class MediaTypeRegistry(dict):
+    '''
+    Maps content types to media type classes. Classes may be registered by
+    dotted path, they are then imported on first lookup.
+    
+    With `include_builtins` the media types registered through
+    `MediaType.register_with_builtins` are mapped as well, the content types
+    registered with the registry take precedence.
+    '''
+    include_builtins = False
+    _merged_builtins = 0
+    
+    def merge_builtins(self):
+        if not self.include_builtins:
+            return
+        #nothing was registered with the builtins before the module is imported
+        common = sys.modules.get('hyperadmin.mediatypes.common')
+        if common is None or len(common.BUILTIN_MEDIA_TYPES) == self._merged_builtins:
+            return
+        for key, value in common.BUILTIN_MEDIA_TYPES.items():
+            if not super(MediaTypeRegistry, self).__contains__(key):
+                super(MediaTypeRegistry, self).__setitem__(key, value)
+        self._merged_builtins = len(common.BUILTIN_MEDIA_TYPES)
+    
+    def __getitem__(self, key):
+        self.merge_builtins()
+        value = super(MediaTypeRegistry, self).__getitem__(key)
+        if isinstance(value, basestring):
+            module_path, attr = value.rsplit('.', 1)
+            value = getattr(import_module(module_path), attr)
+            self[key] = value
+        return value
+
+    def __contains__(self, key):
+        self.merge_builtins()
+        return super(MediaTypeRegistry, self).__contains__(key)
+    
+    def __iter__(self):
+        self.merge_builtins()
+        return super(MediaTypeRegistry, self).__iter__()
+    
+    def keys(self):
+        self.merge_builtins()
+        return super(MediaTypeRegistry, self).keys()
+    
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def iteritems(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def itervalues(self):
+        for key, value in self.iteritems():
+            yield value
+
+    def values(self):
+        return list(self.itervalues())
+
+    def copy(self):
+        registry = MediaTypeRegistry(self.items())
+        registry.include_builtins = self.include_builtins
+        return registry
+
 class APIRequestBuilder(object):
     apirequest_class = DEFAULT_API_REQUEST_CLASS
     '''The api request class to use for incomming django requests'''
@@ -612,9 +749,10 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
     name_suffix = 'virtualroot'
 
     def __init__(self, **kwargs):
-        kwargs.setdefault('media_types', dict())
+        kwargs.setdefault('media_types', MediaTypeRegistry())
         kwargs.setdefault('namespace', str(id(self)))
         self.endpoints_by_urlname = dict()
+        self.url_cache = dict()
         super(RootEndpoint, self).__init__(**kwargs)
 
     @property
@@ -641,6 +779,7 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
     def fork(self, **kwargs):
         ret = super(RootEndpoint, self).fork(**kwargs)
         ret.endpoints_by_urlname.update(self.endpoints_by_urlname)
+        ret.url_cache = self.url_cache
         return ret
 
     def urls(self):
@@ -654,7 +793,13 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
         from django.core.urlresolvers import RegexURLResolver
         #get our root url
         starter = self.get_link().get_absolute_url()
-        return RegexURLResolver(r'^%s' % starter, self.urlpatterns)
+        #the resolver populates its reverse lookups once, keep it with the patterns
+        key = ('resolver', starter)
+        resolver = self.url_cache.get(key)
+        if resolver is None:
+            resolver = RegexURLResolver(r'^%s' % starter, self.urlpatterns)
+            self.url_cache[key] = resolver
+        return resolver
 
     def call_endpoint(self, url, **request_params):
         '''
@@ -683,6 +828,9 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
 
         return match.func.endpoint.fork(api_request=api_request)
 
+    def get_url_cache(self):
+        return self.url_cache
+
     def register_media_type(self, media_type, media_type_handler):
         self.media_types[media_type] = media_type_handler
 
@@ -1,3 +1,5 @@
+from copy import copy
+
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import ugettext_lazy as _
 from django.utils.encoding import force_unicode
@@ -17,6 +19,15 @@ class BaseFilter(object):
     def state(self):
         return self.resource.state
     
+    def fork(self, index):
+        '''
+        Returns a copy of the filter bound to the index
+        '''
+        new_filter = copy(self)
+        new_filter.index = index
+        new_filter.resource = index.resource
+        return new_filter
+    
     def make_link(self, **kwargs):
         return self.index.get_link(**kwargs)
     
@@ -64,6 +75,8 @@ class BaseChoicesFilter(BaseFilter):
                 classes.append('selected')
             #CONSIDER prompt may want to include group if not supported
             kwargs['prompt'] = force_unicode(choice['display'])
+            if choice.get('count', None) is not None:
+                kwargs['count'] = choice['count']
             kwargs['url'] = u'./' + choice['query_string']
             links.append(self.make_link(**kwargs))
         return links
@@ -81,6 +94,14 @@ class SimpleFilter(BaseChoicesFilter):
             raise ImproperlyConfigured(
                 "The list filter '%s' does not specify "
                 "a 'parameter_name'." % self.__class__.__name__)
+        self.used_parameters = dict()
+        self.lookup_choices = list()
+    
+    def populate_state(self):
+        params = self.state.params
+        self.used_parameters = dict()
+        if self.parameter_name in params:
+            self.used_parameters[self.parameter_name] = params[self.parameter_name]
         lookup_choices = self.lookups()
         if lookup_choices is None:
             lookup_choices = ()
@@ -1,21 +1,36 @@
 '''
 These are objects generated by the resource and are serialized by a media type.
 '''
+from hyperadmin.instrumentation import count_allocation
 from hyperadmin.links import LinkCollectorMixin, ItemLinkCollectionProvider, LinkNotAvailable
 
 
 class Item(LinkCollectorMixin):
     '''
-    Represents an instance that is bound to an endpoint
+    Represents an instance that is bound to an endpoint.
+    
+    Items are slotted and build their link collector on first access, as
+    exports construct one item per row. Subclasses declare their own
+    `__slots__` to keep instances without a `__dict__`.
     '''
+    __slots__ = ('endpoint', 'instance', 'datatap', '_links', '_form')
+    
     form_class = None
     link_collector_class = ItemLinkCollectionProvider
     
     def __init__(self, endpoint, instance, datatap=None):
+        count_allocation('Item')
         self.endpoint = endpoint
         self.instance = instance
-        self.links = self.get_link_collector()
         self.datatap = datatap
+        self._links = None
+        self._form = None
+    
+    @property
+    def links(self):
+        if self._links is None:
+            self._links = self.get_link_collector()
+        return self._links
     
     @property
     def state(self):
@@ -39,6 +54,7 @@ class Item(LinkCollectorMixin):
     def get_form(self, **form_kwargs):
         form_cls = self.get_form_class()
         kwargs = self.get_form_kwargs(**form_kwargs)
+        count_allocation('Form')
         form = form_cls(**kwargs)
         return form
     
@@ -47,7 +63,7 @@ class Item(LinkCollectorMixin):
         """
         Mediatype uses this form to serialize the result
         """
-        if not hasattr(self, '_form'):
+        if self._form is None:
             self._form = self.get_form()
         return self._form
     
@@ -64,7 +80,8 @@ class Item(LinkCollectorMixin):
         """
         Returns namespaces associated with this item
         """
-        return self.endpoint.get_item_namespaces(item=self)
+        with self.endpoint.api_request.instrument('namespaces'):
+            return self.endpoint.get_item_namespaces(item=self)
     
     def get_link(self, **kwargs):
         return self.endpoint.get_item_link(item=self, **kwargs)
@@ -1,3 +1,6 @@
+from copy import copy
+
+
 #TODO pagination should be a mixin
 class Index(object):
     """
@@ -7,6 +10,8 @@ class Index(object):
     * method for item lookup
     * url params for item lookup
     
+    Indexes are defined once per resource and are forked per api request
+    so that request state is never shared between requests.
     """
     paginator_class = None
     page_var = 'p'
@@ -20,6 +25,17 @@ class Index(object):
     def state(self):
         return self.resource.state
     
+    def fork(self, **kwargs):
+        '''
+        Returns a copy of the index and its filters with kwargs applied.
+        Does not rebuild the filter definitions.
+        '''
+        new_index = copy(self)
+        for key, value in kwargs.iteritems():
+            setattr(new_index, key, value)
+        new_index.filters = [a_filter.fork(index=new_index) for a_filter in self.filters]
+        return new_index
+    
     def register_filter(self, a_filter, **kwargs):
         kwargs['index'] = self
         self.filters.append(a_filter(**kwargs))
@@ -48,10 +64,13 @@ class Index(object):
     def get_resource_item(self, **kwargs):
         return self.resource.get_resource_item(self.get(**kwargs))
     
-    def get_filtered_index(self):
+    def get_filtered_index(self, exclude=()):
+        '''
+        Returns the index query filtered by the active filters except those in exclude
+        '''
         active_index = self.get_index_query()
         for a_filter in self.filters:
-            if a_filter.is_active():
+            if a_filter.is_active() and a_filter not in exclude:
                 new_index = a_filter.filter_index(active_index)
                 if new_index is not None:
                     active_index = new_index
@@ -109,7 +128,11 @@ class Index(object):
         return links
     
     def get_page(self):
-        paginator = self.get_paginator()
+        #reuse the paginator of the state so the count is not repeated
+        if 'paginator' in self.state:
+            paginator = self.state['paginator']
+        else:
+            paginator = self.get_paginator()
         return paginator.page(self.state.params.get(self.page_var, 1))
 
 class PrimaryIndex(Index):
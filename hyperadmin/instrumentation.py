@@ -0,0 +1,303 @@
+'''
+Opt-in instrumentation of api requests.
+
+SQL queries are attributed to the innermost active phase, ie "index", "count",
+"page", "serialization" or "namespaces". The instrumentation is attached
+to the state meta, where the encoder summarizes it, and to the
+`Server-Timing` header of the response.
+
+The dispatch pipeline of endpoints is timed through the `endpoint_phase`
+signal, `timing_collector` aggregates the timings per endpoint.
+
+Constructions of the objects churned by every request, ie forks, links, items
+and forms, are counted by the active `AllocationCounter` of the thread.
+'''
+from collections import deque
+from contextlib import contextmanager
+import math
+import os
+import socket
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connections
+from django.utils.datastructures import SortedDict
+
+from hyperadmin.signals import endpoint_phase
+
+
+@contextmanager
+def null_phase():
+    yield None
+
+class SQLInstrumentation(object):
+    """
+    Records the queries executed on every database connection between
+    `start` and `stop`, grouped by phase
+    """
+    default_phase = 'request'
+
+    def __init__(self):
+        self.phases = SortedDict()
+        self.phase_stack = list()
+        self.slowest = None
+        self.active = False
+        self._marks = dict()
+        self._use_debug_cursor = dict()
+
+    def start(self):
+        for connection in connections.all():
+            self._use_debug_cursor[connection.alias] = connection.use_debug_cursor
+            connection.use_debug_cursor = True
+            self._marks[connection.alias] = len(connection.queries)
+        self.phase_stack = [self.default_phase]
+        self.active = True
+
+    def stop(self):
+        self.flush()
+        for connection in connections.all():
+            if connection.alias in self._use_debug_cursor:
+                connection.use_debug_cursor = self._use_debug_cursor[connection.alias]
+        self.active = False
+
+    def flush(self):
+        '''
+        Attributes the queries executed since the last flush to the active phase
+        '''
+        if not self.active:
+            return
+        phase_name = self.phase_stack[-1]
+        for connection in connections.all():
+            start = self._marks.get(connection.alias, 0)
+            queries = connection.queries[start:]
+            self._marks[connection.alias] = len(connection.queries)
+            for query in queries:
+                self.record(phase_name, connection.alias, query['sql'], float(query['time']))
+
+    def record(self, phase_name, using, sql, duration):
+        if phase_name not in self.phases:
+            self.phases[phase_name] = {'queries': 0, 'time': 0.0}
+        phase = self.phases[phase_name]
+        phase['queries'] += 1
+        phase['time'] += duration
+        if self.slowest is None or duration > self.slowest['time']:
+            self.slowest = {'sql': sql,
+                            'time': duration,
+                            'phase': phase_name,
+                            'using': using,}
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Attributes the queries executed within the block to the phase
+        '''
+        self.flush()
+        self.phase_stack.append(name)
+        try:
+            yield self
+        finally:
+            self.flush()
+            self.phase_stack.pop()
+
+    @property
+    def query_count(self):
+        return sum([phase['queries'] for phase in self.phases.itervalues()])
+
+    @property
+    def query_time(self):
+        return sum([phase['time'] for phase in self.phases.itervalues()])
+
+    def get_summary(self):
+        '''
+        Returns a serializable summary, times are in milliseconds
+        '''
+        self.flush()
+        phases = SortedDict()
+        for name, phase in self.phases.iteritems():
+            phases[name] = {'queries': phase['queries'],
+                            'time': round(phase['time'] * 1000, 3),}
+        summary = {'queries': self.query_count,
+                   'time': round(self.query_time * 1000, 3),
+                   'phases': phases,
+                   'slowest': None,}
+        if self.slowest is not None:
+            summary['slowest'] = dict(self.slowest, time=round(self.slowest['time'] * 1000, 3))
+        return summary
+
+    def get_server_timing(self):
+        '''
+        Returns the value of the `Server-Timing` header
+        '''
+        self.flush()
+        entries = ['sql;desc="%s queries";dur=%.3f' % (self.query_count, self.query_time * 1000)]
+        for name, phase in self.phases.iteritems():
+            entries.append('sql-%s;desc="%s queries";dur=%.3f' % (name, phase['queries'], phase['time'] * 1000))
+        return ', '.join(entries)
+
+    def add_headers(self, response):
+        response['Server-Timing'] = self.get_server_timing()
+
+
+@contextmanager
+def timed_phase(endpoint, phase):
+    '''
+    Sends `endpoint_phase` with the duration of the enclosed block.
+    Does not time anything when the signal has no receivers.
+    '''
+    if not endpoint_phase.receivers:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start
+        endpoint_phase.send(sender='%s!%s' % (endpoint.get_url_name(), phase),
+                            endpoint=endpoint, phase=phase, duration=duration)
+
+def percentile(values, pct):
+    '''
+    Returns the nearest rank percentile of the values
+    '''
+    values = sorted(values)
+    if not values:
+        return None
+    #the rank is the smallest covering pct percent of the values
+    rank = int(math.ceil(pct * len(values) / 100.0)) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+class PhaseTimingCollector(object):
+    """
+    Receiver of `endpoint_phase` keeping the most recent durations per
+    endpoint and phase. Samples are periodically published to the cache so
+    the `hyperadmin_timings` command can report on every process sharing it.
+    """
+    max_samples = 1000
+    flush_interval = 30
+    cache_prefix = 'hyperadmin-timings'
+    expiration = 86400
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = dict()
+        self.last_flush = time.time()
+
+    def __call__(self, sender, endpoint, phase, duration, **kwargs):
+        self.record(endpoint.get_url_name(), phase, duration)
+
+    def record(self, url_name, phase, duration):
+        with self.lock:
+            key = (url_name, phase)
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.max_samples)
+            self.samples[key].append(duration)
+        if time.time() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def get_process_key(self):
+        return '%s:%s:%s' % (self.cache_prefix, socket.gethostname(), os.getpid())
+
+    def get_processes_key(self):
+        return '%s:processes' % self.cache_prefix
+
+    def get_local_samples(self):
+        with self.lock:
+            return dict([(key, list(values)) for key, values in self.samples.iteritems()])
+
+    def flush(self):
+        '''
+        Publishes the samples of this process to the cache
+        '''
+        self.last_flush = time.time()
+        process_key = self.get_process_key()
+        cache.set(process_key, self.get_local_samples(), self.expiration)
+        processes = cache.get(self.get_processes_key()) or []
+        if process_key not in processes:
+            processes.append(process_key)
+            cache.set(self.get_processes_key(), processes, self.expiration)
+
+    def get_samples(self):
+        '''
+        Returns the samples of every process that published to the cache,
+        the samples of this process are always current
+        '''
+        process_key = self.get_process_key()
+        samples = dict()
+        snapshots = [self.get_local_samples()]
+        for key in cache.get(self.get_processes_key()) or []:
+            if key != process_key:
+                snapshots.append(cache.get(key) or {})
+        for snapshot in snapshots:
+            for key, values in snapshot.iteritems():
+                samples.setdefault(key, []).extend(values)
+        return samples
+
+    def get_report(self, percentiles=(50, 90, 99)):
+        '''
+        Returns a list of dictionaries with the count, percentiles and
+        maximum in milliseconds of each endpoint phase
+        '''
+        report = list()
+        for (url_name, phase), values in sorted(self.get_samples().iteritems()):
+            entry = {'url_name': url_name,
+                     'phase': phase,
+                     'count': len(values),
+                     'max': max(values) * 1000,}
+            for pct in percentiles:
+                entry['p%s' % pct] = percentile(values, pct) * 1000
+            report.append(entry)
+        return report
+
+    def reset(self):
+        with self.lock:
+            self.samples = dict()
+        for key in cache.get(self.get_processes_key()) or []:
+            cache.delete(key)
+        cache.delete(self.get_processes_key())
+
+timing_collector = PhaseTimingCollector()
+
+
+_allocations = threading.local()
+
+def count_allocation(kind):
+    '''
+    Counts the construction of an object of the kind if a counter is active
+    '''
+    counter = getattr(_allocations, 'counter', None)
+    if counter is not None:
+        counter[kind] = counter.get(kind, 0) + 1
+
+class AllocationCounter(dict):
+    """
+    Maps the kinds of objects constructed in the thread between `start` and
+    `stop` to their count. Counts of nested counters are added to the
+    enclosing counter.
+    """
+    def __init__(self):
+        super(AllocationCounter, self).__init__()
+        self.parent = None
+
+    def start(self):
+        self.parent = getattr(_allocations, 'counter', None)
+        _allocations.counter = self
+
+    def stop(self):
+        _allocations.counter = self.parent
+        if self.parent is not None:
+            for kind, count in self.iteritems():
+                self.parent[kind] = self.parent.get(kind, 0) + count
+        self.parent = None
+
+@contextmanager
+def count_allocations():
+    '''
+    Yields an `AllocationCounter` counting the objects constructed within the block
+    '''
+    counter = AllocationCounter()
+    counter.start()
+    try:
+        yield counter
+    finally:
+        counter.stop()
@@ -3,6 +3,8 @@ from copy import copy
 from django.http import QueryDict
 from django.template.loader import render_to_string
 
+from hyperadmin.instrumentation import count_allocation
+
 
 class Link(object):
     """
@@ -28,6 +30,7 @@ class Link(object):
         :param mimetype: indicates the mimetype of the link. Useful for creating the proper embedded link tag.
         :param template_name: The name of the template to use for rendering
         """
+        count_allocation('Link')
         self._url = url
         self._method = str(method).upper() #CM
         self.endpoint = endpoint
@@ -179,6 +182,7 @@ class Link(object):
     
     def get_form(self, **form_kwargs):
         kwargs = self.get_form_kwargs(**form_kwargs)
+        count_allocation('Form')
         form = self.form_class(**kwargs)
         return form
     
@@ -350,6 +354,7 @@ class ItemLinkCollectionProvider(LinkCollectionProvider):
         return {'item':self.container}
 
 class LinkCollectorMixin(object):
+    __slots__ = ()
     link_collector_class = LinkCollectionProvider
     
     def get_link_collector_kwargs(self, **kwargs):
@@ -369,6 +374,7 @@ class LinkPrototype(object):
     * controlling link visibility
     """
     def __init__(self, endpoint, name, link_kwargs={}):
+        count_allocation('LinkPrototype')
         self.endpoint = endpoint
         self.name = name
         self.link_kwargs = link_kwargs
@@ -0,0 +1,44 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.importlib import import_module
+
+
+def get_site(path):
+    '''
+    Imports the root url conf so resources get registered and returns the
+    site found at the dotted path
+    '''
+    import_module(settings.ROOT_URLCONF)
+    module_path, attr = path.rsplit('.', 1)
+    return getattr(import_module(module_path), attr)
+
+class Command(BaseCommand):
+    args = '<app_label.model_name app_label.model_name ...>'
+    help = 'Builds or refreshes the search index of searchable model resources'
+    option_list = BaseCommand.option_list + (
+        make_option('--site', dest='site', default='hyperadmin.site',
+            help='Dotted path to the resource site, defaults to hyperadmin.site'),
+    )
+
+    def handle(self, *labels, **options):
+        site = options['site']
+        if isinstance(site, basestring):
+            site = get_site(site)
+
+        resources = dict()
+        for resource in site.registry.values():
+            if getattr(resource, 'search_fields', None) and hasattr(resource, 'get_search_backend'):
+                label = '%s.%s' % (resource.opts.app_label, resource.opts.module_name)
+                resources[label] = resource
+
+        for label in labels:
+            if label not in resources:
+                raise CommandError('No searchable resource registered for %s' % label)
+
+        for label, resource in sorted(resources.items()):
+            if labels and label not in labels:
+                continue
+            count = resource.get_search_backend().build_index()
+            self.stdout.write('Indexed %s documents for %s\n' % (count, label))
@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from hyperadmin.instrumentation import timing_collector
+
+
+class Command(BaseCommand):
+    args = '<url_name url_name ...>'
+    help = ('Reports the percentiles of the phase timings collected from endpoints. '
+            'Requires HYPERADMIN_COLLECT_TIMINGS and a cache shared by the server processes.')
+    option_list = BaseCommand.option_list + (
+        make_option('--phase', dest='phase', default=None,
+            help='Only report the given phase, ie dispatch or serialize'),
+        make_option('--reset', action='store_true', dest='reset', default=False,
+            help='Discard the collected timings after reporting'),
+    )
+
+    def handle(self, *url_names, **options):
+        report = timing_collector.get_report()
+        if url_names:
+            report = [entry for entry in report if entry['url_name'] in url_names]
+        if options['phase']:
+            report = [entry for entry in report if entry['phase'] == options['phase']]
+
+        if not report:
+            self.stdout.write('No timings collected\n')
+        else:
+            self.stdout.write('%-50s %-20s %8s %10s %10s %10s %10s\n' %
+                              ('endpoint', 'phase', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+            for entry in report:
+                self.stdout.write('%(url_name)-50s %(phase)-20s %(count)8d %(p50)10.2f %(p90)10.2f %(p99)10.2f %(max)10.2f\n' % entry)
+
+        if options['reset']:
+            timing_collector.reset()
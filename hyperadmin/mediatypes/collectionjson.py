@@ -59,6 +59,8 @@ class CollectionJSON(MediaType):
                   }
         if link.descriptors and "label" in link.descriptors:
             link_r['prompt'] = link.descriptors['label']
+        if link.cl_headers.get('count', None) is not None:
+            link_r['count'] = link.cl_headers['count']
         if link.form:
             link_r['data'] = self.convert_form(link.form)
         return link_r
@@ -72,7 +74,7 @@ class CollectionJSON(MediaType):
     def prepare_collection(self, form_link, state):
         data = self.prepare_link(form_link)
         
-        items = [self.convert_item(item) for item in state.get_resource_items()]
+        items = [self.convert_item(item) for item in state.iter_resource_items()]
         
         #the following maps hfactor to this media type
         links = list()
@@ -142,8 +144,6 @@ class CollectionJSON(MediaType):
         return {'data':form_data,
                 'files':files,}
 
-CollectionJSON.register_with_builtins()
-
 class CollectionNextJSON(CollectionJSON):
     recognized_media_types = [
         'application/vnd.Collection.next+JSON'
@@ -181,8 +181,6 @@ class CollectionNextJSON(CollectionJSON):
         #TODO link_r["enctype"]
         return link_r
 
-CollectionNextJSON.register_with_builtins()
-
 class CollectionHyperAdminJSON(CollectionNextJSON):
     recognized_media_types = [
         'application/vnd.Collection.hyperadmin+JSON'
@@ -238,6 +236,3 @@ class CollectionHyperAdminJSON(CollectionNextJSON):
         if 'display_fields' in state.meta:
             data['display_fields'] = state.meta['display_fields']
         return data
-
-CollectionHyperAdminJSON.register_with_builtins()
-
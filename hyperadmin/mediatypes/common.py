@@ -3,6 +3,7 @@ from django import http
 
 
 BUILTIN_MEDIA_TYPES = dict()
+'''Media types of other applications, served by the sites registering the builtin media types'''
 
 class MediaType(object):
     recognized_media_types = []
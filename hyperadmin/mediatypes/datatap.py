@@ -4,6 +4,7 @@ from __future__ import absolute_import
 import io
 
 from django import http
+from django.utils.encoding import force_unicode
 
 from datatap.datataps import StreamDataTap
 
@@ -15,17 +16,39 @@ class DataTap(MediaType):
         self.datatap_class = datatap_class
         super(DataTap, self).__init__(api_request, **kwargs)
 
+    def get_state_datatap(self, state):
+        '''
+        Returns the datatap of the primitives of the resource items of the
+        state, items are wrapped and serialized as the datatap is read
+        '''
+        instream = state.iter_resource_items()
+        return state.endpoint.get_datatap(instream=instream)
+
     def get_content(self, form_link, state):
-        instream = state.get_resource_items()
-        datatap = state.endpoint.get_datatap(instream=instream)
-        serialized_dt = self.datatap_class(instream=datatap)
+        serialized_dt = self.datatap_class(instream=self.get_state_datatap(state))
         payload = io.BytesIO()
         serialized_dt.send(payload)
         return payload.getvalue()
 
+    def get_content_chunks(self, form_link, state):
+        '''
+        Yields the serialized content in chunks
+        '''
+        serialized_dt = self.datatap_class(instream=self.get_state_datatap(state))
+        for chunk in serialized_dt:
+            if not isinstance(chunk, basestring):
+                chunk = force_unicode(chunk)
+            yield chunk
+
+    def is_streaming(self, link, state):
+        from hyperadmin import app_settings
+        return app_settings.STREAM_DATATAPS and hasattr(http, 'StreamingHttpResponse')
+
     def serialize(self, content_type, link, state):
         if self.detect_redirect(link):
             return self.handle_redirect(link, content_type)
+        if self.is_streaming(link, state):
+            return http.StreamingHttpResponse(self.get_content_chunks(link, state), content_type)
         content = self.get_content(link, state)
         response = http.HttpResponse(content, content_type)
         #TODO response['X-Next-Page'] = state.links(group='pagination', rel='next')[0]
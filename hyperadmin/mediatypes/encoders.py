@@ -5,6 +5,8 @@ except ImportError:
     from django.utils.encoding import force_unicode as force_text
 from django.core.serializers.json import DjangoJSONEncoder
 
+from hyperadmin.instrumentation import SQLInstrumentation
+
 
 class HyperadminJSONEncoder(DjangoJSONEncoder):
     def default(self, obj):
@@ -12,4 +14,6 @@ class HyperadminJSONEncoder(DjangoJSONEncoder):
             return list(obj)
         if isinstance(obj, Promise):
             return force_text(obj)
+        if isinstance(obj, SQLInstrumentation):
+            return obj.get_summary()
         return super(HyperadminJSONEncoder, self).default(obj)
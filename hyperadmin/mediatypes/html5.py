@@ -98,6 +98,3 @@ class Html5MediaType(MediaType):
         if response is not None:
             assert False, 'csrf failed' #TODO APIException(response) or SuspiciousOperation ....
             raise response
-
-Html5MediaType.register_with_builtins()
-
@@ -64,6 +64,3 @@ class IframeMediaType(MediaType):
         if response is not None:
             assert False, 'csrf failed' #TODO APIException(response) or SuspiciousOperation ....
             raise response
-
-IframeMediaType.register_with_builtins()
-
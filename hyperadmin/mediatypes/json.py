@@ -1,22 +1,111 @@
 from __future__ import absolute_import
 
+import codecs
+import json
+
 from django import http
 
 from datatap.datataps import JSONDataTap
+from datatap.encoders import DataTapJSONEncoder
 
 from hyperadmin.mediatypes.datatap import DataTap
 
 
+def iter_json_array(stream, read_size=65536):
+    '''
+    Yields the elements of the JSON array read from the stream, the stream
+    is read and decoded read_size bytes at a time
+    '''
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder('utf-8')()
+    buf = u''
+    position = 0
+    eof = False
+    needs_data = False
+    expecting = '['
+    while True:
+        while position < len(buf) and buf[position] in u' \t\n\r':
+            position += 1
+        if position == len(buf) or needs_data:
+            if eof:
+                raise ValueError('Unexpected end of the JSON array')
+            chunk = stream.read(read_size)
+            eof = not chunk
+            buf = buf[position:] + reader.decode(chunk, final=eof)
+            position = 0
+            needs_data = False
+            continue
+        char = buf[position]
+        if expecting == '[':
+            if char != u'[':
+                raise ValueError('Expected a JSON array')
+            expecting = 'first'
+            position += 1
+        elif char == u']' and expecting in ('first', ','):
+            return
+        elif expecting == ',':
+            if char != u',':
+                raise ValueError('Expected "," or "]" in the JSON array')
+            expecting = 'value'
+            position += 1
+        else:
+            try:
+                value, end = decoder.raw_decode(buf, position)
+            except ValueError:
+                if eof:
+                    raise
+                needs_data = True
+                continue
+            if end == len(buf) and not eof:
+                #a number at the end of the buffer may be truncated
+                needs_data = True
+                continue
+            yield value
+            position = end
+            expecting = ','
+
 class JSON(DataTap):
     recognized_media_types = [
         'application/json'
     ]
+    read_size = 65536
 
     def __init__(self, api_request, **kwargs):
         kwargs.setdefault('datatap_class', JSONDataTap)
         super(JSON, self).__init__(api_request, **kwargs)
 
-JSON.register_with_builtins()
+    def get_content_chunks(self, form_link, state):
+        if self.datatap_class is not JSONDataTap:
+            return super(JSON, self).get_content_chunks(form_link, state)
+        return self.iter_json(self.get_state_datatap(state))
+
+    def iter_json(self, datatap):
+        '''
+        Encodes the primitives of the datatap as a JSON array one at a time,
+        the JSONDataTap reads every primitive before encoding the array
+        '''
+        encoder = DataTapJSONEncoder()
+        yield u'['
+        for index, primitive in enumerate(datatap):
+            if index:
+                yield u', '
+            for chunk in encoder.iterencode(primitive):
+                yield chunk
+        yield u']'
+
+    def iter_rows(self, request):
+        '''
+        Yields the rows of the JSON array posted with the request, the body
+        is parsed as it is read
+        '''
+        return iter_json_array(request, self.read_size)
+
+    def get_import_response(self, report):
+        '''
+        Returns the report of a bulk import
+        '''
+        content = json.dumps(report, cls=DataTapJSONEncoder)
+        return http.HttpResponse(content, self.recognized_media_types[0])
 
 
 class JSONP(JSON):
@@ -34,6 +123,3 @@ class JSONP(JSON):
         content = self.get_content(link, state)
         callback = self.get_jsonp_callback()
         return http.HttpResponse(u'%s(%s)' % (callback, content), content_type)
-
-JSONP.register_with_builtins()
-
@@ -0,0 +1,354 @@
+'''
+In process metrics of api requests, rendered in the Prometheus text format.
+
+Hooks in the dispatch pipeline feed the `metrics` registry while
+`HYPERADMIN_METRICS` is enabled. When `HYPERADMIN_METRICS_DIRECTORY` is set
+every process periodically writes its samples to a file of the directory and
+the exposition sums the samples of every file, so one process can report on
+all the processes of a server.
+
+The files of exited processes are kept so their counters and histograms keep
+counting, gauges are only summed across the processes still running on this
+host. As with `prometheus_client` the directory must be wiped when the server
+is deployed or restarted.
+'''
+from bisect import bisect_left
+import errno
+import glob
+import logging
+import marshal
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from django.utils.datastructures import SortedDict
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def escape_label_value(value):
+    return unicode(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = zip(labelnames, labelvalues) + list(extra)
+    if not pairs:
+        return ''
+    return u'{%s}' % u','.join([u'%s="%s"' % (name, escape_label_value(value)) for name, value in pairs])
+
+class Metric(object):
+    """
+    Values are kept per tuple of label values
+    """
+    metric_type = None
+
+    live = False
+    '''Only the values of running processes are collected'''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = dict()
+
+    def get_key(self, labels):
+        return tuple([unicode(labels.get(name, '')) for name in self.labelnames])
+
+    def get_state(self):
+        with self.lock:
+            return dict([(key, self.copy_value(value)) for key, value in self.values.iteritems()])
+
+    def copy_value(self, value):
+        return value
+
+    def merge(self, state, other):
+        '''
+        Adds the values of the other state to the state
+        '''
+        for key, value in other.iteritems():
+            if key in state:
+                state[key] = self.merge_value(state[key], value)
+            else:
+                state[key] = self.copy_value(value)
+        return state
+
+    def merge_value(self, value, other):
+        return value + other
+
+    def reset(self):
+        with self.lock:
+            self.values = dict()
+
+    def get_samples(self, key, value):
+        '''
+        Yields (suffix, extra labels, value) for the value of the label values
+        '''
+        raise NotImplementedError
+
+    def render(self, state):
+        lines = [u'# HELP %s %s' % (self.name, self.documentation),
+                 u'# TYPE %s %s' % (self.name, self.metric_type)]
+        for key, value in sorted(state.iteritems()):
+            for suffix, extra, sample in self.get_samples(key, value):
+                lines.append(u'%s%s%s %s' % (self.name, suffix,
+                                             format_labels(self.labelnames, key, extra),
+                                             format_value(sample)))
+        return lines
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get_samples(self, key, value):
+        yield '', (), value
+
+class Gauge(Metric):
+    """
+    Summed across the running processes
+    """
+    metric_type = 'gauge'
+    live = True
+
+    def set(self, value, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get_samples(self, key, value):
+        yield '', (), value
+
+class Histogram(Metric):
+    """
+    Values are a list of the count of each bucket, the sum and the count
+    """
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, **labels):
+        key = self.get_key(labels)
+        index = bisect_left(self.buckets, amount)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            value = self.values[key]
+            value[0][index] += 1
+            value[1] += amount
+            value[2] += 1
+
+    def copy_value(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def merge_value(self, value, other):
+        return [[a + b for a, b in zip(value[0], other[0])], value[1] + other[1], value[2] + other[2]]
+
+    def get_samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), value[0]):
+            cumulative += count
+            yield '_bucket', [('le', format_value(bound))], cumulative
+        yield '_sum', (), value[1]
+        yield '_count', (), value[2]
+
+class MetricsRegistry(object):
+    """
+    Collects the metrics of this process and optionally of the other
+    processes sharing the metrics directory
+    """
+    flush_interval = 15
+    file_suffix = '.metrics'
+
+    def __init__(self, directory=None):
+        self.metrics = SortedDict()
+        self._directory = directory
+        self.last_flush = time.time()
+
+    def get_logger(self):
+        return logging.getLogger(__name__)
+
+    @property
+    def enabled(self):
+        from hyperadmin import app_settings
+        return app_settings.METRICS
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            from hyperadmin import app_settings
+            return app_settings.METRICS_DIRECTORY
+        return self._directory
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get_state(self):
+        return dict([(name, metric.get_state()) for name, metric in self.metrics.iteritems()])
+
+    def get_process_path(self):
+        return os.path.join(self.directory, '%s-%s%s' % (socket.gethostname(), os.getpid(), self.file_suffix))
+
+    def flush(self):
+        '''
+        Atomically writes the samples of this process to the metrics directory
+        '''
+        self.last_flush = time.time()
+        directory = self.directory
+        if not directory:
+            return
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                os.write(handle, marshal.dumps(self.get_state()))
+            finally:
+                os.close(handle)
+            os.rename(temp_path, self.get_process_path())
+        except (IOError, OSError):
+            self.get_logger().exception('Failed to write the metrics to %s' % directory)
+
+    def is_process_alive(self, path):
+        '''
+        Returns False if the metrics file belongs to a process of this host
+        which exited, the processes of other hosts are assumed to be running
+        '''
+        name = os.path.basename(path)[:-len(self.file_suffix)]
+        hostname, separator, pid = name.rpartition('-')
+        if hostname != socket.gethostname() or not pid.isdigit():
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except OSError as error:
+            return error.errno != errno.ESRCH
+        return True
+
+    def maybe_flush(self):
+        if self.directory and time.time() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def get_process_states(self):
+        '''
+        Returns the states written by the other processes, without the
+        live metrics of the processes which exited
+        '''
+        if not self.directory:
+            return []
+        process_path = self.get_process_path()
+        states = list()
+        for path in glob.glob(os.path.join(self.directory, '*%s' % self.file_suffix)):
+            if path == process_path:
+                continue
+            try:
+                with open(path, 'rb') as handle:
+                    state = marshal.loads(handle.read())
+            except (IOError, EOFError, ValueError, TypeError):
+                self.get_logger().warning('Skipping unreadable metrics file %s' % path)
+                continue
+            if not self.is_process_alive(path):
+                state = dict([(name, values) for name, values in state.iteritems()
+                              if not (name in self.metrics and self.metrics[name].live)])
+            states.append(state)
+        return states
+
+    def collect(self):
+        '''
+        Returns the state of every metric summed across processes
+        '''
+        collected = self.get_state()
+        for state in self.get_process_states():
+            for name, values in state.iteritems():
+                if name in self.metrics:
+                    self.metrics[name].merge(collected[name], values)
+        return collected
+
+    def render(self):
+        '''
+        Returns the metrics in the Prometheus text exposition format
+        '''
+        self.flush()
+        collected = self.collect()
+        lines = list()
+        for name, metric in self.metrics.iteritems():
+            lines.extend(metric.render(collected[name]))
+        return u'\n'.join(lines) + u'\n'
+
+    def reset(self):
+        for metric in self.metrics.itervalues():
+            metric.reset()
+        if self.directory and os.path.exists(self.get_process_path()):
+            os.remove(self.get_process_path())
+
+metrics = MetricsRegistry()
+
+requests = metrics.counter('hyperadmin_requests_total',
+    'Api requests dispatched by endpoints', ['endpoint', 'method', 'media_type', 'status'])
+request_duration = metrics.histogram('hyperadmin_request_duration_seconds',
+    'Duration of dispatching api requests', ['endpoint', 'method'])
+response_size = metrics.histogram('hyperadmin_response_size_bytes',
+    'Size of the serialized responses', ['endpoint', 'media_type'], buckets=SIZE_BUCKETS)
+internal_requests = metrics.counter('hyperadmin_internal_requests_total',
+    'Internal api calls', ['endpoint'])
+throttled_requests = metrics.counter('hyperadmin_throttled_requests_total',
+    'Api requests rejected by the throttle', ['endpoint'])
+cache_requests = metrics.counter('hyperadmin_cache_requests_total',
+    'Lookups of the caches of hyperadmin', ['cache', 'result'])
+
+
+def record_request(endpoint, api_request, response, duration):
+    '''
+    Records the count, duration and response size of a dispatched api request
+    '''
+    url_name = endpoint.get_url_name()
+    status = getattr(response, 'status_code', '')
+    media_type = ''
+    if hasattr(response, 'has_header') and response.has_header('Content-Type'):
+        media_type = response['Content-Type'].split(';', 1)[0]
+    requests.inc(endpoint=url_name, method=api_request.method, media_type=media_type, status=status)
+    request_duration.observe(duration, endpoint=url_name, method=api_request.method)
+
+    def observe_size(response):
+        response_size.observe(len(response.content), endpoint=url_name, media_type=media_type)
+
+    if hasattr(response, 'add_post_render_callback') and not response.is_rendered:
+        response.add_post_render_callback(observe_size)
+    elif hasattr(response, 'content') and not getattr(response, 'streaming', False):
+        observe_size(response)
+    metrics.maybe_flush()
+
+def record_cache_lookup(cache_name, hit):
+    if metrics.enabled:
+        cache_requests.inc(cache=cache_name, result='hit' if hit else 'miss')
@@ -9,6 +9,13 @@ import logging
 from django.utils.encoding import smart_unicode
 from django.utils.translation import ugettext_lazy as _
 
+from hyperadmin import app_settings
+from hyperadmin.instrumentation import timing_collector
+from hyperadmin.signals import endpoint_phase
+
+if app_settings.COLLECT_TIMINGS:
+    endpoint_phase.connect(timing_collector)
+
 class RelList(list):
     """
     A list subclass that allows us to use dot notation to search for elements
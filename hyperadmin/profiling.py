@@ -0,0 +1,113 @@
+'''
+Sampling profiler for api requests.
+
+A fraction of the requests dispatched by endpoints is run under cProfile,
+or every request when a latency threshold is set in which case only the
+slow requests are kept. Profiles are saved in the pstats format to a
+storage which may be exposed with `ResourceSite.install_profile_resource`,
+by default a directory of the temporary directory which is not served.
+'''
+import cProfile
+import datetime
+import logging
+import marshal
+import os
+import random
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+
+class PrivateFileSystemStorage(FileSystemStorage):
+    '''
+    A file system storage without urls, its files are not served
+    '''
+    def url(self, name):
+        raise NotImplementedError('The files of %s are not served' % self.location)
+
+
+class RequestProfiler(object):
+    """
+    Profiles a sample of requests, options default to the settings:
+
+    * HYPERADMIN_PROFILE_SAMPLE_RATE: fraction of requests to profile, ie 0.01
+    * HYPERADMIN_PROFILE_THRESHOLD: seconds after which a request is saved
+    * HYPERADMIN_PROFILE_STORAGE: dotted path to the storage class to save to,
+      profiles hold code paths and SQL so it should not serve its files
+    """
+    directory_name = 'hyperadmin-profiles'
+
+    def __init__(self, sample_rate=None, threshold=None, storage=None):
+        self._sample_rate = sample_rate
+        self._threshold = threshold
+        self._storage = storage
+
+    def get_logger(self):
+        return logging.getLogger(__name__)
+
+    @property
+    def sample_rate(self):
+        if self._sample_rate is None:
+            from hyperadmin import app_settings
+            return app_settings.PROFILE_SAMPLE_RATE
+        return self._sample_rate
+
+    @property
+    def threshold(self):
+        if self._threshold is None:
+            from hyperadmin import app_settings
+            return app_settings.PROFILE_THRESHOLD
+        return self._threshold
+
+    def get_storage(self):
+        if self._storage is None:
+            from django.core.files.storage import get_storage_class
+            from hyperadmin import app_settings
+            if app_settings.PROFILE_STORAGE:
+                self._storage = get_storage_class(app_settings.PROFILE_STORAGE)()
+            else:
+                self._storage = PrivateFileSystemStorage(
+                    location=os.path.join(tempfile.gettempdir(), self.directory_name))
+        return self._storage
+
+    storage = property(get_storage)
+
+    def is_enabled(self):
+        return bool(self.sample_rate) or self.threshold is not None
+
+    def get_profile_name(self, name, duration):
+        timestamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        return '%s-%s-%dms.prof' % (name, timestamp, duration * 1000)
+
+    def profile(self, name, func, *args, **kwargs):
+        '''
+        Calls func, profiling it if the call is sampled or a threshold is set
+        '''
+        if not self.is_enabled():
+            return func(*args, **kwargs)
+        sampled = random.random() < self.sample_rate
+        threshold = self.threshold
+        if not sampled and threshold is None:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        start = time.time()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            duration = time.time() - start
+            if sampled or duration >= threshold:
+                self.save(name, profile, duration)
+
+    def save(self, name, profile, duration):
+        '''
+        Saves the profile in the pstats format, returns the saved name
+        '''
+        try:
+            profile.create_stats()
+            content = ContentFile(marshal.dumps(profile.stats))
+            return self.get_storage().save(self.get_profile_name(name, duration), content)
+        except Exception:
+            self.get_logger().exception('Failed to save the profile of %s' % name)
+            return None
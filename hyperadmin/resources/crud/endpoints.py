@@ -104,8 +104,7 @@ class DeleteLinkPrototype(LinkPrototype):
 
     def handle_submission(self, link, submit_kwargs):
         item = self.resource.state.item
-        instance = item.instance
-        instance.delete()
+        self.resource.delete_item(item)
         return self.on_success(item)
 
     def on_success(self, item):
@@ -145,8 +144,13 @@ class ListEndpoint(IndexMixin, ResourceEndpoint):
             hasattr(mt, 'get_datatap') and
             hasattr(api_request, 'get_django_request')):
 
-            #use the request payload as an instream for our resource's datatap
             request = api_request.get_django_request()
+            if getattr(self.resource, 'bulk_import', False) and hasattr(mt, 'iter_rows'):
+                #import the rows in chunks as the payload is parsed
+                report = self.resource.import_rows(mt.iter_rows(request))
+                return mt.get_import_response(report)
+
+            #use the request payload as an instream for our resource's datatap
             instream = mt.get_datatap(request)
             datatap = self.get_datatap(instream=instream)
             datatap.commit()
@@ -167,7 +171,8 @@ class ListEndpoint(IndexMixin, ResourceEndpoint):
     def get_filter_links(self):
         links = self.create_link_collection()
         index = self.get_index()
-        links.extend(index.get_filter_links(rel='filter'))
+        with self.api_request.instrument('filter'):
+            links.extend(index.get_filter_links(rel='filter'))
         return links
 
     def get_pagination_links(self):
@@ -179,8 +184,9 @@ class ListEndpoint(IndexMixin, ResourceEndpoint):
     def get_instances(self):
         #CONSIDER view currently determines this
         index = self.get_index()
-        page = index.get_page()
-        return page.object_list
+        with self.api_request.instrument('page'):
+            page = index.get_page()
+            return list(page.object_list)
 
     def get_resource_item(self, instance, **kwargs):
         kwargs.setdefault('endpoint', self)
@@ -198,11 +204,13 @@ class ListEndpoint(IndexMixin, ResourceEndpoint):
     def get_common_state_data(self):
         data = super(ListEndpoint, self).get_common_state_data()
 
-        index = self.get_index()
-        paginator = index.get_paginator()
+        with self.api_request.instrument('index'):
+            index = self.get_index()
+            paginator = index.get_paginator()
         data['paginator'] = paginator
         data['index'] = index
-        self.state.meta['object_count'] = paginator.count
+        with self.api_request.instrument('count'):
+            self.state.meta['object_count'] = paginator.count
         self.state.meta['number_of_pages'] = paginator.num_pages
         return data
 
@@ -230,8 +238,8 @@ class CreateEndpoint(ResourceEndpoint):
         breadcrumbs.add_link('create', rel='breadcrumb', link_factor='LO')
         return breadcrumbs
 
-    def get_resource_items(self):
-        return []
+    def iter_resource_items(self):
+        return iter([])
 
 
 class DetailMixin(IndexMixin):
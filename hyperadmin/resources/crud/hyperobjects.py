@@ -22,7 +22,9 @@ class ListForm(forms.Form):
                     label = self.resource.resource_name
                 self.fields[display] = forms.CharField(label=label)
                 if self.instance:
-                    if hasattr(self.instance, display):
+                    if '__' in display.strip('_'):
+                        val = self.get_path_value(self.instance, display.split('__'))
+                    elif hasattr(self.instance, display):
                         try:
                             val = getattr(self.instance, display)
                         except:
@@ -34,7 +36,9 @@ class ListForm(forms.Form):
                             val = ''
                     else:
                         val = '' #TODO raise ImproperlyConfigured
-                    if callable(val):
+                    if hasattr(val, 'all') and callable(val.all):
+                        val = self.get_path_value(val, [])
+                    elif callable(val):
                         try:
                             val = val()
                         except:
@@ -43,8 +47,27 @@ class ListForm(forms.Form):
         else:
             pass
             #TODO support all field listing as default
+    
+    def get_path_value(self, obj, parts):
+        '''
+        Follows a lookup path, values of many valued relations are joined
+        '''
+        for index, part in enumerate(parts):
+            if obj is None:
+                return ''
+            if hasattr(obj, 'all') and callable(obj.all):
+                values = [self.get_path_value(related, parts[index:]) for related in obj.all()]
+                return u', '.join([force_unicode(value) for value in values])
+            try:
+                obj = getattr(obj, part)
+            except:
+                return ''
+        if hasattr(obj, 'all') and callable(obj.all):
+            return u', '.join([force_unicode(related) for related in obj.all()])
+        return obj
 
 class ListResourceItem(ResourceItem):
+    __slots__ = ()
     form_class = ListForm
     
     def get_form_kwargs(self, **kwargs):
@@ -1,5 +1,6 @@
 from django.core.paginator import Paginator
 
+from hyperadmin.endpoints import iter_instances
 from hyperadmin.indexes import PrimaryIndex
 from hyperadmin.resources.resources import BaseResource
 from hyperadmin.resources.crud.hyperobjects import ListResourceItem
@@ -80,6 +81,12 @@ class CRUDResource(BaseResource):
         self.emit_event(event='update', item_list=[item])
         return None
     
+    def delete_item(self, item):
+        '''
+        Deletes the instance of the item
+        '''
+        item.instance.delete()
+    
     def on_delete_success(self, item):
         '''
         Called when an item has been successfully deleted.
@@ -115,11 +122,13 @@ class CRUDResource(BaseResource):
             return []
         return self.get_primary_query()
     
-    def get_resource_items(self):
-        instances = self.get_instances()
+    def iter_resource_items(self):
         if self.state.has_view_class('change_list'):
-            return [self.get_list_resource_item(instance) for instance in instances]
-        return [self.get_resource_item(instance) for instance in instances]
+            get_resource_item = self.get_list_resource_item
+        else:
+            get_resource_item = self.get_resource_item
+        for instance in iter_instances(self.get_instances()):
+            yield get_resource_item(instance)
     
     def get_primary_query(self, **kwargs):
         return self.resource_adaptor.objects.all()
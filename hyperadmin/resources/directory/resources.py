@@ -1,18 +1,69 @@
+from copy import copy
+
 from django.conf.urls.defaults import patterns, url, include
 
+from hyperadmin.metrics import record_cache_lookup
 from hyperadmin.resources import BaseResource
 from hyperadmin.resources.directory.forms import ViewResourceForm
 from hyperadmin.resources.directory.endpoints import ListEndpoint
 
 
+class DirectoryEntry(object):
+    """
+    Snapshot of an endpoint listed by a directory. Cached listings hold
+    entries instead of endpoints, entries bound to a directory stand in for
+    the endpoints and return their outbound links bound to the directory.
+    """
+    def __init__(self, endpoint, display=()):
+        self.url_name = endpoint.get_url_name()
+        self.prompt = endpoint.get_prompt()
+        self.url = None
+        if hasattr(endpoint, 'get_absolute_url'):
+            self.url = endpoint.get_absolute_url()
+        for name in display:
+            try:
+                val = getattr(endpoint, name, '')
+                if callable(val):
+                    val = val()
+            except:
+                val = ''
+            setattr(self, name, val)
+        self.outbound_links = [link.clone(endpoint=None, form=None)
+                               for link in endpoint.links.get_outbound_links()]
+        self.directory = None
+    
+    def bind(self, directory):
+        entry = copy(self)
+        entry.directory = directory
+        return entry
+    
+    def get_prompt(self):
+        return self.prompt
+    
+    def get_absolute_url(self):
+        return self.url
+    
+    @property
+    def links(self):
+        #the mediatypes ask the links for the outbound links
+        return self
+    
+    def get_outbound_links(self):
+        return [link.clone(endpoint=self.directory) for link in self.outbound_links]
+
 #CONSIDER: is this really an EndpointDirectory?
 class ResourceDirectory(BaseResource):
     resource_class = 'resourcelisting'
     form_class = ViewResourceForm
     list_endpoint_class = ListEndpoint
+    directory_entry_class = DirectoryEntry
+    
+    listing_cache_size = 100
+    '''Number of permission fingerprints to cache the listing for, 0 disables the cache'''
     
     def __init__(self, **kwargs):
         kwargs.setdefault('resource_adaptor', dict())
+        self._listing_cache = dict()
         
         super(ResourceDirectory, self).__init__(**kwargs)
     
@@ -23,7 +74,16 @@ class ResourceDirectory(BaseResource):
     
     def get_urls(self):
         urlpatterns = super(ResourceDirectory, self).get_urls()
-        for key, resource in self.resource_adaptor.iteritems():
+        from hyperadmin.sites import LazyResource
+        #resources registered lazily are filed again as they materialize
+        for key, resource in self.resource_adaptor.items():
+            if isinstance(resource, LazyResource):
+                try:
+                    resource.materialize()
+                except Exception:
+                    #the site discards resources failing to materialize
+                    self.get_logger().exception('Could not materialize resource: %r' % resource)
+                    continue
             urlpatterns += patterns('',
                 url(r'^%s/' % key, include(resource.urls))
             )
@@ -33,13 +93,38 @@ class ResourceDirectory(BaseResource):
         if key is None:
             key = resource.get_resource_slug()
         self.resource_adaptor[key] = resource
+        self.invalidate_listing_cache()
+        self.invalidate_urls()
     
     def fork(self, **kwargs):
+        kwargs.setdefault('_listing_cache', self._listing_cache)
         ret = super(ResourceDirectory, self).fork(**kwargs)
         ret.resource_adaptor.update(self.resource_adaptor)
         return ret
     
-    def get_instances(self):
+    def invalidate_listing_cache(self):
+        '''
+        Clears the cached listings of this directory and the enclosing directories
+        '''
+        self._listing_cache.clear()
+        if isinstance(self.parent, ResourceDirectory):
+            self.parent.invalidate_listing_cache()
+    
+    def get_listing_cache_key(self):
+        '''
+        Returns the fingerprint of the permissions of the user, the listing is
+        shared by the users with the same fingerprint
+        '''
+        user = self.api_request.user
+        permissions = ()
+        if hasattr(user, 'get_all_permissions'):
+            permissions = tuple(sorted(user.get_all_permissions()))
+        return (getattr(user, 'is_active', False),
+                getattr(user, 'is_staff', False),
+                getattr(user, 'is_superuser', False),
+                permissions)
+    
+    def get_listed_endpoints(self):
         applications = self.resource_adaptor.items()
         apps = [entry[1] for entry in sorted(applications, key=lambda x: x[0])]
         all_apps = list()
@@ -47,9 +132,29 @@ class ResourceDirectory(BaseResource):
             app = self.api_request.get_endpoint(app.get_url_name())
             all_apps.append(app)
             if isinstance(app, ResourceDirectory):
-                all_apps.extend(app.get_instances())
+                all_apps.extend(app.get_listed_endpoints())
         return all_apps
     
+    def get_listing(self):
+        '''
+        Returns the entries of the listed endpoints, cached per permission fingerprint
+        '''
+        key = self.get_listing_cache_key()
+        entries = self._listing_cache.get(key)
+        record_cache_lookup('directory', entries is not None)
+        if entries is None:
+            display = getattr(self.get_item_form_class(), 'display', ())
+            entries = [self.directory_entry_class(endpoint, display) for endpoint in self.get_listed_endpoints()]
+            if len(self._listing_cache) >= self.listing_cache_size:
+                self._listing_cache.clear()
+            self._listing_cache[key] = entries
+        return entries
+    
+    def get_instances(self):
+        if not self.listing_cache_size:
+            return self.get_listed_endpoints()
+        return [entry.bind(self) for entry in self.get_listing()]
+    
     def get_item_prompt(self, item):
         return item.instance.get_prompt()
     
@@ -2,6 +2,8 @@ from hyperadmin.hyperobjects import Item
 
 
 class ResourceItem(Item):
+    __slots__ = ()
+    
     @property
     def resource(self):
         return getattr(self.endpoint, 'resource', self.endpoint)
@@ -0,0 +1 @@
+from hyperadmin.resources.metrics.resources import MetricsResource
@@ -0,0 +1,35 @@
+from django import http
+
+from hyperadmin.links import LinkPrototype
+from hyperadmin.metrics import CONTENT_TYPE
+from hyperadmin.resources.endpoints import ResourceEndpoint
+
+
+class MetricsLinkPrototype(LinkPrototype):
+    def get_link_kwargs(self, **kwargs):
+        link_kwargs = {'url': self.get_url(),
+                       'prompt': 'Metrics',
+                       'rel': 'metrics', }
+        link_kwargs.update(kwargs)
+        return super(MetricsLinkPrototype, self).get_link_kwargs(**link_kwargs)
+
+class MetricsEndpoint(ResourceEndpoint):
+    name_suffix = 'metrics'
+    url_suffix = r'^$'
+    
+    prototype_method_map = {
+        'GET': 'metrics',
+    }
+    
+    metrics_prototype = MetricsLinkPrototype
+    
+    def get_link_prototypes(self):
+        return [
+            (self.metrics_prototype, {'name':'metrics'}),
+        ]
+    
+    def get(self, api_request):
+        """
+        Responds with the text exposition format regardless of the requested media type
+        """
+        return http.HttpResponse(self.resource.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,33 @@
+from hyperadmin.resources import BaseResource
+from hyperadmin.resources.metrics.endpoints import MetricsEndpoint
+
+
+class MetricsResource(BaseResource):
+    '''
+    Exposes a metrics registry in the Prometheus text format
+    '''
+    #resource_adaptor = metrics registry
+    metrics_endpoint_class = MetricsEndpoint
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('app_name', '-metrics')
+        kwargs.setdefault('resource_name', 'metrics')
+        super(MetricsResource, self).__init__(**kwargs)
+    
+    @property
+    def registry(self):
+        return self.resource_adaptor
+    
+    def get_view_endpoints(self):
+        endpoints = super(MetricsResource, self).get_view_endpoints()
+        endpoints.append((self.metrics_endpoint_class, {}))
+        return endpoints
+    
+    def get_main_link_name(self):
+        return 'metrics'
+    
+    def get_index_endpoint(self):
+        return self.endpoints['metrics']
+    
+    def render(self):
+        return self.registry.render()
@@ -10,36 +10,189 @@ Usage::
     loader = DjangoCTModelAdminLoader(root_endpoint, admin_site)
     loader.register_resources()
 
+Resources are registered lazily, a descriptor stands in for each resource
+until it is first accessed or the URL patterns of the site are built.
+Errors in the generated resources are then raised on first access, building
+the URL patterns logs them and discards the failing resources. Inlines
+failing to initialize are logged and left out of their resource.
+
+The generated resource classes are memoized by ModelAdmin class so sites
+autoloading the same admin site share them.
+
 '''
+import time
+
 from django.conf import settings
 from django.db import models
 
 
+GENERATED_RESOURCES = dict()
+'''Generated resource classes by ModelAdmin class'''
+
+GENERATED_INLINES = dict()
+'''Generated inline resource classes by InlineModelAdmin class'''
+
+def clear_generated_resources():
+    GENERATED_RESOURCES.clear()
+    GENERATED_INLINES.clear()
+
+class GeneratedResourceMixin(object):
+    '''
+    Logs and leaves out the inlines of a generated resource that fail to
+    initialize, ie a TabularInline without a ForeignKey to the model
+    '''
+    def initialize_inlines(self):
+        self.inline_instances = list()
+        self.inline_errors = list()
+        inlines = list()
+        for inline_cls in self.inlines:
+            try:
+                self.inline_instances.append(self.create_inline(inline_cls))
+            except Exception as error:
+                self.inline_errors.append(repr(error))
+                self.get_logger().exception('Could not autoload inline: %s' % inline_cls)
+            else:
+                inlines.append(inline_cls)
+        if len(inlines) != len(self.inlines):
+            #forks are instantiated without the failing inlines
+            self.inlines = inlines
+            self._init_kwargs['inlines'] = inlines
+
+class GeneratedResourceFactory(object):
+    '''
+    Registered in place of a generated resource class, generates the class
+    on first instantiation unless it is given
+    '''
+    def __init__(self, loader, admin_model, resource_class=None):
+        self.loader = loader
+        self.admin_model = admin_model
+        self.resource_class = resource_class
+        self.__name__ = '%sResource' % type(admin_model).__name__
+    
+    def get_registration_slug(self, **kwargs):
+        from hyperadmin.resources.models import ModelResource
+        return ModelResource.get_registration_slug(**kwargs)
+    
+    def __call__(self, **kwargs):
+        start = time.time()
+        try:
+            resource_class = self.resource_class or self.loader.get_resource_class(self.admin_model)
+            kwargs.setdefault('inlines', self.loader.get_inline_classes(self.admin_model))
+            resource = resource_class(**kwargs)
+        except Exception as error:
+            self.loader.record_materialization(self.admin_model, time.time() - start, error=error)
+            raise
+        self.loader.record_materialization(self.admin_model, time.time() - start,
+                                           inline_errors=getattr(resource, 'inline_errors', None))
+        return resource
+
 class DjangoModelAdminLoader(object):
     '''
     A helper class that maps admin entries from a 
     `django.contrib.admin.site.AdminSite` object to a `RootEndpoint`
+    
+    `register_resources` fills `report` with a dictionary per admin entry
+    holding the model, the seconds spent registering it and the error if it
+    failed. Lazily registered entries are completed as their resources
+    materialize with the seconds spent generating and instantiating them,
+    the error if that failed and the errors of the inlines left out.
     '''
-    def __init__(self, root_endpoint, admin_site):
+    lazy = False
+    '''Register descriptors and instantiate the resources on first use'''
+    
+    lazy_classes = True
+    '''Generate the resource classes when the resources are instantiated'''
+    
+    memoize = True
+    '''Reuse the resource classes generated for a ModelAdmin class'''
+    
+    def __init__(self, root_endpoint, admin_site, lazy=None, lazy_classes=None, memoize=None):
         self.root_endpoint = root_endpoint
         self.admin_site = admin_site
+        if lazy is not None:
+            self.lazy = lazy
+        if lazy_classes is not None:
+            self.lazy_classes = lazy_classes
+        if memoize is not None:
+            self.memoize = memoize
+        self.report = list()
+        self.report_entries = dict()
     
     def get_logger(self):
         return self.root_endpoint.get_logger()
     
     def register_resources(self):
+        self.report = list()
+        self.report_entries = dict()
         for model, admin_model in self.admin_site._registry.iteritems():
             if not issubclass(model, models.Model):
                 continue
             if model in self.root_endpoint.registry:
                 continue
-            resource_class = self.generate_resource(admin_model)
+            entry = {'model': '%s.%s' % (model._meta.app_label, model._meta.object_name),
+                     'admin': type(admin_model).__name__,
+                     'error': None,
+                     'materialize_duration': None,
+                     'inline_errors': [],}
+            self.report_entries[admin_model] = entry
+            start = time.time()
             try:
-                app_name = model._meta.app_label
-                resource = self.root_endpoint.register(model, resource_class, app_name=app_name)
-                self.register_inlines(admin_model, resource)
+                self.register_resource(model, admin_model)
             except Exception as error:
+                entry['error'] = repr(error)
                 self.get_logger().exception('Could not autoload: %s' % admin_model)
+            entry['duration'] = time.time() - start
+            self.report.append(entry)
+        self.log_report()
+        return self.report
+    
+    def register_resource(self, model, admin_model):
+        from django.contrib.admin import ModelAdmin
+        if not isinstance(admin_model, ModelAdmin):
+            raise ValueError('Cannot generate a resource from %s' % admin_model)
+        app_name = model._meta.app_label
+        if self.lazy:
+            #the class is generated and the inlines registered when the resource is materialized
+            resource_class = None
+            if not self.lazy_classes:
+                resource_class = self.get_resource_class(admin_model)
+            factory = GeneratedResourceFactory(self, admin_model, resource_class)
+            return self.root_endpoint.register(model, factory, app_name=app_name, lazy=True)
+        resource_class = self.get_resource_class(admin_model)
+        resource = self.root_endpoint.register(model, resource_class, app_name=app_name)
+        self.register_inlines(admin_model, resource)
+        return resource
+    
+    def record_materialization(self, admin_model, duration, error=None, inline_errors=None):
+        '''
+        Completes the report entry of a lazily registered admin entry
+        '''
+        entry = self.report_entries.get(admin_model)
+        if entry is None:
+            return
+        entry['materialize_duration'] = duration
+        if error is not None:
+            entry['error'] = repr(error)
+        entry['inline_errors'] = list(inline_errors or [])
+    
+    def log_report(self):
+        failures = [entry for entry in self.report if entry['error']]
+        total = sum([entry['duration'] for entry in self.report])
+        self.get_logger().info('Autoloaded %s models in %.1fms, %s failed' %
+                               (len(self.report), total * 1000, len(failures)))
+        for entry in sorted(self.report, key=lambda x: -x['duration'])[:10]:
+            self.get_logger().debug('Autoloaded %s in %.1fms' % (entry['model'], entry['duration'] * 1000))
+    
+    def get_resource_class(self, admin_model):
+        '''
+        Returns the resource class generated for the ModelAdmin
+        '''
+        if not self.memoize:
+            return self.generate_resource(admin_model)
+        key = type(admin_model)
+        if key not in GENERATED_RESOURCES:
+            GENERATED_RESOURCES[key] = self.generate_resource(admin_model)
+        return GENERATED_RESOURCES[key]
     
     def generate_resource(self, admin_model):
         '''
@@ -73,7 +226,7 @@ class DjangoModelAdminLoader(object):
                 mfields.extend(params['fields'])
         else:
             mfields = admin_model.fields
-        class GeneratedModelResource(ModelResource):
+        class GeneratedModelResource(GeneratedResourceMixin, ModelResource):
             #raw_id_fields = ()
             fields = mfields
             exclude = admin_model.exclude
@@ -116,15 +269,36 @@ class DjangoModelAdminLoader(object):
         for inline_cls in admin_model.inlines:
             self.register_inline(admin_model, resource, inline_cls)
     
+    def get_inline_classes(self, admin_model):
+        inlines = list()
+        for inline_cls in admin_model.inlines:
+            inline_resource = self.get_inline_class(inline_cls)
+            if inline_resource:
+                inlines.append(inline_resource)
+        return inlines
+    
+    def get_inline_class(self, inline_cls):
+        '''
+        Returns the inline resource class generated for the InlineModelAdmin
+        '''
+        if not self.memoize:
+            return self.generate_inline(inline_cls)
+        if inline_cls not in GENERATED_INLINES:
+            GENERATED_INLINES[inline_cls] = self.generate_inline(inline_cls)
+        return GENERATED_INLINES[inline_cls]
+    
     def register_inline(self, admin_model, resource, inline_cls):
-        inline_resource = self.generate_inline(inline_cls)
+        inline_resource = self.get_inline_class(inline_cls)
         if inline_resource:
             try:
                 resource.register_inline(inline_resource)
-            except:
+            except Exception as error:
+                if admin_model in self.report_entries:
+                    self.report_entries[admin_model]['inline_errors'].append(repr(error))
                 self.get_logger().exception('Could not autoload inline: %s' % inline_cls)
             else:
-                resource.inlines.append(inline_resource)
+                #the generated class may be shared
+                resource.inlines = list(resource.inlines) + [inline_resource]
                 return inline_resource
     
     def generate_inline(self, inline_cls):
@@ -0,0 +1,178 @@
+'''
+Bulk import of the rows posted to the list endpoint of a model resource.
+
+Rows are read from the request as they are parsed, deserialized and
+validated in chunks of `bulk_import_chunk_size`. Each chunk is written in
+its own transaction, new rows with `bulk_create`, reindexed by the search
+backend of the resource and announced by a `create` resource event. Invalid
+rows are reported and skipped, a chunk failing in the database is retried
+row by row to report the failing rows.
+
+Rows are in the format of Django's python serializer, the `model` key is
+optional and always set to the model of the resource::
+
+    [{"fields": {"name": "editors"}}, {"pk": 3, "fields": {"name": "staff"}}]
+
+Rows with a primary key are rejected unless `upsert` is set. They are then
+saved raw like `loaddata` does, replacing every field of an existing row
+without validating its unique fields, and existing rows are announced by
+an `update` resource event.
+
+'''
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.serializers.python import Deserializer
+from django.db import DatabaseError, models, router, transaction
+
+try:
+    from django.db.transaction import atomic
+except ImportError: #Django < 1.6
+    atomic = transaction.commit_on_success
+
+
+class BulkImporter(object):
+    """
+    Imports rows into the model of a resource, see `import_rows`
+    """
+    def __init__(self, resource, chunk_size=500, upsert=False, using=None):
+        self.resource = resource
+        self.chunk_size = chunk_size
+        self.upsert = upsert
+        self.model = resource.resource_adaptor
+        self.using = using or router.db_for_write(self.model)
+
+    def get_model_label(self):
+        return '%s.%s' % (self.model._meta.app_label, self.model._meta.object_name)
+
+    def deserialize(self, row):
+        '''
+        Returns the deserialized object of a row
+        '''
+        row = dict(row)
+        if 'fields' not in row:
+            row = {'fields': row}
+        row.setdefault('pk', None)
+        row['model'] = self.get_model_label()
+        return next(Deserializer([row], using=self.using))
+
+    def validate(self, deserialized):
+        if deserialized.object.pk is not None and not self.upsert:
+            raise ValidationError('Rows with a primary key are not imported unless upsert is enabled')
+        deserialized.object.clean_fields()
+        deserialized.object.clean()
+
+    def get_error_messages(self, error):
+        if hasattr(error, 'message_dict'):
+            return error.message_dict
+        messages = getattr(error, 'messages', None) or [unicode(error)]
+        return {NON_FIELD_ERRORS: messages}
+
+    def import_rows(self, rows):
+        '''
+        Imports the rows and returns a report of the number of imported rows,
+        the number of existing rows updated, the number of chunks written and
+        the errors of the rejected rows
+        '''
+        report = {'imported': 0,
+                  'updated': 0,
+                  'chunks': 0,
+                  'errors': [],}
+        chunk = list()
+        index = -1
+        try:
+            for index, row in enumerate(rows):
+                try:
+                    deserialized = self.deserialize(row)
+                    self.validate(deserialized)
+                except Exception as error:
+                    report['errors'].append({'row': index,
+                                             'errors': self.get_error_messages(error),})
+                    continue
+                chunk.append((index, deserialized))
+                if len(chunk) >= self.chunk_size:
+                    self.write_chunk(chunk, report)
+                    chunk = list()
+        except ValueError as error:
+            #the payload is malformed, the rows read so far are imported
+            report['errors'].append({'row': index + 1,
+                                     'errors': self.get_error_messages(error),})
+        if chunk:
+            self.write_chunk(chunk, report)
+        return report
+
+    def write_chunk(self, chunk, report):
+        new_objects = [deserialized.object for index, deserialized in chunk
+                       if deserialized.object.pk is None]
+        try:
+            with atomic(using=self.using):
+                created, updated = self.save([deserialized for index, deserialized in chunk])
+        except DatabaseError:
+            #the primary keys given by the rolled back inserts are stale
+            for instance in new_objects:
+                instance.pk = None
+            created, updated = list(), list()
+            for index, deserialized in chunk:
+                try:
+                    with atomic(using=self.using):
+                        row_created, row_updated = self.save([deserialized])
+                except DatabaseError as error:
+                    report['errors'].append({'row': index,
+                                             'errors': self.get_error_messages(error),})
+                else:
+                    created.extend(row_created)
+                    updated.extend(row_updated)
+        report['imported'] += len(created)
+        report['updated'] += len(updated)
+        report['chunks'] += 1
+        if created or updated:
+            self.resource.get_search_backend().update_index(created + updated)
+        for event, instances in (('create', created), ('update', updated)):
+            if instances:
+                items = [self.resource.get_resource_item(instance) for instance in instances]
+                self.resource.emit_event(event, item_list=items)
+
+    def save(self, objects):
+        '''
+        Saves the deserialized objects and returns the created and the
+        updated instances. New rows without many to many data are inserted
+        with `bulk_create`, rows with a primary key are saved raw.
+        '''
+        inserts = list()
+        existing = set()
+        pks = [deserialized.object.pk for deserialized in objects
+               if deserialized.object.pk is not None]
+        if pks:
+            existing = set(self.model._default_manager.db_manager(self.using)
+                           .filter(pk__in=pks).values_list('pk', flat=True))
+        created, updated = list(), list()
+        for deserialized in objects:
+            if deserialized.object.pk in existing:
+                updated.append(deserialized.object)
+            else:
+                created.append(deserialized.object)
+            if (deserialized.object.pk is None and not deserialized.m2m_data and
+                hasattr(self.model._default_manager, 'bulk_create')):
+                inserts.append(deserialized.object)
+            else:
+                deserialized.save(using=self.using)
+        if len(inserts) == 1:
+            inserts[0].save(using=self.using)
+        elif inserts:
+            self.bulk_create(inserts)
+        return created, updated
+
+    def bulk_create(self, instances):
+        '''
+        Inserts the instances with `bulk_create`. Databases not returning
+        the primary keys of the inserted rows have them read back, in order
+        and within the transaction of the chunk, for automatic primary keys.
+        '''
+        manager = self.model._default_manager.db_manager(self.using)
+        auto_pk = isinstance(self.model._meta.pk, models.AutoField)
+        if auto_pk:
+            last_pk = manager.aggregate(last_pk=models.Max('pk'))['last_pk'] or 0
+        manager.bulk_create(instances)
+        if auto_pk and instances[-1].pk is None:
+            pks = list(manager.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+            if len(pks) == len(instances):
+                for instance, pk in zip(instances, pks):
+                    instance.pk = pk
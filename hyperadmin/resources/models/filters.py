@@ -1,8 +1,13 @@
 import datetime
-import operator
+import time
 
-from django.db import models
+from django.core.cache import cache
+from django.db import connections, models
+from django.db.models import Count
+from django.utils import formats
+from django.utils.dates import MONTHS
 from django.utils.encoding import smart_unicode
+from django.utils.text import capfirst
 from django.utils.translation import ugettext_lazy as _
 try:
     from django.utils import timezone
@@ -16,15 +21,55 @@ except ImportError:
     from hyperadmin.resources.models.util import lookup_needs_distinct, prepare_lookup_value
 
 from hyperadmin.filters import BaseChoicesFilter, BaseFilter
+from hyperadmin.metrics import record_cache_lookup
+from hyperadmin.resources.models.search import DefaultSearchBackend
+from hyperadmin.signals import resource_event
 
 SEARCH_VAR = 'q'
+CHOICES_CACHE_PREFIX = 'hyperadmin-filter-choices'
+CHOICES_VERSION_EXPIRATION = 604800 #one week
+
+def get_choices_version_key(model):
+    return '%s:version:%s' % (CHOICES_CACHE_PREFIX, model._meta)
+
+def get_choices_version(model):
+    '''
+    Returns the active version of the cached choices derived from the model
+    '''
+    key = get_choices_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        #seed with the time so an evicted version never revives stale entries
+        cache.add(key, int(time.time()), CHOICES_VERSION_EXPIRATION)
+        version = cache.get(key, 0)
+    return version
+
+def invalidate_choices(model):
+    '''
+    Expires all cached filter choices derived from the model
+    '''
+    key = get_choices_version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time()), CHOICES_VERSION_EXPIRATION)
+
+def invalidate_choices_on_resource_event(sender, resource, event, item_list, **kwargs):
+    model = getattr(resource, 'resource_adaptor', None)
+    if isinstance(model, type) and issubclass(model, models.Model):
+        invalidate_choices(model)
+
+resource_event.connect(invalidate_choices_on_resource_event)
 
 class SearchFilter(BaseFilter):
     title = _('Search')
     
-    def __init__(self, index, search_fields):
+    def __init__(self, index, search_fields, search_backend=None):
         super(SearchFilter, self).__init__(index)
         self.search_fields = search_fields
+        if search_backend is None:
+            search_backend = DefaultSearchBackend(self.resource, search_fields)
+        self.search_backend = search_backend
     
     def value(self):
         return self.state.params.get(SEARCH_VAR, '')
@@ -33,34 +78,7 @@ class SearchFilter(BaseFilter):
         return bool(self.value())
     
     def filter_index(self, active_index):
-        use_distinct = False
-        query = self.value()
-        
-        def construct_search(field_name):
-            if field_name.startswith('^'):
-                return "%s__istartswith" % field_name[1:]
-            elif field_name.startswith('='):
-                return "%s__iexact" % field_name[1:]
-            elif field_name.startswith('@'):
-                return "%s__search" % field_name[1:]
-            else:
-                return "%s__icontains" % field_name
-
-        if self.search_fields and query:
-            orm_lookups = [construct_search(str(search_field))
-                           for search_field in self.search_fields]
-            for bit in query.split():
-                or_queries = [models.Q(**{orm_lookup: bit})
-                              for orm_lookup in orm_lookups]
-                active_index = active_index.filter(reduce(operator.or_, or_queries))
-            if not use_distinct:
-                for search_spec in orm_lookups:
-                    if lookup_needs_distinct(self.resource.opts, search_spec):
-                        use_distinct = True
-                        break
-        if use_distinct:
-            return active_index.distinct()
-        return active_index
+        return self.search_backend.search(active_index, self.value())
 
 class FieldFilter(BaseChoicesFilter):
     _field_list_filters = []
@@ -71,7 +89,50 @@ class FieldFilter(BaseChoicesFilter):
         self.field_path = field_path
         self.title = getattr(field, 'verbose_name', field_path)
         self.used_parameters = dict()
+        self.use_distinct = False
         super(FieldFilter, self).__init__(index)
+    
+    def fork(self, index):
+        new_filter = super(FieldFilter, self).fork(index)
+        new_filter.used_parameters = dict()
+        new_filter.__dict__.pop('_facet_counts', None)
+        return new_filter
+    
+    def get_facet_counts(self):
+        '''
+        Returns a dictionary mapping the values of the field to the number of
+        rows matching the other active filters, computed in a single query
+        '''
+        active_index = self.index.get_filtered_index(exclude=[self]).order_by()
+        rows = active_index.values(self.field_path).annotate(
+            facet_count=Count('pk', distinct=self.use_distinct))
+        return dict([(row[self.field_path], row['facet_count']) for row in rows])
+    
+    @property
+    def facet_counts(self):
+        '''
+        The facet counts of the request, None unless the resource enables `list_filter_facets`
+        '''
+        if not getattr(self.resource, 'list_filter_facets', False):
+            return None
+        if not hasattr(self, '_facet_counts'):
+            self._facet_counts = self.get_facet_counts()
+        return self._facet_counts
+    
+    def get_choice_count(self, *values):
+        '''
+        Returns the number of rows the choice matching the field values would
+        return or None if unknown. Without values the count of all choices is returned.
+        '''
+        counts = self.facet_counts
+        if counts is None:
+            return None
+        if not values:
+            if self.use_distinct:
+                #rows with several values are counted once per value
+                return None
+            return sum(counts.values())
+        return sum([counts.get(value, 0) for value in values])
 
     def is_active(self):
         return bool(self.used_parameters)
@@ -85,7 +146,10 @@ class FieldFilter(BaseChoicesFilter):
                 self.used_parameters[p] = prepare_lookup_value(p, value)
 
     def filter_index(self, active_index):
-        return active_index.filter(**self.used_parameters)
+        active_index = active_index.filter(**self.used_parameters)
+        if self.use_distinct:
+            return active_index.distinct()
+        return active_index
     
     @classmethod
     def register(cls, test, list_filter_class, take_priority=False):
@@ -107,13 +171,66 @@ class FieldFilter(BaseChoicesFilter):
             return list_filter_class(field, field_path, index)
 
 
-class RelatedFieldFilter(FieldFilter):
+class CachedChoicesMixin(object):
+    '''
+    Lazily computes the lookup choices of a filter and caches them across
+    requests. Cached choices expire after the resource's
+    `list_filter_cache_timeout` or when a resource emits an event for the
+    model providing the choices.
+    '''
+    def fork(self, index):
+        new_filter = super(CachedChoicesMixin, self).fork(index)
+        new_filter.__dict__.pop('_lookup_choices', None)
+        return new_filter
+    
+    def get_choices_model(self):
+        '''
+        Returns the model whose rows make up the choices
+        '''
+        raise NotImplementedError
+    
+    def get_lookup_choices(self):
+        '''
+        Returns a list of choices, hits the database
+        '''
+        raise NotImplementedError
+    
+    def get_choices_cache_timeout(self):
+        return getattr(self.resource, 'list_filter_cache_timeout', 0)
+    
+    def get_choices_cache_key(self):
+        return '%s:%s:%s:%s:%s' % (CHOICES_CACHE_PREFIX,
+                                   self.resource.opts,
+                                   self.field_path or self.field.name,
+                                   type(self).__name__,
+                                   get_choices_version(self.get_choices_model()))
+    
+    def get_cached_lookup_choices(self):
+        timeout = self.get_choices_cache_timeout()
+        if not timeout:
+            return list(self.get_lookup_choices())
+        key = self.get_choices_cache_key()
+        choices = cache.get(key)
+        record_cache_lookup('filter_choices', choices is not None)
+        if choices is None:
+            choices = list(self.get_lookup_choices())
+            cache.set(key, choices, timeout)
+        return choices
+    
+    @property
+    def lookup_choices(self):
+        if not hasattr(self, '_lookup_choices'):
+            self._lookup_choices = self.get_cached_lookup_choices()
+        return self._lookup_choices
+
+
+class RelatedFieldFilter(CachedChoicesMixin, FieldFilter):
     def __init__(self, field, field_path, index):
         other_model = get_model_from_relation(field)
         rel_name = other_model._meta.pk.name
+        self.other_model = other_model
         self.lookup_kwarg = '%s__%s__exact' % (field_path, rel_name)
         self.lookup_kwarg_isnull = '%s__isnull' % field_path
-        self.lookup_choices = field.get_choices(include_blank=False)
         super(RelatedFieldFilter, self).__init__(
             field, field_path, index)
         if hasattr(field, 'verbose_name'):
@@ -121,6 +238,12 @@ class RelatedFieldFilter(FieldFilter):
         else:
             self.lookup_title = other_model._meta.verbose_name
         self.title = self.lookup_title
+    
+    def get_choices_model(self):
+        return self.other_model
+    
+    def get_lookup_choices(self):
+        return self.field.get_choices(include_blank=False)
 
     def has_output(self):
         if (isinstance(self.field, models.related.RelatedObject)
@@ -131,10 +254,10 @@ class RelatedFieldFilter(FieldFilter):
             extra = 0
         return len(self.lookup_choices) + extra > 1
     
-    def is_active(self):
+    def get_links(self, **link_kwargs):
         if not self.has_output():
-            return False
-        return super(RelatedFieldFilter, self).is_active()
+            return []
+        return super(RelatedFieldFilter, self).get_links(**link_kwargs)
 
     def expected_parameters(self):
         return [self.lookup_kwarg, self.lookup_kwarg_isnull]
@@ -147,6 +270,7 @@ class RelatedFieldFilter(FieldFilter):
             'query_string': self.state.get_query_string({},
                 [self.lookup_kwarg, self.lookup_kwarg_isnull]),
             'display': _('All'),
+            'count': self.get_choice_count(),
         }
         for pk_val, val in self.lookup_choices:
             yield {
@@ -155,6 +279,7 @@ class RelatedFieldFilter(FieldFilter):
                     self.lookup_kwarg: pk_val,
                 }, [self.lookup_kwarg_isnull]),
                 'display': val,
+                'count': self.get_choice_count(pk_val),
             }
         if (isinstance(self.field, models.related.RelatedObject)
                 and self.field.field.null or hasattr(self.field, 'rel')
@@ -165,6 +290,7 @@ class RelatedFieldFilter(FieldFilter):
                     self.lookup_kwarg_isnull: 'True',
                 }, [self.lookup_kwarg]),
                 'display': EMPTY_CHANGELIST_VALUE,
+                'count': self.get_choice_count(None),
             }
 
 FieldFilter.register(lambda f: (
@@ -183,16 +309,17 @@ class BooleanFieldFilter(FieldFilter):
 
     def choices(self):
         lookup_val, lookup_val2 = self.values()
-        for lookup, title in (
-                (None, _('All')),
-                ('1', _('Yes')),
-                ('0', _('No'))):
+        for lookup, title, count in (
+                (None, _('All'), self.get_choice_count()),
+                ('1', _('Yes'), self.get_choice_count(True)),
+                ('0', _('No'), self.get_choice_count(False))):
             yield {
                 'selected': lookup_val == lookup and not lookup_val2,
                 'query_string': self.state.get_query_string({
                         self.lookup_kwarg: lookup,
                     }, [self.lookup_kwarg2]),
                 'display': title,
+                'count': count,
             }
         if isinstance(self.field, models.NullBooleanField):
             yield {
@@ -201,6 +328,7 @@ class BooleanFieldFilter(FieldFilter):
                         self.lookup_kwarg2: 'True',
                     }, [self.lookup_kwarg]),
                 'display': _('Unknown'),
+                'count': self.get_choice_count(None),
             }
 
 FieldFilter.register(lambda f: isinstance(f,
@@ -221,7 +349,8 @@ class ChoicesFieldFilter(FieldFilter):
         yield {
             'selected': lookup_val is None,
             'query_string': self.state.get_query_string({}, [self.lookup_kwarg]),
-            'display': _('All')
+            'display': _('All'),
+            'count': self.get_choice_count(),
         }
         for lookup, title in self.field.flatchoices:
             yield {
@@ -229,6 +358,7 @@ class ChoicesFieldFilter(FieldFilter):
                 'query_string': self.state.get_query_string({
                                     self.lookup_kwarg: lookup}),
                 'display': title,
+                'count': self.get_choice_count(lookup),
             }
 
 FieldFilter.register(lambda f: bool(f.choices), ChoicesFieldFilter)
@@ -236,6 +366,15 @@ FieldFilter.register(lambda f: bool(f.choices), ChoicesFieldFilter)
 
 class DateFieldFilter(FieldFilter):
     def __init__(self, field, field_path, index):
+        self.lookup_kwarg_since = '%s__gte' % field_path
+        self.lookup_kwarg_until = '%s__lt' % field_path
+        self.field_generic = '%s__' % field_path
+        self.date_params = dict()
+        super(DateFieldFilter, self).__init__(
+            field, field_path, index)
+    
+    def get_date_links(self):
+        #computed per request as the filter definition outlives the day
         now = datetime.datetime.now()
         # When time zone support is enabled, convert "now" to the user's time
         # zone so Django's definition of "Today" matches what the user expects.
@@ -246,15 +385,13 @@ class DateFieldFilter(FieldFilter):
         #        # available for pytz time zones
         #        now = current_tz.normalize(now)
 
-        if isinstance(field, models.DateTimeField):
+        if isinstance(self.field, models.DateTimeField):
             today = now.replace(hour=0, minute=0, second=0, microsecond=0)
         else:       # field is a models.DateField
             today = now.date()
         tomorrow = today + datetime.timedelta(days=1)
-    
-        self.lookup_kwarg_since = '%s__gte' % field_path
-        self.lookup_kwarg_until = '%s__lt' % field_path
-        self.links = (
+        
+        return (
             (_('Any date'), {}),
             (_('Today'), {
                 self.lookup_kwarg_since: str(today),
@@ -273,12 +410,9 @@ class DateFieldFilter(FieldFilter):
                 self.lookup_kwarg_until: str(tomorrow),
             }),
         )
-        super(DateFieldFilter, self).__init__(
-            field, field_path, index)
     
     def populate_state(self):
         params = self.state.params
-        self.field_generic = '%s__' % self.field_path
         self.date_params = dict([(k, v) for k, v in params.items()
                                  if k.startswith(self.field_generic)])
         self.used_parameters = self.date_params
@@ -287,7 +421,7 @@ class DateFieldFilter(FieldFilter):
         return [self.lookup_kwarg_since, self.lookup_kwarg_until]
 
     def choices(self):
-        for title, param_dict in self.links:
+        for title, param_dict in self.get_date_links():
             yield {
                 'selected': self.date_params == param_dict,
                 'query_string': self.state.get_query_string(
@@ -299,31 +433,121 @@ FieldFilter.register(
     lambda f: isinstance(f, models.DateField), DateFieldFilter)
 
 
+class DateHierarchyFilter(FieldFilter):
+    '''
+    Drills down a date field by year, month and day. Each level is offered
+    as links annotated with the number of rows falling on the date, counted
+    with one aggregate query per level.
+    '''
+    levels = ('year', 'month', 'day')
+    
+    def __init__(self, field, field_path, index):
+        self.lookup_kwargs = ['%s__%s' % (field_path, level) for level in self.levels]
+        super(DateHierarchyFilter, self).__init__(field, field_path, index)
+    
+    def expected_parameters(self):
+        return self.lookup_kwargs
+    
+    def populate_state(self):
+        #only honor a contiguous drill down of integers, ie year then month
+        params = self.state.params
+        self.used_parameters = dict()
+        for lookup_kwarg in self.lookup_kwargs:
+            value = u'%s' % params.get(lookup_kwarg, '')
+            if not value.isdigit():
+                break
+            self.used_parameters[lookup_kwarg] = int(value)
+    
+    def get_active_values(self):
+        return [self.used_parameters[lookup_kwarg] for lookup_kwarg in self.lookup_kwargs
+                if lookup_kwarg in self.used_parameters]
+    
+    def get_bucket_level(self):
+        '''
+        Returns the level to drill down into or None if fully drilled down
+        '''
+        active_values = self.get_active_values()
+        if len(active_values) < len(self.levels):
+            return self.levels[len(active_values)]
+        return None
+    
+    def get_bucket_counts(self, level):
+        '''
+        Returns a list of (value, count) tuples of the level within the filtered index
+        '''
+        #selecting the field path joins its table, the bucket is extracted
+        #from the column of the joined alias
+        active_index = self.index.get_filtered_index().order_by().values_list(self.field_path)
+        connection = connections[active_index.db]
+        qn = connection.ops.quote_name
+        select = active_index.query.select[0]
+        alias, column_name = getattr(select, 'col', select)
+        column = '%s.%s' % (qn(alias), qn(column_name))
+        rows = (active_index
+                .extra(select={'date_bucket': connection.ops.date_extract_sql(level, column)})
+                .values('date_bucket')
+                .annotate(bucket_count=Count('pk', distinct=self.use_distinct))
+                .order_by('date_bucket'))
+        return [(int(row['date_bucket']), row['bucket_count'])
+                for row in rows if row['date_bucket'] is not None]
+    
+    def get_bucket_display(self, values):
+        if len(values) == 1:
+            return unicode(values[0])
+        if len(values) == 2:
+            return u'%s %s' % (capfirst(MONTHS[values[1]]), values[0])
+        return formats.date_format(datetime.date(*values))
+    
+    def choices(self):
+        active_values = self.get_active_values()
+        if active_values:
+            parent_values = active_values[:-1]
+            yield {
+                'selected': False,
+                'query_string': self.state.get_query_string({},
+                    self.lookup_kwargs[len(parent_values):]),
+                'display': parent_values and self.get_bucket_display(parent_values) or _('All dates'),
+            }
+        level = self.get_bucket_level()
+        if level is None:
+            return
+        lookup_kwarg = self.lookup_kwargs[len(active_values)]
+        for value, count in self.get_bucket_counts(level):
+            yield {
+                'selected': False,
+                'query_string': self.state.get_query_string({lookup_kwarg: value}),
+                'display': self.get_bucket_display(active_values + [value]),
+                'count': count,
+            }
+
 # This should be registered last, because it's a last resort. For example,
 # if a field is eligible to use the BooleanFieldFilter, that'd be much
 # more appropriate, and the AllValuesFieldFilter won't get used for it.
-class AllValuesFieldFilter(FieldFilter):
+class AllValuesFieldFilter(CachedChoicesMixin, FieldFilter):
     def __init__(self, field, field_path, index):
         super(AllValuesFieldFilter, self).__init__(
             field, field_path, index)
         
-        model = self.resource.model
-        
         self.lookup_kwarg = field_path
         self.lookup_kwarg_isnull = '%s__isnull' % field_path
-        parent_model, reverse_path = reverse_field_path(model, field_path)
-        queryset = parent_model._default_manager.all()
+        self.parent_model, self.reverse_path = reverse_field_path(self.resource.model, field_path)
+    
+    def get_choices_model(self):
+        return self.parent_model
+    
+    def get_lookup_choices(self):
+        model = self.resource.model
+        queryset = self.parent_model._default_manager.all()
         # optional feature: limit choices base on existing relationships
         # queryset = queryset.complex_filter(
-        #    {'%s__isnull' % reverse_path: False})
-        limit_choices_to = get_limit_choices_to_from_path(model, field_path)
+        #    {'%s__isnull' % self.reverse_path: False})
+        limit_choices_to = get_limit_choices_to_from_path(model, self.field_path)
         queryset = queryset.filter(limit_choices_to)
 
-        self.lookup_choices = (queryset
-                               .distinct()
-                               .order_by(field.name)
-                               .values_list(field.name, flat=True))
-        
+        return (queryset
+                .distinct()
+                .order_by(self.field.name)
+                .values_list(self.field.name, flat=True))
 
     def expected_parameters(self):
         return [self.lookup_kwarg, self.lookup_kwarg_isnull]
@@ -337,12 +561,14 @@ class AllValuesFieldFilter(FieldFilter):
             'query_string': self.state.get_query_string({},
                 [self.lookup_kwarg, self.lookup_kwarg_isnull]),
             'display': _('All'),
+            'count': self.get_choice_count(),
         }
         include_none = False
         for val in self.lookup_choices:
             if val is None:
                 include_none = True
                 continue
+            count = self.get_choice_count(val)
             val = smart_unicode(val)
             yield {
                 'selected': lookup_val == val,
@@ -350,6 +576,7 @@ class AllValuesFieldFilter(FieldFilter):
                     self.lookup_kwarg: val,
                 }, [self.lookup_kwarg_isnull]),
                 'display': val,
+                'count': count,
             }
         if include_none:
             yield {
@@ -358,6 +585,7 @@ class AllValuesFieldFilter(FieldFilter):
                     self.lookup_kwarg_isnull: 'True',
                 }, [self.lookup_kwarg]),
                 'display': EMPTY_CHANGELIST_VALUE,
+                'count': self.get_choice_count(None),
             }
 
 FieldFilter.register(lambda f: True, AllValuesFieldFilter)
@@ -1,7 +1,23 @@
+import logging
+
+from django.utils.datastructures import SortedDict
+from django.utils.translation import ugettext_lazy as _
+
 from hyperadmin.indexes import Index
 
 
 class ModelIndex(Index):
+    ordering_var = 'o'
+    
+    def __init__(self, name, resource, sortable_fields=None):
+        super(ModelIndex, self).__init__(name, resource)
+        #maps the allowed ordering fields to their prompts
+        self.sortable_fields = SortedDict(sortable_fields or [])
+        #shared by the forks of the index definition
+        self._indexed_orderings = dict()
+        self._ordering_fields = dict()
+        self._reported_orderings = set()
+    
     @property
     def model(self):
         return self.resource.model
@@ -25,29 +41,126 @@ class ModelIndex(Index):
     def get_paginator_kwargs(self):
         return {'per_page':self.resource.list_per_page,}
     
-    def get_links(self):
-        links = super(ModelIndex, self).get_links()
-        #links += self.getchangelist_sort_links()
-        return links
+    def get_ordering_field(self, field_name):
+        '''
+        Returns the model field a sortable field name resolves to
+        '''
+        if field_name == 'pk':
+            return self.get_primary_field()
+        if field_name not in self._ordering_fields:
+            from django.contrib.admin.util import get_fields_from_path
+            self._ordering_fields[field_name] = get_fields_from_path(self.model, field_name)[-1]
+        return self._ordering_fields[field_name]
+    
+    def is_ordering_indexed(self, field_name):
+        '''
+        Returns True if ordering by the field is backed by a database index
+        '''
+        if field_name not in self._indexed_orderings:
+            field = self.get_ordering_field(field_name)
+            indexed = field.primary_key or field.unique or field.db_index
+            if not indexed:
+                field_opts = field.model._meta
+                for together in (list(field_opts.unique_together) +
+                                 list(getattr(field_opts, 'index_together', []))):
+                    if together and together[0] == field.name:
+                        indexed = True
+                        break
+            self._indexed_orderings[field_name] = indexed
+        return self._indexed_orderings[field_name]
     
-    def get_changelist_sort_links(self):
+    def on_unindexed_ordering(self, field_names):
+        '''
+        Called when the active ordering sorts on fields without a database
+        index. Logs a warning once per set of fields, override to instrument
+        slow orderings.
+        '''
+        key = tuple(field_names)
+        if key in self._reported_orderings:
+            return
+        self._reported_orderings.add(key)
+        logging.getLogger(__name__).warning(
+            'Ordering %s on %s is not backed by a database index: %s' %
+            (self.name, self.model._meta, ', '.join(field_names)))
+    
+    def get_requested_ordering(self):
+        '''
+        Returns the list of (field name, descending) pairs requested by the
+        ordering parameter, ignoring fields not in `sortable_fields`
+        '''
+        ordering = list()
+        seen = set()
+        value = self.state.params.get(self.ordering_var, '')
+        for part in value.split(','):
+            field_name = part.lstrip('-')
+            if field_name in self.sortable_fields and field_name not in seen:
+                seen.add(field_name)
+                ordering.append((field_name, part.startswith('-')))
+        return ordering
+    
+    def get_ordering(self):
+        '''
+        Returns the order_by arguments for the requested ordering, defaults
+        to the ordering of the resource
+        '''
+        requested = self.get_requested_ordering()
+        if not requested:
+            return list(self.resource.get_ordering())
+        unindexed = [field_name for field_name, descending in requested
+                     if not self.is_ordering_indexed(field_name)]
+        if unindexed:
+            self.on_unindexed_ordering(unindexed)
+        ordering = [('-%s' if descending else '%s') % field_name for field_name, descending in requested]
+        #ensure a deterministic ordering so pages do not overlap
+        if not [field_name for field_name, descending in requested
+                if field_name == 'pk' or self.get_ordering_field(field_name).primary_key]:
+            ordering.append('-pk')
+        return ordering
+    
+    def get_filtered_index(self, exclude=()):
+        active_index = super(ModelIndex, self).get_filtered_index(exclude)
+        ordering = self.get_ordering()
+        if ordering:
+            if not self.get_requested_ordering():
+                #the default ordering breaks the ties of a relevance ordering
+                ordering = list(active_index.query.extra_order_by) + ordering
+            active_index = active_index.order_by(*ordering)
+        return active_index
+    
+    def get_sort_links(self, **link_kwargs):
+        '''
+        Returns a link per sortable field. Following a link makes the field the
+        primary ordering, toggling its direction if it already is.
+        '''
         links = list()
-        changelist = self.state['changelist']
-        from django.contrib.admin.templatetags.admin_list import result_headers
-        for header in result_headers(changelist):
-            if header.get("sortable", False):
-                prompt = unicode(header["text"])
-                classes = ["sortby"]
-                if "url" in header:
-                    links.append(self.get_link(url=header["url"], prompt=prompt, classes=classes+["primary"], rel="sortby"))
-                else:
-                    if header["ascending"]:
-                        classes.append("ascending")
-                    if header["sorted"]:
-                        classes.append("sorted")
-                    links.append(self.get_link(url=header["url_primary"], prompt=prompt, classes=classes+["primary"], rel="sortby"))
-                    links.append(self.get_link(url=header["url_remove"], prompt=prompt, classes=classes+["remove"], rel="sortby"))
-                    links.append(self.get_link(url=header["url_toggle"], prompt=prompt, classes=classes+["toggle"], rel="sortby"))
+        requested = self.get_requested_ordering()
+        for field_name, prompt in self.sortable_fields.iteritems():
+            classes = ['sortby']
+            descending = False
+            for position, (sorted_name, sorted_descending) in enumerate(requested):
+                if sorted_name == field_name:
+                    classes.append('sorted')
+                    classes.append('descending' if sorted_descending else 'ascending')
+                    descending = position == 0 and not sorted_descending
+                    break
+            ordering = [('-%s' if descending else '%s') % field_name]
+            ordering += [('-%s' if sorted_descending else '%s') % sorted_name
+                         for sorted_name, sorted_descending in requested
+                         if sorted_name != field_name]
+            kwargs = dict(link_kwargs)
+            kwargs.update({
+                'url': u'./' + self.state.get_query_string({self.ordering_var: ','.join(ordering)}, [self.page_var]),
+                'prompt': prompt,
+                'classes': classes,
+                'rel': 'sortby',
+                'group': _('Sort by'),
+            })
+            links.append(self.get_link(**kwargs))
+        return links
+    
+    def get_filter_links(self, **link_kwargs):
+        links = super(ModelIndex, self).get_filter_links(**link_kwargs)
+        links += self.get_sort_links(**link_kwargs)
         return links
 
 class InlineIndex(Index):
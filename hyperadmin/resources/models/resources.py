@@ -1,9 +1,14 @@
 from django.conf.urls.defaults import patterns, url, include
 from django import forms
+from django.template.defaultfilters import slugify
 
 from hyperadmin.apirequests import Namespace
 from hyperadmin.resources.crud import CRUDResource
+from hyperadmin.resources.models.bulkimport import BulkImporter
 from hyperadmin.resources.models.indexes import ModelIndex, InlineIndex
+from hyperadmin.resources.models.filters import FieldFilter, DateHierarchyFilter, SearchFilter
+from hyperadmin.resources.models.search import DefaultSearchBackend
+from hyperadmin.resources.models.util import get_related_lookup
 from hyperadmin.resources.models.endpoints import ListEndpoint, CreateEndpoint, DetailEndpoint, DeleteEndpoint
 from hyperadmin.resources.models.endpoints import InlineListEndpoint, InlineCreateEndpoint, InlineDetailEndpoint, InlineDeleteEndpoint
 
@@ -31,29 +36,65 @@ class BaseModelResource(CRUDResource):
     list_display_links = ()
     list_filter = ()
     list_select_related = False
+    list_prefetch_related = ()
     list_per_page = 100
     list_max_show_all = 200
     list_editable = ()
     search_fields = ()
+    sortable_fields = None
+    '''Fields the list may be ordered by, defaults to the fields in list_display'''
     date_hierarchy = None
+    list_filter_cache_timeout = 300
+    '''Seconds to cache the choices of list filters, 0 disables caching'''
+    list_filter_facets = False
+    '''Annotate the filter links with the number of matching rows'''
+    search_backend_class = DefaultSearchBackend
+    '''The backend performing searches over search_fields'''
+    bulk_import = False
+    '''Import the rows posted to the list endpoint in chunks as they are parsed, see `import_rows`'''
+    bulk_import_chunk_size = 500
+    bulk_import_upsert = False
+    '''Import rows with a primary key, replacing the existing rows'''
+    bulk_importer_class = BulkImporter
+    _search_backend = None
+    _related_lookups = None
     
     @property
     def opts(self):
         return self.resource_adaptor._meta
     
+    def fork(self, **kwargs):
+        kwargs.setdefault('_search_backend', self._search_backend)
+        kwargs.setdefault('_related_lookups', self._related_lookups)
+        return super(BaseModelResource, self).fork(**kwargs)
+    
+    def register_indexes(self):
+        '''
+        Also builds the search backend and the related lookups once, forks
+        of this resource share them
+        '''
+        super(BaseModelResource, self).register_indexes()
+        self.get_search_backend()
+        self.get_related_lookups()
+    
     def get_app_name(self):
         return self.opts.app_label
     
     def get_resource_name(self):
         return self.opts.module_name
     
+    @classmethod
+    def get_registration_slug(cls, **kwargs):
+        slug = super(BaseModelResource, cls).get_registration_slug(**kwargs)
+        if slug is None and 'resource_adaptor' in kwargs:
+            slug = slugify(kwargs['resource_adaptor']._meta.module_name)
+        return slug
+    
     def get_primary_query(self, **kwargs):
         return self.get_queryset()
     
     def get_indexes(self):
         #from hyperadmin.resources.indexes import Index
-        from hyperadmin.resources.models.filters import FieldFilter, SearchFilter
-
         from django.db import models
         from django.contrib.admin.util import get_fields_from_path
         try:
@@ -63,7 +104,7 @@ class BaseModelResource(CRUDResource):
         
         indexes = {'primary': ModelIndex('primary', self)}
         
-        index = ModelIndex('filter', self)
+        index = ModelIndex('filter', self, sortable_fields=self.get_sortable_fields())
         indexes['filter'] = index
         
         if self.list_filter:
@@ -90,27 +131,111 @@ class BaseModelResource(CRUDResource):
                     use_distinct = (use_distinct or
                                     lookup_needs_distinct(self.opts,
                                                           field_path))
+                    if spec:
+                        spec.use_distinct = use_distinct
                 if spec:
                     index.filters.append(spec)
         
         if self.search_fields:
-            index.register_filter(SearchFilter, search_fields=self.search_fields)
-        '''
-        date_section = self.register_section('date', FilterSection)
+            index.register_filter(SearchFilter, search_fields=self.search_fields,
+                                  search_backend=self.get_search_backend())
         if self.date_hierarchy:
-            pass
-        '''
+            field = get_fields_from_path(self.model, self.date_hierarchy)[-1]
+            index.filters.append(DateHierarchyFilter(field, self.date_hierarchy, index))
         return indexes
     
+    def get_sortable_fields(self):
+        '''
+        Returns a list of (field path, prompt) pairs the list may be ordered by
+        '''
+        from django.db import models
+        from django.contrib.admin.util import get_fields_from_path, NotRelationField
+        from django.utils.text import capfirst
+        
+        if self.sortable_fields is None:
+            field_names = [display for display in self.list_display if isinstance(display, basestring)]
+        else:
+            field_names = self.sortable_fields
+        sortable_fields = list()
+        for field_name in field_names:
+            try:
+                fields = get_fields_from_path(self.model, field_name)
+            except (models.FieldDoesNotExist, NotRelationField):
+                if self.sortable_fields is not None:
+                    raise
+                continue
+            #ordering across multi valued relations would repeat rows
+            if [field for field in fields if not isinstance(field, models.Field) or
+                                            isinstance(field.rel, models.ManyToManyRel)]:
+                continue
+            sortable_fields.append((field_name, capfirst(fields[-1].verbose_name)))
+        return sortable_fields
+    
+    def get_search_backend(self):
+        '''
+        Returns the search backend, shared by forks of this resource
+        '''
+        if self._search_backend is None:
+            self._search_backend = self.search_backend_class(self, self.search_fields)
+        return self._search_backend
+    
+    def on_create_success(self, item):
+        self.get_search_backend().update_index([item.instance])
+        return super(BaseModelResource, self).on_create_success(item)
+    
+    def on_update_success(self, item):
+        self.get_search_backend().update_index([item.instance])
+        return super(BaseModelResource, self).on_update_success(item)
+    
+    def delete_item(self, item):
+        #the primary key of the instance is cleared once it is deleted
+        pk = item.instance.pk
+        super(BaseModelResource, self).delete_item(item)
+        self.get_search_backend().delete_index([pk])
+    
     def lookup_allowed(self, lookup, value):
         '''Currently unused'''
         return True #TODO
     
+    def get_related_lookups(self):
+        '''
+        Returns a tuple of select_related and prefetch_related paths. Honors
+        `list_select_related` and `list_prefetch_related` and adds the
+        relations traversed by `list_display` and `search_fields`.
+        '''
+        if self._related_lookups is None:
+            select_related, prefetch_related = list(), list(self.list_prefetch_related)
+            if isinstance(self.list_select_related, (list, tuple)):
+                select_related.extend(self.list_select_related)
+            paths = [(display, True) for display in self.list_display if isinstance(display, basestring)]
+            paths += [(search_field.lstrip('^=@'), False) for search_field in self.search_fields]
+            for path, allow_prefetch in paths:
+                lookup = get_related_lookup(self.opts, path)
+                if lookup is None:
+                    continue
+                kind, prefix = lookup
+                if kind == 'select' and prefix not in select_related:
+                    select_related.append(prefix)
+                elif kind == 'prefetch' and allow_prefetch and prefix not in prefetch_related:
+                    prefetch_related.append(prefix)
+            self._related_lookups = (select_related, prefetch_related)
+        return self._related_lookups
+    
+    def apply_related_lookups(self, queryset):
+        select_related, prefetch_related = self.get_related_lookups()
+        if self.list_select_related is True:
+            queryset = queryset.select_related()
+        elif select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related and hasattr(queryset, 'prefetch_related'):
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+    
     def get_queryset(self):
         queryset = self.resource_adaptor.objects.all()
         if not self.has_update_permission(): #TODO has_list_permission?
             queryset = queryset.none()
-        return queryset
+        return self.apply_related_lookups(queryset)
     
     def has_create_permission(self):
         user = self.api_request.user
@@ -167,11 +292,24 @@ class BaseModelResource(CRUDResource):
                 #TODO fields
         return AdminForm
     
+    def get_bulk_importer(self, **kwargs):
+        kwargs.setdefault('chunk_size', self.bulk_import_chunk_size)
+        kwargs.setdefault('upsert', self.bulk_import_upsert)
+        return self.bulk_importer_class(self, **kwargs)
+    
+    def import_rows(self, rows):
+        '''
+        Imports the serialized rows in chunks, returns a report of the import
+        '''
+        return self.get_bulk_importer().import_rows(rows)
+    
     def get_native_datatap_instream_from_items(self, items):
         '''
         Makes an instream of model instances
         '''
-        return [item.instance for item in items]
+        #the model datatap iterates each source of the list, a generator of
+        #instances is read one at a time
+        return [(item.instance for item in items)]
     
     def get_native_datatap(self, instream=None, **kwargs):
         '''
@@ -197,12 +335,19 @@ class ModelResource(BaseModelResource):
         return self.resource_adaptor
     
     def initialize_inlines(self):
+        #the url patterns are invalidated as the resource is registered
         self.inline_instances = list()
         for inline_cls in self.inlines:
-            self.register_inline(inline_cls)
+            self.inline_instances.append(self.create_inline(inline_cls))
+    
+    def create_inline(self, inline_cls):
+        return inline_cls(parent=self, api_request=self.api_request)
     
     def register_inline(self, inline_cls):
-        self.inline_instances.append(inline_cls(parent=self, api_request=self.api_request))
+        self.inline_instances.append(self.create_inline(inline_cls))
+        if self.api_request is None:
+            #forks bound to a request leave the url patterns of the site unchanged
+            self.invalidate_urls()
     
     def get_urls(self):
         urlpatterns = super(ModelResource, self).get_urls()
@@ -257,7 +402,7 @@ class InlineModelResource(BaseModelResource):
         queryset = queryset.filter(**{self.fk.name:parent})
         if not self.has_update_permission():
             queryset = queryset.none()
-        return queryset
+        return self.apply_related_lookups(queryset)
     
     def get_primary_query(self, **kwargs):
         return self.get_queryset(parent=self.state['parent'].instance)
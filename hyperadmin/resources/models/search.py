@@ -0,0 +1,323 @@
+'''
+Search backends used by `SearchFilter` to filter a model index.
+
+The default backend performs the admin style `icontains` lookups. The full
+text backends keep a side table of documents keyed by the primary key of
+the model, built with the `hyperadmin_searchindex` management command, and
+order the results by relevance. Until the side table is built they fall
+back to the default backend.
+'''
+import logging
+import operator
+import time
+
+from django.db import connections, models, router, transaction
+from django.utils.datastructures import SortedDict
+from django.utils.encoding import force_unicode
+try:
+    from django.contrib.admin.util import lookup_needs_distinct
+except ImportError:
+    from hyperadmin.resources.models.util import lookup_needs_distinct
+
+
+REPORTED_MISSING_INDEXES = set()
+'''Database aliases and side tables already reported as not built by this process'''
+
+class BaseSearchBackend(object):
+    def __init__(self, resource, search_fields):
+        self.resource = resource
+        self.search_fields = [str(search_field) for search_field in search_fields]
+
+    @property
+    def model(self):
+        return self.resource.resource_adaptor
+
+    def get_logger(self):
+        return logging.getLogger(__name__)
+
+    def search(self, active_index, query):
+        '''
+        Returns the index filtered by the query
+        '''
+        raise NotImplementedError
+
+    def build_index(self, queryset=None):
+        '''
+        Builds or refreshes the search index, returns the number of documents indexed
+        '''
+        return 0
+
+    def update_index(self, instances):
+        '''
+        Refreshes the documents of the given instances
+        '''
+        pass
+
+    def delete_index(self, pks):
+        '''
+        Removes the documents of the given primary keys
+        '''
+        pass
+
+class DefaultSearchBackend(BaseSearchBackend):
+    '''
+    ORs `icontains` lookups across the search fields for every search term.
+    Supports the admin prefixes: ^ (istartswith), = (iexact) and @ (search)
+    '''
+    def __init__(self, resource, search_fields):
+        super(DefaultSearchBackend, self).__init__(resource, search_fields)
+        self.orm_lookups = [self.construct_search(search_field)
+                            for search_field in self.search_fields]
+        self.use_distinct = False
+        for search_spec in self.orm_lookups:
+            if lookup_needs_distinct(self.model._meta, search_spec):
+                self.use_distinct = True
+                break
+
+    def construct_search(self, field_name):
+        if field_name.startswith('^'):
+            return "%s__istartswith" % field_name[1:]
+        elif field_name.startswith('='):
+            return "%s__iexact" % field_name[1:]
+        elif field_name.startswith('@'):
+            return "%s__search" % field_name[1:]
+        else:
+            return "%s__icontains" % field_name
+
+    def search(self, active_index, query):
+        if not self.orm_lookups or not query:
+            return active_index
+        for bit in query.split():
+            or_queries = [models.Q(**{orm_lookup: bit})
+                          for orm_lookup in self.orm_lookups]
+            active_index = active_index.filter(reduce(operator.or_, or_queries))
+        if self.use_distinct:
+            return active_index.distinct()
+        return active_index
+
+class FullTextSearchBackend(BaseSearchBackend):
+    '''
+    Base class for backends storing one document per object in a side table
+    '''
+    vendor = None
+    '''The database vendor this backend supports'''
+
+    fallback_backend_class = DefaultSearchBackend
+    '''Used while the side table is not available'''
+
+    table_suffix = '_search'
+
+    unavailable_timeout = 60
+    '''Seconds a missing side table is remembered before it is looked up again'''
+
+    def __init__(self, resource, search_fields):
+        super(FullTextSearchBackend, self).__init__(resource, search_fields)
+        self.fallback_backend = self.fallback_backend_class(resource, search_fields)
+        self.field_names = [search_field.lstrip('^=@') for search_field in self.search_fields]
+        self._available = set()
+        self._unavailable = dict()
+
+    @property
+    def opts(self):
+        return self.model._meta
+
+    def get_table_name(self):
+        return '%s%s' % (self.opts.db_table, self.table_suffix)
+
+    def quote_name(self, connection, name):
+        return connection.ops.quote_name(name)
+
+    def get_pk_column(self, connection):
+        return '%s.%s' % (self.quote_name(connection, self.opts.db_table),
+                          self.quote_name(connection, self.opts.pk.column))
+
+    def is_available(self, using):
+        '''
+        Returns True if the side table exists on the database alias. A
+        missing side table is remembered for `unavailable_timeout` seconds
+        so an index built by another process is picked up, and reported once.
+        '''
+        if using in self._available:
+            return True
+        connection = connections[using]
+        if connection.vendor != self.vendor:
+            return False
+        checked = self._unavailable.get(using)
+        if checked is not None and time.time() - checked < self.unavailable_timeout:
+            return False
+        if self.get_table_name() not in connection.introspection.table_names():
+            self._unavailable[using] = time.time()
+            key = (using, self.get_table_name())
+            if key not in REPORTED_MISSING_INDEXES:
+                REPORTED_MISSING_INDEXES.add(key)
+                self.get_logger().warning('Search index %s has not been built, falling back to %s' %
+                                          (self.get_table_name(), self.fallback_backend_class.__name__))
+            return False
+        self._unavailable.pop(using, None)
+        self._available.add(using)
+        return True
+
+    def get_documents(self, queryset):
+        '''
+        Returns a list of tuples containing the primary key and a list of
+        text values, one per search field
+        '''
+        documents = SortedDict()
+        for row in queryset.order_by().values_list('pk', *self.field_names):
+            parts = documents.setdefault(row[0], [list() for field_name in self.field_names])
+            for index, value in enumerate(row[1:]):
+                if value is not None:
+                    parts[index].append(force_unicode(value))
+        return [(pk, [u' '.join(part) for part in parts]) for pk, parts in documents.iteritems()]
+
+    def build_index(self, queryset=None):
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        if connection.vendor != self.vendor:
+            raise ValueError('%s requires a %s database, got %s' %
+                             (type(self).__name__, self.vendor, connection.vendor))
+        if queryset is None:
+            queryset = self.model._default_manager.using(using).all()
+        documents = self.get_documents(queryset)
+        cursor = connection.cursor()
+        self.create_table(connection, cursor)
+        cursor.execute('DELETE FROM %s' % self.quote_name(connection, self.get_table_name()))
+        self.insert_documents(connection, cursor, documents)
+        transaction.commit_unless_managed(using=using)
+        self._unavailable.pop(using, None)
+        self._available.add(using)
+        return len(documents)
+
+    def update_index(self, instances):
+        using = router.db_for_write(self.model)
+        if not self.is_available(using):
+            return
+        connection = connections[using]
+        pks = [instance.pk for instance in instances if instance.pk is not None]
+        if not pks:
+            return
+        queryset = self.model._default_manager.using(using).filter(pk__in=pks)
+        documents = self.get_documents(queryset)
+        cursor = connection.cursor()
+        self.delete_documents(connection, cursor, pks)
+        self.insert_documents(connection, cursor, documents)
+        transaction.commit_unless_managed(using=using)
+
+    def delete_index(self, pks):
+        using = router.db_for_write(self.model)
+        pks = [pk for pk in pks if pk is not None]
+        if not pks or not self.is_available(using):
+            return
+        connection = connections[using]
+        self.delete_documents(connection, connection.cursor(), pks)
+        transaction.commit_unless_managed(using=using)
+
+    def create_table(self, connection, cursor):
+        raise NotImplementedError
+
+    def insert_documents(self, connection, cursor, documents):
+        raise NotImplementedError
+
+    def delete_documents(self, connection, cursor, pks):
+        raise NotImplementedError
+
+    def search(self, active_index, query):
+        if not query.split():
+            return active_index
+        if not self.is_available(active_index.db):
+            return self.fallback_backend.search(active_index, query)
+        return self.search_index(connections[active_index.db], active_index, query)
+
+    def search_index(self, connection, active_index, query):
+        raise NotImplementedError
+
+class SQLiteFTSSearchBackend(FullTextSearchBackend):
+    '''
+    Searches an SQLite FTS5 virtual table. Each term is matched as a prefix
+    and results are ordered by bm25 rank. Requires an integer primary key.
+    '''
+    vendor = 'sqlite'
+
+    def get_match_expression(self, query):
+        return u' '.join([u'"%s"*' % bit.replace('"', '""') for bit in query.split()])
+
+    def create_table(self, connection, cursor):
+        columns = ', '.join([self.quote_name(connection, field_name) for field_name in self.field_names])
+        cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s)' %
+                       (self.quote_name(connection, self.get_table_name()), columns))
+
+    def insert_documents(self, connection, cursor, documents):
+        columns = ', '.join(['rowid'] + [self.quote_name(connection, field_name) for field_name in self.field_names])
+        placeholders = ', '.join(['%s'] * (len(self.field_names) + 1))
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (self.quote_name(connection, self.get_table_name()), columns, placeholders)
+        cursor.executemany(sql, [[pk] + values for pk, values in documents])
+
+    def delete_documents(self, connection, cursor, pks):
+        sql = 'DELETE FROM %s WHERE rowid = %%s' % self.quote_name(connection, self.get_table_name())
+        cursor.executemany(sql, [[pk] for pk in pks])
+
+    def search_index(self, connection, active_index, query):
+        table = self.quote_name(connection, self.get_table_name())
+        params = {'table': table,
+                  'pk': self.get_pk_column(connection),}
+        match = self.get_match_expression(query)
+        return active_index.extra(
+            select={'search_rank': 'SELECT rank FROM %(table)s WHERE %(table)s MATCH %%s AND rowid = %(pk)s' % params},
+            select_params=[match],
+            where=['%(pk)s IN (SELECT rowid FROM %(table)s WHERE %(table)s MATCH %%s)' % params],
+            params=[match],
+            order_by=['search_rank'],
+        )
+
+class PostgresSearchBackend(FullTextSearchBackend):
+    '''
+    Searches a side table of `tsvector` documents with a GIN index. Earlier
+    search fields carry more weight and results are ordered by `ts_rank`.
+    '''
+    vendor = 'postgresql'
+    search_config = 'english'
+    weights = ('A', 'B', 'C', 'D')
+
+    def get_weight(self, index):
+        return self.weights[min(index, len(self.weights) - 1)]
+
+    def get_pk_db_type(self, connection):
+        pk = self.opts.pk
+        if isinstance(pk, models.AutoField):
+            return 'integer'
+        return pk.db_type(connection=connection)
+
+    def create_table(self, connection, cursor):
+        table = self.quote_name(connection, self.get_table_name())
+        cursor.execute('CREATE TABLE IF NOT EXISTS %s (object_id %s PRIMARY KEY, document tsvector NOT NULL)' %
+                       (table, self.get_pk_db_type(connection)))
+        cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s USING gin(document)' %
+                       (self.quote_name(connection, '%s_document' % self.get_table_name()), table))
+
+    def insert_documents(self, connection, cursor, documents):
+        vectors = ' || '.join(["setweight(to_tsvector(%%s, %%s), '%s')" % self.get_weight(index)
+                               for index in range(len(self.field_names))])
+        sql = 'INSERT INTO %s (object_id, document) VALUES (%%s, %s)' % (self.quote_name(connection, self.get_table_name()), vectors)
+        rows = list()
+        for pk, values in documents:
+            row = [pk]
+            for value in values:
+                row.extend([self.search_config, value])
+            rows.append(row)
+        cursor.executemany(sql, rows)
+
+    def delete_documents(self, connection, cursor, pks):
+        sql = 'DELETE FROM %s WHERE object_id = %%s' % self.quote_name(connection, self.get_table_name())
+        cursor.executemany(sql, [[pk] for pk in pks])
+
+    def search_index(self, connection, active_index, query):
+        params = {'table': self.quote_name(connection, self.get_table_name()),
+                  'pk': self.get_pk_column(connection),}
+        query_params = [self.search_config, query]
+        return active_index.extra(
+            select={'search_rank': 'SELECT ts_rank(document, plainto_tsquery(%%s, %%s)) FROM %(table)s WHERE object_id = %(pk)s' % params},
+            select_params=query_params,
+            where=['%(pk)s IN (SELECT object_id FROM %(table)s WHERE document @@ plainto_tsquery(%%s, %%s))' % params],
+            params=query_params,
+            order_by=['-search_rank'],
+        )
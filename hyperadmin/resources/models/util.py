@@ -30,3 +30,31 @@ def prepare_lookup_value(key, value):
             value = True
     return value
 
+
+def get_related_lookup(opts, path):
+    """
+    Returns a tuple of ('select', prefix) or ('prefetch', prefix) describing
+    how to load the relations traversed by the lookup path, or None if the
+    path does not traverse a relation.
+    """
+    from django.db.models.fields import FieldDoesNotExist
+    parts = path.split('__')
+    for index, part in enumerate(parts):
+        try:
+            field, model, direct, m2m = opts.get_field_by_name(part)
+        except FieldDoesNotExist:
+            break
+        prefix = '__'.join(parts[:index+1])
+        if m2m or not direct:
+            if not direct and field.field.unique:
+                #reverse one to one
+                return None
+            return ('prefetch', prefix)
+        if not getattr(field, 'rel', None):
+            break
+        opts = field.rel.to._meta
+    else:
+        return ('select', path)
+    if index:
+        return ('select', '__'.join(parts[:index]))
+    return None
@@ -27,10 +27,12 @@ class BaseResource(GlobalSiteMixin, VirtualEndpoint):
     def __init__(self, **kwargs):
         assert 'resource_adaptor' in kwargs
         self._installed_endpoints = SortedDict()
+        self._index_definitions = None
         super(BaseResource, self).__init__(**kwargs)
     
     def fork(self, **kwargs):
         kwargs.setdefault('_installed_endpoints', self._installed_endpoints)
+        kwargs.setdefault('_index_definitions', self._index_definitions)
         return super(BaseResource, self).fork(**kwargs)
     
     @property
@@ -41,6 +43,7 @@ class BaseResource(GlobalSiteMixin, VirtualEndpoint):
     def post_register(self):
         self.register_endpoints()
         super(BaseResource, self).post_register()
+        self.register_indexes()
     
     def get_app_name(self):
         """
@@ -90,6 +93,19 @@ class BaseResource(GlobalSiteMixin, VirtualEndpoint):
     
     resource_slug = property(_get_resource_slug, _set_resource_slug, None, 'Set or get the slug of the resource')
     
+    @classmethod
+    def get_registration_slug(cls, **kwargs):
+        """
+        Return the slug of the resource the kwargs would instantiate or None
+        if it is only known once instantiated. Lazily registered resources
+        are filed under this slug until they are materialized.
+        """
+        if 'resource_slug' in kwargs:
+            return kwargs['resource_slug']
+        if 'resource_name' in kwargs:
+            return slugify(kwargs['resource_name'])
+        return None
+    
     def get_prompt(self):
         return self.resource_name
     
@@ -108,6 +124,7 @@ class BaseResource(GlobalSiteMixin, VirtualEndpoint):
     def register_endpoint(self, endpoint_cls, **kwargs):
         endpoint = self._register_endpoint(endpoint_cls, **kwargs)
         self._installed_endpoints[endpoint.get_name_suffix()] = endpoint
+        self.invalidate_urls()
         return endpoint
     
     def _register_endpoint(self, endpoint_cls, **kwargs):
@@ -135,11 +152,25 @@ class BaseResource(GlobalSiteMixin, VirtualEndpoint):
                      'app_name': self.app_name,})
         return data
     
+    def register_indexes(self):
+        '''
+        Builds the index definitions once, forks of this resource share them
+        '''
+        if self._index_definitions is None:
+            self._index_definitions = self.get_indexes()
+    
     def get_indexes(self):
+        '''
+        Returns a dictionary of index definitions, called once at registration
+        '''
         return {}
     
     def get_index(self, name):
-        return self.get_indexes()[name]
+        '''
+        Returns the named index bound to this resource
+        '''
+        self.register_indexes()
+        return self._index_definitions[name].fork(resource=self)
     
     def get_index_query(self, name):
         raise NotImplementedError
@@ -1 +1 @@
-from hyperadmin.resources.storages.resources import StorageResource
+from hyperadmin.resources.storages.resources import StorageResource, ReadOnlyStorageResource
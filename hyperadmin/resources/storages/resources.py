@@ -78,9 +78,8 @@ class StorageResource(CRUDResource):
             return self.state['page'].object_list
         if self.state.has_view_class('change_form'):
             return []
-        dirs, files = self.get_primary_query()
-        instances = [BoundFile(self.storage, file_name) for file_name in files]
-        return instances
+        dirs, files = self.get_primary_query().get_dirs_and_files()
+        return files
 
     def get_item_form_kwargs(self, item=None, **kwargs):
         kwargs = super(StorageResource, self).get_item_form_kwargs(item, **kwargs)
@@ -112,7 +111,11 @@ class StorageResource(CRUDResource):
 
     def get_item_outbound_links(self, item):
         links = self.create_link_collection()
-        links.append(self.get_item_storage_link(item, link_factor='LO'))
+        try:
+            links.append(self.get_item_storage_link(item, link_factor='LO'))
+        except NotImplementedError:
+            #the storage does not serve its files
+            pass
         return links
 
     def get_item_prompt(self, item):
@@ -120,3 +123,20 @@ class StorageResource(CRUDResource):
 
     def get_paginator_kwargs(self):
         return {}
+
+
+class ReadOnlyStorageResource(StorageResource):
+    """
+    Lists and details the files of a storage without allowing changes
+    """
+    def has_create_permission(self):
+        return False
+
+    def has_update_permission(self, item=None):
+        return False
+
+    def has_delete_permission(self, item=None):
+        return False
+
+    def get_item_url(self, item):
+        return self.link_prototypes['detail'].get_url(item=item)
@@ -25,3 +25,14 @@ Sent by the resource when an event occurs
 :param event: A string representing the event
 :param item_list: An item list for which the event applies, may be empty
 '''
+
+endpoint_phase = Signal(providing_args=["endpoint", "phase", "duration"])
+endpoint_phase.__doc__ = '''
+Sent by the endpoint after each phase of dispatching an api request.
+Not sent when there are no receivers.
+
+:param sender: The full url name of the endpoint + ! + the phase
+:param endpoint: The endpoint dispatching the api request
+:param phase: One of dispatch, initialize_state, common_state, permission_check, handler, normalize_response or serialize
+:param duration: The elapsed time in seconds
+'''
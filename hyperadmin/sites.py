@@ -1,13 +1,49 @@
 from django.utils.datastructures import SortedDict
+from django.utils.functional import LazyObject
+try:
+    from django.utils.functional import empty
+except ImportError: #django 1.3
+    empty = None
 
 from hyperadmin.endpoints import RootEndpoint
 from hyperadmin.resources.directory import ResourceDirectory
 from hyperadmin.resources.auth import AuthResource
 from hyperadmin.throttle import Throttle
+from hyperadmin.profiling import RequestProfiler
 
 import collections
+import threading
 
 
+class LazyResource(object):
+    """
+    Stands in for a resource registered with `lazy=True`. The resource and
+    its endpoints are instantiated on first access to the descriptor,
+    replacing it in the registry and the application of the site.
+    """
+    def __init__(self, site, resource_class, kwargs, key):
+        self.__dict__.update({'_lazy_site': site,
+                              '_lazy_class': resource_class,
+                              '_lazy_kwargs': kwargs,
+                              '_lazy_key': key,
+                              '_lazy_resource': None,})
+    
+    def materialize(self):
+        if self._lazy_resource is None:
+            self._lazy_site.materialize_resource(self)
+        return self._lazy_resource
+    
+    def __getattr__(self, name):
+        return getattr(self.materialize(), name)
+    
+    def __setattr__(self, name, value):
+        setattr(self.materialize(), name, value)
+    
+    def __repr__(self):
+        if self._lazy_resource is None:
+            return '<LazyResource %s: %s>' % (self._lazy_class.__name__, self._lazy_key)
+        return repr(self._lazy_resource)
+
 class Registry(dict):
     def __init__(self, resource_site):
         self.resource_site = resource_site
@@ -27,10 +63,17 @@ class Registry(dict):
 class BaseResourceSite(RootEndpoint):
     directory_resource_class = ResourceDirectory
     throttle = Throttle(throttle_at=1200)
+    profiler = RequestProfiler()
     name = 'hyperadmin'
     
+    lazy_registration = False
+    '''Default of the `lazy` option of `register`'''
+    
     def __init__(self, **kwargs):
         self.registry = dict()
+        self.lazy_resources = list()
+        self.registration_lock = threading.RLock()
+        self.registration_site = self
         kwargs.setdefault('namespace', kwargs.get('name', self.name))
         super(BaseResourceSite, self).__init__(**kwargs)
     
@@ -68,8 +111,75 @@ class BaseResourceSite(RootEndpoint):
         ret = super(BaseResourceSite, self).fork(**kwargs)
         ret.registry.update(self.registry)
         ret.directory_resource.resource_adaptor.update(self.directory_resource.resource_adaptor)
+        ret.lazy_resources = self.lazy_resources
+        ret.registration_lock = self.registration_lock
+        ret.registration_site = self.registration_site
         return ret
     
+    def materialize_resource(self, lazy_resource):
+        '''
+        Instantiates the resource of the descriptor and files it in place of the descriptor
+        '''
+        with self.registration_lock:
+            if lazy_resource._lazy_resource is not None:
+                return
+            kwargs = lazy_resource._lazy_kwargs
+            try:
+                resource = lazy_resource._lazy_class(**kwargs)
+            except:
+                self.discard_resource(lazy_resource)
+                raise
+            lazy_resource.__dict__['_lazy_resource'] = resource
+            directory = kwargs['parent']
+            if directory.resource_adaptor.get(lazy_resource._lazy_key) is lazy_resource:
+                del directory.resource_adaptor[lazy_resource._lazy_key]
+                directory.register_resource(resource)
+            if self.registry.get(kwargs['resource_adaptor']) is lazy_resource:
+                self.registry[kwargs['resource_adaptor']] = resource
+            if lazy_resource in self.lazy_resources:
+                self.lazy_resources.remove(lazy_resource)
+    
+    def discard_resource(self, lazy_resource):
+        '''
+        Removes a descriptor whose resource failed to instantiate from the site
+        '''
+        with self.registration_lock:
+            kwargs = lazy_resource._lazy_kwargs
+            directory = kwargs['parent']
+            if directory.resource_adaptor.get(lazy_resource._lazy_key) is lazy_resource:
+                del directory.resource_adaptor[lazy_resource._lazy_key]
+                directory.invalidate_listing_cache()
+                directory.invalidate_urls()
+            if self.registry.get(kwargs['resource_adaptor']) is lazy_resource:
+                del self.registry[kwargs['resource_adaptor']]
+            if lazy_resource in self.lazy_resources:
+                self.lazy_resources.remove(lazy_resource)
+    
+    def materialize_resources(self):
+        '''
+        Instantiates every lazily registered resource, resources failing to
+        instantiate are logged and discarded
+        '''
+        for lazy_resource in list(self.lazy_resources):
+            try:
+                lazy_resource.materialize()
+            except Exception:
+                self.get_logger().exception('Could not materialize resource: %r' % lazy_resource)
+    
+    def warm_urls(self):
+        '''
+        Materializes the lazily registered resources and builds the url
+        patterns of the site ahead of the first request
+        '''
+        self.materialize_resources()
+        return self.urlpatterns
+    
+    def get_endpoint_from_urlname(self, urlname):
+        if urlname not in self.endpoints_by_urlname and self.lazy_resources:
+            self.materialize_resources()
+            self.endpoints_by_urlname.update(self.registration_site.endpoints_by_urlname)
+        return super(BaseResourceSite, self).get_endpoint_from_urlname(urlname)
+    
     def register_endpoint(self, klass, **options):
         kwargs = self.get_endpoint_kwargs(**options)
         endpoint = klass(**kwargs)
@@ -80,9 +190,15 @@ class BaseResourceSite(RootEndpoint):
     
     #TODO review the following for inclusion into RootEndpoint
     def register_builtin_media_types(self):
-        from mediatypes import BUILTIN_MEDIA_TYPES
-        for key, value in BUILTIN_MEDIA_TYPES.iteritems():
+        '''
+        Registers the media types of the `HYPERADMIN_MEDIA_TYPES` setting by
+        dotted path, their modules are imported on first use. Media types
+        registered with `MediaType.register_with_builtins` are included.
+        '''
+        from hyperadmin import app_settings
+        for key, value in app_settings.MEDIA_TYPES.iteritems():
             self.register_media_type(key, value)
+        self.media_types.include_builtins = True
     
     def get_html_type_from_field(self, field):
         #TODO fill this out, datetime, etc
@@ -149,18 +265,32 @@ class ResourceSite(BaseResourceSite):
         return self.directory_resource.resource_adaptor
     
     def register(self, model_or_iterable, admin_class, **options):
+        '''
+        Registers the resource class for the model in the application named
+        by `app_name`. With `lazy=True` a descriptor is registered instead and
+        the resource is instantiated on first access or URL resolution.
+        '''
         if isinstance(model_or_iterable, collections.Iterable) and not isinstance(model_or_iterable, basestring):
             resources = list()
             for model in model_or_iterable:
                 resources.append(self.register(model, admin_class, **options))
             return resources
         model = model_or_iterable
+        lazy = options.pop('lazy', self.lazy_registration)
         app_name = options.pop('app_name')
         app_resource = self.register_application(app_name)
         options.setdefault('parent', app_resource)
         kwargs = self.get_resource_kwargs(resource_adaptor=model, **options)
-        resource = admin_class(**kwargs)
-        self.applications[app_name].register_resource(resource)
+        key = None
+        if lazy:
+            key = admin_class.get_registration_slug(**kwargs)
+        if key is None:
+            resource = admin_class(**kwargs)
+            self.applications[app_name].register_resource(resource)
+        else:
+            resource = LazyResource(self, admin_class, kwargs, key)
+            self.applications[app_name].register_resource(resource, key=key)
+            self.lazy_resources.append(resource)
         self.registry[model] = resource
         return resource
     
@@ -187,11 +317,19 @@ class ResourceSite(BaseResourceSite):
     def get_actions(self, request):
         return SortedDict()
     
-    def install_models_from_site(self, site):
+    def install_models_from_site(self, site, lazy=None):
+        '''
+        Registers resources for the models of the admin site, lazily if
+        `lazy` is True, and returns the report of the loader. `lazy` defaults
+        to the `HYPERADMIN_LAZY_AUTOLOAD` setting
+        '''
         from hyperadmin.resources.models.autoload import DEFAULT_LOADER
+        from hyperadmin import app_settings
         
-        loader = DEFAULT_LOADER(root_endpoint=self, admin_site=site)
-        loader.register_resources()
+        if lazy is None:
+            lazy = app_settings.LAZY_AUTOLOAD
+        loader = DEFAULT_LOADER(root_endpoint=self, admin_site=site, lazy=lazy)
+        return loader.register_resources()
     
     def install_storage_resources(self, media_resource_class=None, static_resource_class=None):
         from hyperadmin.resources.storages import StorageResource
@@ -209,6 +347,26 @@ class ResourceSite(BaseResourceSite):
         app_name = '-storages'
         self.register(media_storage, media_resource_class, resource_name='media', app_name=app_name)
         self.register(static_storage, static_resource_class, resource_name='static', app_name=app_name)
+    
+    def install_profile_resource(self, resource_class=None):
+        '''
+        Registers a read only resource listing the profiles saved by the profiler
+        '''
+        from hyperadmin.resources.storages import ReadOnlyStorageResource
+        if resource_class is None:
+            resource_class = ReadOnlyStorageResource
+        self.register(self.profiler.get_storage(), resource_class, resource_name='profiles', app_name='-storages')
+    
+    def install_metrics_resource(self, resource_class=None, registry=None):
+        '''
+        Registers a resource rendering the metrics in the Prometheus text format
+        '''
+        from hyperadmin.resources.metrics import MetricsResource
+        if resource_class is None:
+            resource_class = MetricsResource
+        if registry is None:
+            from hyperadmin.metrics import metrics as registry
+        return self.register(registry, resource_class, resource_name='metrics', app_name='-metrics')
 
 class GlobalSite(BaseResourceSite):
     '''
@@ -221,8 +379,41 @@ class GlobalSite(BaseResourceSite):
         from django.core.urlresolvers import get_resolver
         return get_resolver(None)
 
-site = ResourceSite()
-site.register_builtin_media_types()
+class DefaultSite(LazyObject):
+    """
+    Instantiates the site class and registers the builtin media types on
+    first access, importing hyperadmin does not build any resource.
+    """
+    def __init__(self, site_class):
+        super(DefaultSite, self).__init__()
+        self.__dict__['_site_class'] = site_class
+        self.__dict__['_lock'] = threading.Lock()
+    
+    def _setup(self):
+        with self._lock:
+            if self._wrapped is empty:
+                site = self._site_class()
+                site.register_builtin_media_types()
+                self._wrapped = site
+    
+    def __eq__(self, other):
+        if self._wrapped is empty:
+            self._setup()
+        return self._wrapped == other
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        if self._wrapped is empty:
+            self._setup()
+        return hash(self._wrapped)
+    
+    def __repr__(self):
+        if self._wrapped is empty:
+            return '<DefaultSite %s: not instantiated>' % self._site_class.__name__
+        return repr(self._wrapped)
+
+site = DefaultSite(ResourceSite)
 
-global_site = GlobalSite()
-global_site.register_builtin_media_types()
+global_site = DefaultSite(GlobalSite)
@@ -4,6 +4,7 @@ from django.utils.http import urlencode
 from django.utils.datastructures import MergeDict
 from django.http import QueryDict
 
+from hyperadmin.instrumentation import count_allocation
 from hyperadmin.links import LinkCollectionProvider, LinkCollectorMixin
 
 
@@ -53,6 +54,7 @@ class EndpointState(LinkCollectorMixin, State):
     link_collector_class = EndpointStateLinkCollectionProvider
     
     def __init__(self, endpoint, meta, substates=[], data={}):
+        count_allocation('EndpointState')
         self.endpoint = endpoint
         super(EndpointState, self).__init__(substates=substates, data=data)
         self.meta = meta
@@ -149,6 +151,14 @@ class EndpointState(LinkCollectorMixin, State):
             return self.item.get_resource_items()
         return self.endpoint.get_resource_items()
     
+    def iter_resource_items(self):
+        """
+        Yields the resource items that are associated with this state.
+        """
+        if self.item is not None:
+            return iter(self.item.get_resource_items())
+        return self.endpoint.iter_resource_items()
+    
     def get_query_string(self, new_params=None, remove=None):
         if new_params is None: new_params = {}
         if remove is None: remove = []
@@ -168,7 +178,8 @@ class EndpointState(LinkCollectorMixin, State):
         return '?%s' % urlencode(p)
     
     def get_namespaces(self):
-        return self.endpoint.get_namespaces()
+        with self.endpoint.api_request.instrument('namespaces'):
+            return self.endpoint.get_namespaces()
     
     def __copy__(self):
         substates = self.get_dictionaries()
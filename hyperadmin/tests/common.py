@@ -1,5 +1,8 @@
+from contextlib import contextmanager
+
 from django.test.client import RequestFactory
 from django.core.urlresolvers import RegexURLResolver
+from django.db import connections, DEFAULT_DB_ALIAS
 
 from hyperadmin.apirequests import NamespaceAPIRequest
 from hyperadmin.endpoints import RootEndpoint
@@ -48,3 +51,66 @@ class URLReverseMixin(object):
     def unpatch_reverse(self):
         NamespaceAPIRequest.reverse = self._orignal_request_reverse
         RootEndpoint.reverse = self._orignal_root_reverse
+
+class QueryCounter(object):
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.queries = list()
+    
+    def __len__(self):
+        return len(self.queries)
+
+@contextmanager
+def count_queries(using=DEFAULT_DB_ALIAS):
+    """
+    Records the queries executed within the block on the returned counter
+    """
+    counter = QueryCounter(using)
+    connection = counter.connection
+    use_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    start = len(connection.queries)
+    try:
+        yield counter
+    finally:
+        counter.queries = connection.queries[start:]
+        connection.use_debug_cursor = use_debug_cursor
+
+class AllocationBudgetMixin(object):
+    def assertAllocationBudget(self, counter, budget):
+        """
+        Fails if more objects of a kind were constructed than budgeted.
+        Kinds missing from the budget are not checked.
+        """
+        exceeded = ['%s: %s > %s' % (kind, counter.get(kind, 0), limit)
+                    for kind, limit in sorted(budget.items())
+                    if counter.get(kind, 0) > limit]
+        if exceeded:
+            self.fail('Allocation budget exceeded, %s' % ', '.join(exceeded))
+
+class QueryBudgetMixin(object):
+    row_counts = (1, 10, 100)
+    
+    def count_dispatch_queries(self, endpoint, **kwargs):
+        """
+        Returns the number of queries of an internal dispatch of the
+        endpoint, after a dispatch warming up the caches
+        """
+        endpoint.internal_dispatch(**kwargs)
+        with count_queries() as queries:
+            endpoint.internal_dispatch(**kwargs)
+        return len(queries)
+    
+    def assertConstantQueries(self, endpoint, populate, row_counts=None):
+        """
+        Calls populate with each row count and fails if the queries of
+        dispatching the endpoint grow with the rows. populate returns the
+        kwargs of the internal dispatch, if any.
+        """
+        counts = list()
+        for rows in row_counts or self.row_counts:
+            dispatch_kwargs = populate(rows) or {}
+            counts.append((rows, self.count_dispatch_queries(endpoint, **dispatch_kwargs)))
+        if max([count for rows, count in counts]) > counts[0][1]:
+            self.fail('Queries of %s grow with the rows: %s' % (endpoint.get_url_name(),
+                ', '.join(['%s rows: %s queries' % entry for entry in counts])))
@@ -1,10 +1,15 @@
+import io
+
 from django.contrib.contenttypes.models import ContentType
 from django.utils import simplejson as json
 
-from hyperadmin.mediatypes.json import JSON, JSONP
+from hyperadmin import app_settings
+from hyperadmin.mediatypes.json import JSON, JSONP, iter_json_array
 
 from common import MediaTypeTestCase
 
+from mock import patch
+
 
 class JsonTestCase(MediaTypeTestCase):
     def get_adaptor(self):
@@ -22,6 +27,28 @@ class JsonTestCase(MediaTypeTestCase):
         data = json.loads(response.content)
         self.assertEqual(len(data), ContentType.objects.count())
     
+    def test_streaming_serialize(self):
+        endpoint = self.resource.endpoints['list']
+        endpoint = endpoint.fork(api_request=self.api_request)
+        link = endpoint.link_prototypes['list'].get_link()
+        content = self.adaptor.get_content(link, endpoint.state)
+        
+        endpoint = self.resource.endpoints['list'].fork(api_request=self.api_request)
+        with patch.object(app_settings, 'STREAM_DATATAPS', True):
+            response = self.adaptor.serialize(content_type='application/json', link=link, state=endpoint.state)
+        self.assertTrue(response.streaming)
+        self.assertEqual(''.join(response.streaming_content), content)
+        self.assertEqual(len(json.loads(content)), ContentType.objects.count())
+    
+    def test_iter_json_array(self):
+        rows = [{'name': u'caf\xe9', 'tags': ['a', 'b]']}, 12345, None, 'x, y']
+        payload = json.dumps(rows, ensure_ascii=False).encode('utf-8')
+        for read_size in (1, 3, 64):
+            self.assertEqual(list(iter_json_array(io.BytesIO(payload), read_size)), rows)
+        self.assertEqual(list(iter_json_array(io.BytesIO(' [ ] '), 1)), [])
+        self.assertRaises(ValueError, list, iter_json_array(io.BytesIO('{}')))
+        self.assertRaises(ValueError, list, iter_json_array(io.BytesIO('[1, 2')))
+    
     def test_model_instance_serialize(self):
         instance = ContentType.objects.all()[0]
         
@@ -1,19 +1,37 @@
+import datetime
+import json
+import os
+import pstats
+import shutil
+import tempfile
 from StringIO import StringIO
 
 from django.utils import unittest
 from django.utils.datastructures import MergeDict
-from django.contrib.auth.models import User, Group
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User, Group, Permission
 from django.http import HttpResponse
 from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connections
 
+from hyperadmin.resources.directory import ResourceDirectory
 from hyperadmin.resources.models import ModelResource, InlineModelResource
+from hyperadmin.resources.models.indexes import ModelIndex
+from hyperadmin.resources.models.search import SQLiteFTSSearchBackend
 from hyperadmin.sites import ResourceSite
-from hyperadmin.apirequests import InternalAPIRequest, NamespaceAPIRequest
+from hyperadmin.apirequests import HTTPAPIRequest, InternalAPIRequest, NamespaceAPIRequest
 from hyperadmin.endpoints import RootEndpoint
+from hyperadmin import app_settings
+from hyperadmin.instrumentation import count_allocations, percentile, timing_collector
+from hyperadmin.metrics import MetricsRegistry, metrics
+from hyperadmin.profiling import PrivateFileSystemStorage, RequestProfiler
+from hyperadmin.signals import endpoint_phase, resource_event
 
-from common import GenericURLResolver, SuperUserRequestFactory, URLReverseMixin
+from common import AllocationBudgetMixin, GenericURLResolver, QueryBudgetMixin, SuperUserRequestFactory, URLReverseMixin, count_queries
 
-from mock import MagicMock
+from mock import MagicMock, patch
 
 
 class GroupsInline(InlineModelResource):
@@ -60,7 +78,7 @@ class ResourceTestCase(URLReverseMixin, unittest.TestCase):
     def register_resource(self):
         raise NotImplementedError
 
-class ModelResourceTestCase(ResourceTestCase):
+class ModelResourceTestCase(AllocationBudgetMixin, ResourceTestCase):
     def register_resource(self):
         self.site.register(User, UserResource, app_name='auth')
         return self.site.registry[User]
@@ -89,6 +107,203 @@ class ModelResourceTestCase(ResourceTestCase):
         links = state.links.get_outbound_links()
         self.assertTrue(links, 'outbound links are empty')
     
+    def test_sql_instrumentation(self):
+        def serialize(link, state):
+            [item.form for item in state.get_resource_items()]
+            return HttpResponse()
+        
+        api_request = self.get_api_request()
+        api_request.META['HTTP_X_HYPERADMIN_INSTRUMENT'] = '1'
+        api_request.generate_response.side_effect = serialize
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        response = endpoint.dispatch_api(api_request)
+        
+        state = api_request.generate_response.call_args[1]['state']
+        summary = state.meta['sql'].get_summary()
+        self.assertTrue(summary['queries'] > 0)
+        self.assertEqual(summary['queries'], sum([phase['queries'] for phase in summary['phases'].values()]))
+        self.assertEqual(summary['phases']['count']['queries'], 1)
+        self.assertEqual(summary['phases']['page']['queries'], 1)
+        self.assertTrue(summary['slowest']['sql'])
+        self.assertTrue(response['Server-Timing'].startswith('sql;desc="'))
+        self.assertTrue('sql-page;desc="1 queries"' in response['Server-Timing'])
+        
+        api_request = self.get_api_request()
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        response = endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        self.assertFalse('sql' in state.meta)
+        self.assertFalse(response.has_header('Server-Timing'))
+    
+    def test_allocation_counters(self):
+        api_request = self.get_api_request()
+        api_request.META['HTTP_X_HYPERADMIN_INSTRUMENT'] = '1'
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        
+        state = api_request.generate_response.call_args[1]['state']
+        allocations = state.meta['allocations']
+        for kind in ('fork', 'Link', 'LinkPrototype', 'EndpointState'):
+            self.assertTrue(allocations.get(kind), kind)
+    
+    def get_allocations(self, name, **url_kwargs):
+        def serialize(link, state):
+            for item in state.get_resource_items():
+                item.form
+                item.links.get_item_outbound_links()
+            state.links.get_outbound_links()
+            state.links.get_filter_links()
+            return HttpResponse()
+        
+        api_request = self.get_api_request(url_kwargs=url_kwargs)
+        api_request.generate_response.side_effect = serialize
+        with count_allocations() as allocations:
+            endpoint = self.resource.endpoints[name].fork(api_request=api_request)
+            endpoint.dispatch_api(api_request)
+        return allocations
+    
+    def test_list_allocation_budget(self):
+        allocations = self.get_allocations('list')
+        self.assertAllocationBudget(allocations, {
+            'fork': 4,
+            'EndpointState': 3,
+            'LinkPrototype': 21,
+            'Link': 20,
+            'Form': User.objects.count() + 1,
+            'Namespace': 0,
+        })
+    
+    def test_detail_allocation_budget(self):
+        allocations = self.get_allocations('detail', pk=self.user.pk)
+        self.assertAllocationBudget(allocations, {
+            'fork': 4,
+            'EndpointState': 3,
+            'LinkPrototype': 21,
+            'Link': 2,
+            'Form': 1,
+            'Namespace': 0,
+        })
+    
+    def test_iter_resource_items(self):
+        api_request = self.get_api_request()
+        resource = self.resource.fork(api_request=api_request)
+        queryset = resource.get_primary_query()
+        with patch.object(resource, 'get_instances', return_value=queryset):
+            items = resource.iter_resource_items()
+            self.assertFalse(isinstance(items, list))
+            self.assertEqual([item.instance.pk for item in items], [user.pk for user in User.objects.all()])
+            self.assertEqual(queryset._result_cache, None)
+        
+        endpoint = resource.endpoints['list'].fork(api_request=api_request)
+        datatap = endpoint.get_datatap(instream=endpoint.iter_resource_items())
+        self.assertEqual(len(list(datatap)), User.objects.count())
+    
+    def test_lazy_item_links(self):
+        api_request = self.get_api_request()
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        item = endpoint.get_resource_item(self.user)
+        self.assertFalse(hasattr(item, '__dict__'))
+        self.assertEqual(item._links, None)
+        
+        links = item.links
+        self.assertTrue(links is item.links)
+        self.assertTrue(links.get_item_outbound_links() is not None)
+    
+    def test_phase_timings(self):
+        endpoint_phase.connect(timing_collector)
+        try:
+            api_request = self.get_api_request()
+            endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+            endpoint.dispatch_api(api_request)
+            
+            url_name = endpoint.get_url_name()
+            phases = [entry['phase'] for entry in timing_collector.get_report() if entry['url_name'] == url_name]
+            for phase in ('dispatch', 'initialize_state', 'common_state', 'permission_check', 'handler', 'normalize_response'):
+                self.assertTrue(phase in phases, phase)
+            
+            stdout = StringIO()
+            call_command('hyperadmin_timings', url_name, phase='dispatch', reset=True, stdout=stdout)
+            self.assertTrue(url_name in stdout.getvalue())
+            self.assertEqual(timing_collector.get_report(), [])
+        finally:
+            endpoint_phase.disconnect(timing_collector)
+    
+    def test_percentile(self):
+        self.assertEqual(percentile(range(1, 101), 50), 50)
+        self.assertEqual(percentile(range(1, 101), 7), 7)
+        self.assertEqual(percentile(range(10, 0, -1), 90), 9)
+        self.assertEqual(percentile(range(1, 11), 100), 10)
+        self.assertEqual(percentile([3], 0), 3)
+        self.assertEqual(percentile([], 50), None)
+    
+    def test_index_definitions_are_not_rebuilt(self):
+        api_request = self.get_api_request(params={'is_staff__exact': '1'})
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        with patch.object(UserResource, 'get_indexes', side_effect=AssertionError('indexes rebuilt')):
+            endpoint.dispatch_api(api_request)
+        
+        state = api_request.generate_response.call_args[1]['state']
+        self.assertTrue(state['index'].filters[1].is_active())
+        definition = self.resource._index_definitions['filter']
+        self.assertFalse(definition.filters[1].is_active())
+    
+    def get_date_hierarchy_links(self, **params):
+        api_request = self.get_api_request(params=params)
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        return [link for link in state.links.get_filter_links()
+                if link.cl_headers.get('group') == 'date joined']
+    
+    def test_date_hierarchy(self):
+        User.objects.create(username='joined1', date_joined=datetime.datetime(2001, 2, 3))
+        User.objects.create(username='joined2', date_joined=datetime.datetime(2001, 2, 4))
+        User.objects.create(username='joined3', date_joined=datetime.datetime(2001, 5, 1))
+        
+        links = self.get_date_hierarchy_links()
+        counts = dict([(link.prompt, link.cl_headers['count']) for link in links])
+        self.assertEqual(counts['2001'], 3)
+        
+        links = self.get_date_hierarchy_links(date_joined__year='2001')
+        self.assertEqual(links[0].prompt, 'All dates')
+        counts = dict([(link.prompt, link.cl_headers['count']) for link in links[1:]])
+        self.assertEqual(counts, {'February 2001': 2, 'May 2001': 1})
+        self.assertTrue('date_joined__month=2' in links[1].get_absolute_url())
+        
+        links = self.get_date_hierarchy_links(date_joined__year='2001', date_joined__month='2')
+        self.assertEqual(links[0].prompt, '2001')
+        self.assertEqual([link.cl_headers['count'] for link in links[1:]], [1, 1])
+    
+    def test_sortable_list(self):
+        User.objects.get_or_create(username='aardvark', email='zz@example.com')
+        self.assertEqual([name for name, prompt in self.resource.get_sortable_fields()], ['username', 'email'])
+        
+        api_request = self.get_api_request(params={'o': '-username,password'})
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        with patch.object(ModelIndex, 'on_unindexed_ordering') as on_unindexed_ordering:
+            endpoint.dispatch_api(api_request)
+            state = api_request.generate_response.call_args[1]['state']
+            usernames = [item.instance.username for item in state.get_resource_items()]
+        self.assertEqual(usernames, list(User.objects.order_by('-username').values_list('username', flat=True)))
+        self.assertFalse(on_unindexed_ordering.called)
+        
+        sort_links = [link for link in state.links.get_filter_links() if link.rel == 'sortby']
+        self.assertEqual(len(sort_links), 2)
+        self.assertTrue('sorted' in sort_links[0].classes)
+        self.assertTrue('o=username' in sort_links[0].get_absolute_url())
+        self.assertTrue('o=email%2C-username' in sort_links[1].get_absolute_url())
+        
+        api_request = self.get_api_request(params={'o': 'email'})
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        with patch.object(ModelIndex, 'on_unindexed_ordering') as on_unindexed_ordering:
+            endpoint.dispatch_api(api_request)
+        on_unindexed_ordering.assert_called_once_with(['email'])
+        
+        with patch('hyperadmin.resources.models.indexes.logging') as logging_module:
+            self.resource.get_index('filter').on_unindexed_ordering(['email'])
+            self.resource.get_index('filter').on_unindexed_ordering(['email'])
+        self.assertEqual(logging_module.getLogger.return_value.warning.call_count, 1)
+    
     def test_get_detail(self):
         instance = self.user
         api_request = self.get_api_request(url_kwargs={'pk':instance.pk})
@@ -163,6 +378,317 @@ class ModelResourceTestCase(ResourceTestCase):
         self.assertTrue(state.item)
         self.assertEqual(state.item.instance, instance)
 
+class LogEntryResource(ModelResource):
+    date_hierarchy = 'user__date_joined'
+
+class RelatedDateHierarchyTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(LogEntry, LogEntryResource, app_name='admin')
+        return self.site.registry[LogEntry]
+    
+    def tearDown(self):
+        LogEntry.objects.filter(object_repr='hierarchy').delete()
+        super(RelatedDateHierarchyTestCase, self).tearDown()
+    
+    def test_related_date_hierarchy(self):
+        user = User.objects.create(username='joinedrelated', date_joined=datetime.datetime(1999, 3, 4))
+        for entry_user in (user, user, self.user):
+            LogEntry.objects.create(user=entry_user, action_flag=1, object_repr='hierarchy')
+        
+        api_request = self.get_api_request(params={'user__date_joined__year': '1999'})
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        links = [link for link in state.links.get_filter_links()
+                 if link.cl_headers.get('group') == 'date joined']
+        counts = dict([(link.prompt, link.cl_headers['count']) for link in links[1:]])
+        self.assertEqual(counts, {'March 1999': 2})
+
+class CachedFilterUserResource(ModelResource):
+    list_filter = ['last_name']
+
+class FilterChoicesCacheTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(User, CachedFilterUserResource, app_name='auth')
+        return self.site.registry[User]
+    
+    def get_filter_prompts(self):
+        api_request = self.get_api_request()
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        return [link.prompt for link in state.links.get_filter_links()]
+    
+    def test_choices_cached_until_resource_event(self):
+        User.objects.create(username='cacheduser', last_name='Cached')
+        self.assertTrue('Cached' in self.get_filter_prompts())
+        
+        User.objects.create(username='staleuser', last_name='Stale')
+        self.assertFalse('Stale' in self.get_filter_prompts())
+        
+        self.resource.emit_event('create', item_list=[])
+        self.assertTrue('Stale' in self.get_filter_prompts())
+
+class FacetUserResource(ModelResource):
+    list_filter = ['is_staff', 'last_name']
+    list_filter_facets = True
+    list_filter_cache_timeout = 0
+
+class FacetCountsTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(User, FacetUserResource, app_name='auth')
+        return self.site.registry[User]
+    
+    def get_facet_counts(self, **params):
+        api_request = self.get_api_request(params=params)
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        return dict([((link.cl_headers['group'], link.prompt), link.cl_headers.get('count'))
+                     for link in state.links.get_filter_links() if link.rel == 'filter'])
+    
+    def test_facet_counts(self):
+        User.objects.create(username='faceted1', last_name='Faceted', is_staff=True)
+        User.objects.create(username='faceted2', last_name='Faceted', is_staff=False)
+        total = User.objects.count()
+        staff = User.objects.filter(is_staff=True).count()
+        
+        counts = self.get_facet_counts()
+        self.assertEqual(counts[('staff status', 'All')], total)
+        self.assertEqual(counts[('staff status', 'Yes')], staff)
+        self.assertEqual(counts[('last name', 'Faceted')], 2)
+        
+        counts = self.get_facet_counts(is_staff__exact='1')
+        self.assertEqual(counts[('staff status', 'No')], total - staff)
+        self.assertEqual(counts[('last name', 'Faceted')], 1)
+
+class FullTextUserResource(ModelResource):
+    search_fields = ['username', 'email']
+    search_backend_class = SQLiteFTSSearchBackend
+
+class SearchBackendTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(User, FullTextUserResource, app_name='auth')
+        return self.site.registry[User]
+    
+    def search(self, query):
+        api_request = self.get_api_request(params={'q': query})
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        return [item.instance for item in state.get_resource_items()]
+    
+    def test_full_text_search(self):
+        first = User.objects.create(username='searchable', email='other@example.com')
+        second = User.objects.create(username='searchable2', email='searchable@example.com')
+        call_command('hyperadmin_searchindex', 'auth.user', site=self.site, stdout=StringIO())
+        
+        results = self.search('searchable')
+        self.assertEqual(set(results), set([first, second]))
+        self.assertEqual(results[0], second)
+        
+        second.email = 'changed@example.com'
+        second.save()
+        self.resource.get_search_backend().update_index([second])
+        self.assertEqual(self.search('changed'), [second])
+    
+    def test_relevance_precedes_default_ordering(self):
+        first = User.objects.create(username='relevant', email='other@example.com')
+        second = User.objects.create(username='relevant2', email='relevant@example.com')
+        call_command('hyperadmin_searchindex', 'auth.user', site=self.site, stdout=StringIO())
+        
+        with patch.object(FullTextUserResource, 'ordering', ['username']):
+            self.assertEqual(self.search('relevant'), [second, first])
+
+class SearchAvailabilityTestCase(unittest.TestCase):
+    def test_missing_index_is_remembered(self):
+        from hyperadmin.resources.models import search
+        backend = SQLiteFTSSearchBackend(MagicMock(resource_adaptor=Permission), ['name'])
+        introspection = connections['default'].introspection
+        search.REPORTED_MISSING_INDEXES.discard(('default', backend.get_table_name()))
+        
+        with patch('hyperadmin.resources.models.search.time') as time_module:
+            time_module.time.return_value = 1000.0
+            with patch.object(introspection, 'table_names', wraps=introspection.table_names) as table_names:
+                with patch.object(backend, 'get_logger') as get_logger:
+                    self.assertFalse(backend.is_available('default'))
+                    self.assertFalse(backend.is_available('default'))
+                    self.assertEqual(table_names.call_count, 1)
+                    
+                    time_module.time.return_value = 1000.0 + backend.unavailable_timeout
+                    self.assertFalse(backend.is_available('default'))
+                    self.assertEqual(table_names.call_count, 2)
+                    self.assertEqual(get_logger.return_value.warning.call_count, 1)
+                    
+                    backend.build_index()
+                    self.assertTrue(backend.is_available('default'))
+                    self.assertEqual(table_names.call_count, 2)
+
+class FullTextGroupResource(ModelResource):
+    search_fields = ['name']
+    search_backend_class = SQLiteFTSSearchBackend
+
+class SearchIndexHooksTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(Group, FullTextGroupResource, app_name='auth')
+        return self.site.registry[Group]
+    
+    def submit(self, endpoint_name, data=None, **url_kwargs):
+        api_request = self.get_api_request(url_kwargs=url_kwargs, payload={'data': data or {}}, method='POST')
+        endpoint = self.resource.endpoints[endpoint_name].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+    
+    def search(self, query):
+        api_request = self.get_api_request(params={'q': query})
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        return [item.instance.name for item in state.get_resource_items()]
+    
+    def test_endpoints_update_index(self):
+        call_command('hyperadmin_searchindex', 'auth.group', site=self.site, stdout=StringIO())
+        
+        self.submit('list', {'name': 'indexedgroup'})
+        group = Group.objects.get(name='indexedgroup')
+        self.assertEqual(self.search('indexedgroup'), ['indexedgroup'])
+        
+        self.submit('detail', {'name': 'renamedgroup'}, pk=group.pk)
+        self.assertEqual(self.search('indexedgroup'), [])
+        self.assertEqual(self.search('renamedgroup'), ['renamedgroup'])
+        
+        self.submit('delete', pk=group.pk)
+        self.assertFalse(Group.objects.filter(pk=group.pk).exists())
+        backend = self.resource.get_search_backend()
+        cursor = connections['default'].cursor()
+        cursor.execute('SELECT COUNT(*) FROM %s WHERE rowid = %%s' % backend.get_table_name(), [group.pk])
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+class PermissionResource(ModelResource):
+    list_display = ['name', 'content_type', 'content_type__app_label']
+
+class RelatedLookupsTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(Permission, PermissionResource, app_name='auth')
+        return self.site.registry[Permission]
+    
+    def count_list_queries(self, per_page):
+        api_request = self.get_api_request()
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        with patch.object(PermissionResource, 'list_per_page', per_page):
+            with count_queries() as queries:
+                endpoint.dispatch_api(api_request)
+                state = api_request.generate_response.call_args[1]['state']
+                items = state.get_resource_items()
+                for item in items:
+                    item.get_prompt()
+                    item.form
+        self.assertEqual(len(items), per_page)
+        return len(queries)
+    
+    def test_related_lookups(self):
+        self.assertEqual(self.resource.get_related_lookups(), (['content_type'], []))
+    
+    def test_forks_share_related_lookups(self):
+        related_lookups = self.resource._related_lookups
+        search_backend = self.resource._search_backend
+        self.assertEqual(related_lookups, (['content_type'], []))
+        self.assertTrue(search_backend is not None)
+        
+        fork = self.resource.fork(api_request=self.get_api_request())
+        self.assertTrue(fork.get_related_lookups() is related_lookups)
+        self.assertTrue(fork.get_search_backend() is search_backend)
+    
+    def test_constant_queries_per_page(self):
+        self.assertEqual(self.count_list_queries(1), self.count_list_queries(10))
+
+class BulkImportGroupResource(ModelResource):
+    bulk_import = True
+    bulk_import_chunk_size = 2
+
+class FullTextBulkImportGroupResource(BulkImportGroupResource):
+    search_fields = ['name']
+    search_backend_class = SQLiteFTSSearchBackend
+
+class BulkImportTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(Group, BulkImportGroupResource, app_name='auth')
+        return self.site.registry[Group]
+    
+    def tearDown(self):
+        Group.objects.filter(name__startswith='bulk-').delete()
+        super(BulkImportTestCase, self).tearDown()
+    
+    def import_rows(self, rows):
+        events = list()
+        def receiver(sender, event, item_list, **kwargs):
+            events.append((event, [item.instance.pk for item in item_list]))
+        resource_event.connect(receiver)
+        try:
+            report = self.resource.import_rows(iter(rows))
+        finally:
+            resource_event.disconnect(receiver)
+        return report, events
+    
+    def test_import_rows(self):
+        existing = Group.objects.create(name='bulk-existing')
+        rows = [{'name': 'bulk-1'},
+                {'fields': {'name': 'bulk-2'}},
+                {'name': 'x' * 81},
+                {'name': 'bulk-existing'},
+                {'name': 'bulk-3'},
+                {'pk': existing.pk, 'fields': {'name': 'bulk-renamed'}},]
+        report, events = self.import_rows(rows)
+        
+        self.assertEqual(report['imported'], 3)
+        self.assertEqual(report['updated'], 0)
+        self.assertEqual(report['chunks'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 5])
+        self.assertTrue('name' in report['errors'][0]['errors'])
+        self.assertEqual([event for event, pks in events], ['create', 'create'])
+        self.assertFalse(None in sum([pks for event, pks in events], []))
+        names = Group.objects.filter(name__startswith='bulk-').values_list('name', flat=True)
+        self.assertEqual(sorted(names), ['bulk-1', 'bulk-2', 'bulk-3', 'bulk-existing'])
+    
+    def test_upsert_rows(self):
+        existing = Group.objects.create(name='bulk-existing')
+        rows = [{'pk': existing.pk, 'fields': {'name': 'bulk-renamed'}},
+                {'name': 'bulk-1'},
+                {'name': 'bulk-2'},]
+        with patch.object(BulkImportGroupResource, 'bulk_import_upsert', True):
+            report, events = self.import_rows(rows)
+        
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(report['updated'], 1)
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(events, [('create', [Group.objects.get(name='bulk-1').pk]), ('update', [existing.pk]),
+                                  ('create', [Group.objects.get(name='bulk-2').pk])])
+        self.assertEqual(Group.objects.get(pk=existing.pk).name, 'bulk-renamed')
+    
+    def test_import_updates_index(self):
+        site = ResourceSite()
+        site.register(Group, FullTextBulkImportGroupResource, app_name='auth')
+        resource = site.registry[Group]
+        call_command('hyperadmin_searchindex', 'auth.group', site=site, stdout=StringIO())
+        resource.import_rows(iter([{'name': 'bulk-%s' % index} for index in range(3)]))
+        
+        backend = resource.get_search_backend()
+        cursor = connections['default'].cursor()
+        cursor.execute('SELECT COUNT(*) FROM %s WHERE %s MATCH %%s' %
+                       (backend.get_table_name(), backend.get_table_name()), ['bulk'])
+        self.assertEqual(cursor.fetchone()[0], 3)
+    
+    def test_post_list_imports_rows(self):
+        payload = json.dumps([{'name': 'bulk-%s' % index} for index in range(5)])
+        request = self.factory.post('/', data=payload, content_type='application/json')
+        api_request = HTTPAPIRequest(request=request, site=self.site, url_args=[], url_kwargs={})
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        
+        response = endpoint.dispatch_api(api_request)
+        
+        report = json.loads(response.content)
+        self.assertEqual(report, {'imported': 5, 'updated': 0, 'chunks': 3, 'errors': []})
+        self.assertEqual(Group.objects.filter(name__startswith='bulk-').count(), 5)
+
 class InlineModelResourceTestCase(ResourceTestCase):
     def setUp(self):
         super(InlineModelResourceTestCase, self).setUp()
@@ -280,6 +806,34 @@ class SiteResourceTestCase(ResourceTestCase):
         
         self.assertTrue(state.get_resource_items())
     
+    def get_listing(self):
+        api_request = self.get_api_request()
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        listing = list()
+        for item in state.get_resource_items():
+            links = [(link.get_absolute_url(), link.prompt) for link in item.links.get_item_outbound_links()]
+            listing.append((item.get_prompt(), item.get_absolute_url(), item.get_form().initial, links))
+        return listing
+    
+    def test_listing_cache(self):
+        with patch.object(ResourceDirectory, 'listing_cache_size', 0):
+            with count_allocations() as uncached_counter:
+                uncached = self.get_listing()
+        self.assertEqual(self.get_listing(), uncached)
+        
+        with count_allocations() as counter:
+            self.assertEqual(self.get_listing(), uncached)
+        #the listed endpoints are not forked
+        self.assertEqual(counter['fork'], uncached_counter['fork'] - 2)
+        self.assertTrue(counter['LinkPrototype'] < uncached_counter['LinkPrototype'])
+        
+        #registering into an application clears the listing of the site
+        self.assertTrue(self.resource._listing_cache)
+        self.site.register(Group, ModelResource, app_name='auth')
+        self.assertFalse(self.resource._listing_cache)
+    
     def test_url_stability_after_fork(self):
         api_request = self.get_api_request()
         bound_site = self.site.fork(api_request=api_request)
@@ -387,6 +941,181 @@ class StorageResourceTestCase(ResourceTestCase):
         #if not rel
         #self.assertTrue(link.form.errors)
 
+class QueryBudgetTestCase(QueryBudgetMixin, ResourceTestCase):
+    def register_resource(self):
+        self.site.register(User, UserResource, app_name='auth')
+        self.site.install_storage_resources()
+        self.storage_resource = self.site.applications['-storages'].resource_adaptor['media']
+        self.member = User.objects.get_or_create(username='budgetmember')[0]
+        return self.site.registry[User]
+    
+    def populate_users(self, rows):
+        for index in range(rows):
+            User.objects.get_or_create(username='budgetuser%s' % index)
+        return {'params': {'q': 'budgetuser'}}
+    
+    def populate_groups(self, rows):
+        for index in range(rows):
+            self.member.groups.add(Group.objects.get_or_create(name='budgetgroup%s' % index)[0])
+        return {'url_kwargs': {'pk': self.member.pk}}
+    
+    def populate_inline(self, rows):
+        kwargs = self.populate_groups(rows)
+        membership = GroupsInline.model.objects.filter(user=self.member)[0]
+        kwargs['url_kwargs']['inline_pk'] = membership.pk
+        return kwargs
+    
+    def populate_files(self, rows):
+        storage = self.storage_resource.resource_adaptor
+        for index in range(rows):
+            name = 'budget%s.txt' % index
+            if not storage.exists(name):
+                storage.save(name, ContentFile('budget'))
+        #the upload form builds absolute urls from the request
+        return {'request': self.factory.get('/')}
+    
+    def test_list(self):
+        self.assertConstantQueries(self.resource.endpoints['list'], self.populate_users)
+    
+    def test_add(self):
+        self.assertConstantQueries(self.resource.endpoints['add'], lambda rows: self.populate_groups(rows) and {})
+    
+    def test_detail(self):
+        self.assertConstantQueries(self.resource.endpoints['detail'], self.populate_groups)
+    
+    def test_delete(self):
+        self.assertConstantQueries(self.resource.endpoints['delete'], self.populate_groups)
+    
+    def test_inline_list(self):
+        inline = self.resource.inline_instances[0]
+        self.assertConstantQueries(inline.endpoints['list'], self.populate_groups)
+    
+    def test_inline_detail(self):
+        inline = self.resource.inline_instances[0]
+        self.assertConstantQueries(inline.endpoints['detail'], self.populate_inline)
+    
+    def test_storage_list(self):
+        self.assertConstantQueries(self.storage_resource.endpoints['list'], self.populate_files)
+    
+    def test_storage_upload(self):
+        self.assertConstantQueries(self.storage_resource.endpoints['upload'], self.populate_files)
+
+class ProfileResourceTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.directory = tempfile.mkdtemp()
+        self.site.profiler = RequestProfiler(sample_rate=1, storage=PrivateFileSystemStorage(location=self.directory))
+        self.site.install_profile_resource()
+        return self.site.applications['-storages'].resource_adaptor['profiles']
+    
+    def tearDown(self):
+        super(ProfileResourceTestCase, self).tearDown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def test_sampled_profile(self):
+        result = self.site.profiler.profile('sample', sum, [1, 2])
+        self.assertEqual(result, 3)
+        dirs, files = self.site.profiler.storage.listdir('')
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith('sample-'))
+        stats = pstats.Stats(os.path.join(self.directory, files[0]))
+        self.assertTrue(stats.total_calls)
+    
+    def test_threshold(self):
+        profiler = RequestProfiler(sample_rate=0, threshold=60, storage=self.site.profiler.storage)
+        profiler.profile('fast', sum, [1, 2])
+        self.assertEqual(profiler.storage.listdir('')[1], [])
+    
+    def test_read_only_listing(self):
+        self.site.profiler.profile('sample', sum, [1, 2])
+        
+        api_request = self.get_api_request()
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        state = api_request.generate_response.call_args[1]['state']
+        
+        self.assertEqual(len(state.get_resource_items()), 1)
+        self.assertFalse(self.resource.has_create_permission())
+        self.assertEqual([link for link in state.links.get_outbound_links() if link.rel == 'upload-link'], [])
+        item_links = self.resource.get_item_outbound_links(state.get_resource_items()[0])
+        self.assertEqual([link for link in item_links if link.rel == 'storage-url'], [])
+    
+    def test_default_storage_is_not_served(self):
+        from django.conf import settings
+        storage = RequestProfiler().get_storage()
+        self.assertFalse(os.path.abspath(storage.location).startswith(os.path.abspath(settings.MEDIA_ROOT or '/nonexistent')))
+        self.assertRaises(NotImplementedError, storage.url, 'sample.prof')
+
+class MetricsResourceTestCase(ResourceTestCase):
+    def setUp(self):
+        super(MetricsResourceTestCase, self).setUp()
+        metrics.reset()
+        self.directory = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        super(MetricsResourceTestCase, self).tearDown()
+        metrics.reset()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def register_resource(self):
+        self.site.register(User, UserResource, app_name='auth')
+        return self.site.install_metrics_resource()
+    
+    def test_request_metrics(self):
+        with patch.object(app_settings, 'METRICS', True):
+            api_request = self.get_api_request()
+            endpoint = self.site.registry[User].endpoints['list'].fork(api_request=api_request)
+            endpoint.dispatch_api(api_request)
+            
+            api_request = self.get_api_request()
+            endpoint = self.resource.endpoints['metrics'].fork(api_request=api_request)
+            response = endpoint.dispatch_api(api_request)
+        
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertFalse(api_request.generate_response.called)
+        self.assertTrue('# TYPE hyperadmin_requests_total counter' in response.content)
+        self.assertTrue('hyperadmin_requests_total{endpoint="admin_auth_user_list",method="GET",media_type="text/html",status="200"} 1' in response.content)
+        self.assertTrue('hyperadmin_request_duration_seconds_bucket{endpoint="admin_auth_user_list",method="GET",le="+Inf"} 1' in response.content)
+        self.assertTrue('hyperadmin_response_size_bytes_count{endpoint="admin_auth_user_list",media_type="text/html"} 1' in response.content)
+    
+    def test_multiprocess_aggregation(self):
+        registries = list()
+        for pid in (1, 2):
+            registry = MetricsRegistry(directory=self.directory)
+            registry.get_process_path = lambda pid=pid: os.path.join(self.directory, 'host-%s.metrics' % pid)
+            counter = registry.counter('test_total', 'Test counter', ['endpoint'])
+            histogram = registry.histogram('test_seconds', 'Test histogram', buckets=(1, 2))
+            counter.inc(endpoint='list')
+            histogram.observe(1.5)
+            registry.flush()
+            registries.append(registry)
+        
+        exposition = registries[0].render()
+        self.assertTrue('test_total{endpoint="list"} 2' in exposition)
+        self.assertTrue('test_seconds_bucket{le="1"} 0' in exposition)
+        self.assertTrue('test_seconds_bucket{le="2"} 2' in exposition)
+        self.assertTrue('test_seconds_sum 3.0' in exposition)
+    
+    def test_exited_process_gauges(self):
+        import socket
+        import subprocess
+        import sys
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        registries = list()
+        for pid in (os.getpid(), exited.pid):
+            registry = MetricsRegistry(directory=self.directory)
+            registry.get_process_path = lambda pid=pid: os.path.join(self.directory, '%s-%s.metrics' % (socket.gethostname(), pid))
+            registry.counter('test_total', 'Test counter').inc()
+            registry.gauge('test_connections', 'Test gauge').set(3)
+            registry.flush()
+            registries.append(registry)
+        
+        self.assertFalse(registries[0].is_process_alive(registries[1].get_process_path()))
+        exposition = registries[0].render()
+        self.assertTrue('test_total 2' in exposition)
+        self.assertTrue('test_connections 3' in exposition)
+        self.assertTrue('# TYPE test_connections gauge' in exposition)
+
 class AuthenticationResourceTestCase(ResourceTestCase):
     def register_resource(self):
         return self.site.auth_resource
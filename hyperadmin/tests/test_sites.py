@@ -1,8 +1,30 @@
+import os
+import subprocess
+import sys
+import threading
+
 from django.utils import unittest
 from django.contrib import admin
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
 
+import hyperadmin
 from hyperadmin import get_api
-from hyperadmin.sites import ResourceSite, site
+from hyperadmin.resources.models import ModelResource
+from hyperadmin.sites import LazyResource, ResourceSite, site
+from hyperadmin.throttle import Throttle
+from hyperadmin.tests.common import GenericURLResolver
+
+from mock import MagicMock, patch
+
+def get_url_names(urlpatterns):
+    names = list()
+    for pattern in urlpatterns:
+        if hasattr(pattern, 'url_patterns'):
+            names.extend(get_url_names(pattern.url_patterns))
+        else:
+            names.append(pattern.name)
+    return names
 
 class SiteTestCase(unittest.TestCase):
     def test_install_from_admin_site(self):
@@ -12,8 +34,401 @@ class SiteTestCase(unittest.TestCase):
         site.install_models_from_site(admin.site)
         
         self.assertTrue(site.registry)
+        self.assertFalse(site.lazy_resources)
+        self.assertFalse([resource for resource in site.registry.values() if isinstance(resource, LazyResource)])
+    
+    def test_lazy_install_from_admin_site(self):
+        site = ResourceSite()
+        admin.autodiscover()
+        site.install_models_from_site(admin.site, lazy=True)
+        
+        self.assertTrue(site.lazy_resources)
+        self.assertTrue(all([isinstance(resource, LazyResource) for resource in site.registry.values()]))
+        site.get_urls()
+        self.assertFalse(site.lazy_resources)
+        self.assertFalse([resource for resource in site.registry.values() if isinstance(resource, LazyResource)])
+    
+    def test_lazy_autoload_setting(self):
+        admin.autodiscover()
+        site = ResourceSite()
+        with patch('hyperadmin.app_settings.LAZY_AUTOLOAD', True):
+            site.install_models_from_site(admin.site)
+        
+        self.assertTrue(site.lazy_resources)
+    
+    def test_autoload_report(self):
+        admin.autodiscover()
+        report = ResourceSite().install_models_from_site(admin.site)
+        self.assertEqual(len(report), len(admin.site._registry))
+        for entry in report:
+            self.assertEqual(entry['error'], None)
+            self.assertTrue(entry['duration'] >= 0)
+        
+        class BrokenAdmin(object):
+            pass
+        
+        admin_site = MagicMock()
+        admin_site._registry = {User: BrokenAdmin()}
+        report = ResourceSite().install_models_from_site(admin_site)
+        self.assertEqual(report[0]['model'], 'auth.User')
+        self.assertTrue(report[0]['error'])
+    
+    def test_autoload_report_materialization(self):
+        from django.contrib.auth.models import Permission
+        
+        class PermissionInline(admin.TabularInline):
+            model = Permission
+        
+        class UserAdmin(admin.ModelAdmin):
+            inlines = [PermissionInline]
+        
+        class BrokenGroupAdmin(admin.ModelAdmin):
+            fieldsets = [('Broken', {})]
+        
+        admin_site = admin.AdminSite()
+        admin_site.register(User, UserAdmin)
+        admin_site.register(Group, BrokenGroupAdmin)
+        site = ResourceSite()
+        report = site.install_models_from_site(admin_site, lazy=True)
+        entries = dict([(entry['model'], entry) for entry in report])
+        for entry in report:
+            self.assertEqual(entry['error'], None)
+            self.assertEqual(entry['materialize_duration'], None)
+        
+        site.warm_urls()
+        user_entry, group_entry = entries['auth.User'], entries['auth.Group']
+        self.assertEqual(user_entry['error'], None)
+        self.assertTrue(user_entry['materialize_duration'] >= 0)
+        self.assertEqual(len(user_entry['inline_errors']), 1)
+        self.assertTrue('ForeignKey' in user_entry['inline_errors'][0])
+        self.assertTrue('KeyError' in group_entry['error'])
+        self.assertTrue(group_entry['materialize_duration'] >= 0)
+    
+    def test_autoload_memoizes_classes(self):
+        admin.autodiscover()
+        first_site = ResourceSite()
+        first_site.install_models_from_site(admin.site, lazy=True)
+        second_site = ResourceSite()
+        second_site.install_models_from_site(admin.site, lazy=False)
+        
+        first_resource = first_site.registry[User].materialize()
+        second_resource = second_site.registry[User]
+        self.assertTrue(type(first_resource) is type(second_resource))
+        self.assertEqual(first_resource.inlines, second_resource.inlines)
+    
+    def test_lazy_autoload_skips_failing_inlines(self):
+        from django.contrib.auth.models import Permission
+        
+        class PermissionInline(admin.TabularInline):
+            model = Permission
+        
+        class UserAdmin(admin.ModelAdmin):
+            inlines = [PermissionInline]
+        
+        admin_site = admin.AdminSite()
+        admin_site.register(User, UserAdmin)
+        admin_site.register(Group)
+        site = ResourceSite()
+        site.install_models_from_site(admin_site, lazy=True)
+        
+        self.assertTrue('admin_auth_user_list' in get_url_names(site.get_urls()))
+        resource = site.registry[User]
+        self.assertEqual(resource.inlines, [])
+        self.assertEqual(resource.inline_instances, [])
+        self.assertEqual(resource.fork().inline_instances, [])
+    
+    def test_lazy_register_failing_resource(self):
+        class BrokenResource(ModelResource):
+            def post_register(self):
+                raise ValueError('broken')
+        
+        site = ResourceSite()
+        site.register(User, BrokenResource, app_name='auth', lazy=True)
+        site.register(Group, ModelResource, app_name='auth', lazy=True)
+        
+        url_names = get_url_names(site.get_urls())
+        self.assertTrue('admin_auth_group_list' in url_names)
+        self.assertFalse('admin_auth_user_list' in url_names)
+        self.assertFalse(User in site.registry)
+        self.assertFalse('user' in site.applications['auth'].resource_adaptor)
+        self.assertFalse(site.lazy_resources)
+        
+        site = ResourceSite()
+        resource = site.register(User, BrokenResource, app_name='auth', lazy=True)
+        site.materialize_resources()
+        self.assertFalse(User in site.registry)
+        self.assertRaises(ValueError, resource.materialize)
+    
+    def test_lazy_register(self):
+        site = ResourceSite()
+        resource = site.register(User, ModelResource, app_name='auth', lazy=True)
+        self.assertTrue(isinstance(resource, LazyResource))
+        self.assertEqual(resource._lazy_resource, None)
+        self.assertTrue(site.applications['auth'].resource_adaptor['user'] is resource)
+        
+        endpoint = site.get_endpoint_from_urlname('admin_auth_user_list')
+        materialized = site.registry[User]
+        self.assertFalse(isinstance(materialized, LazyResource))
+        self.assertTrue(resource._lazy_resource is materialized)
+        self.assertTrue(endpoint.resource is materialized)
+        self.assertTrue(site.applications['auth'].resource_adaptor['user'] is materialized)
+        self.assertEqual(resource.get_url_name(), materialized.get_url_name())
+    
+    def test_memoized_urls(self):
+        site = ResourceSite()
+        site.register(User, ModelResource, app_name='auth')
+        urlpatterns = site.urlpatterns
+        self.assertTrue(site.urlpatterns is urlpatterns)
+        self.assertTrue(site.fork().urlpatterns is urlpatterns)
+        
+        site.register(Group, ModelResource, app_name='auth')
+        self.assertFalse(site.urlpatterns is urlpatterns)
+        self.assertTrue('admin_auth_group_list' in get_url_names(site.urlpatterns))
+        self.assertEqual(str(site.urlpatterns), str(site.get_urls()))
+    
+    def test_dispatch_keeps_memoized_urls(self):
+        from django.test.client import RequestFactory
+        from hyperadmin.apirequests import InternalAPIRequest
+        from hyperadmin.resources.models import InlineModelResource
+        
+        class GroupsInline(InlineModelResource):
+            model = User.groups.through
+        
+        class UserResource(ModelResource):
+            inlines = [GroupsInline]
+        
+        site = ResourceSite()
+        site.register(User, UserResource, app_name='auth')
+        urlpatterns = site.urlpatterns
+        
+        user = User(is_superuser=True, is_staff=True, is_active=True)
+        api_request = InternalAPIRequest(site=site, user=user, request=RequestFactory().get('/'))
+        api_request.generate_response = MagicMock(return_value=None)
+        endpoint = site.registry[User].endpoints['list'].fork(api_request=api_request)
+        endpoint.dispatch_api(api_request)
+        self.assertTrue(endpoint.resource.inline_instances)
+        self.assertTrue(site.urlpatterns is urlpatterns)
+    
+    def test_warm_urls(self):
+        site = ResourceSite()
+        resource = site.register(User, ModelResource, app_name='auth', lazy=True)
+        urlpatterns = site.warm_urls()
+        self.assertFalse(site.lazy_resources)
+        self.assertTrue(resource._lazy_resource is site.registry[User])
+        self.assertTrue(site.urlpatterns is urlpatterns)
+        self.assertTrue('admin_auth_user_list' in get_url_names(urlpatterns))
+    
+    def test_default_sites_are_lazy(self):
+        script = 'import sys, hyperadmin; print repr(hyperadmin.site), "hyperadmin.mediatypes" in sys.modules'
+        process = subprocess.Popen([sys.executable, '-W', 'ignore', '-c', script],
+                                   stdout=subprocess.PIPE,
+                                   env=dict(os.environ, DJANGO_SETTINGS_MODULE='tests.test_settings'),
+                                   cwd=os.path.dirname(os.path.dirname(hyperadmin.__file__)))
+        output = process.communicate()[0].strip()
+        self.assertEqual(output, '<DefaultSite ResourceSite: not instantiated> False')
+    
+    def test_media_types_by_path(self):
+        from hyperadmin.mediatypes.json import JSON
+        site = ResourceSite()
+        site.register_media_type('application/json', 'hyperadmin.mediatypes.json.JSON')
+        self.assertEqual(site.media_types.keys(), ['application/json'])
+        self.assertTrue(site.media_types.get('application/json') is JSON)
+        self.assertTrue(site.fork().media_types['application/json'] is JSON)
+        self.assertEqual(site.media_types.get('text/html'), None)
+    
+    def test_media_types_registered_with_builtins(self):
+        from django.test.client import RequestFactory
+        from hyperadmin.apirequests import HTTPAPIRequest
+        from hyperadmin.mediatypes import BUILTIN_MEDIA_TYPES
+        from hyperadmin.mediatypes.json import JSON
+        
+        class VendorJSON(JSON):
+            recognized_media_types = ['application/vnd.vendor+json']
+        
+        site = ResourceSite()
+        site.register_builtin_media_types()
+        site.register(Group, ModelResource, app_name='auth')
+        self.assertFalse('application/vnd.vendor+json' in site.media_types)
+        VendorJSON.register_with_builtins()
+        try:
+            self.assertTrue(site.media_types['application/vnd.vendor+json'] is VendorJSON)
+            self.assertFalse(site.media_types['application/json'] is VendorJSON)
+            
+            request = RequestFactory().get('/', HTTP_ACCEPT='application/vnd.vendor+json')
+            request.user = User(is_superuser=True, is_staff=True, is_active=True)
+            api_request = HTTPAPIRequest(request=request, site=site, url_args=[], url_kwargs={})
+            self.assertTrue(isinstance(api_request.get_response_media_type(), VendorJSON))
+            endpoint = site.registry[Group].endpoints['list'].fork(api_request=api_request)
+            resolver = GenericURLResolver(r'^', site.get_urls())
+            with patch.object(ResourceSite, 'reverse', lambda self, name, *args, **kwargs: resolver.reverse(name, *args, **kwargs)):
+                response = endpoint.dispatch_api(api_request)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/vnd.vendor+json')
+        finally:
+            del BUILTIN_MEDIA_TYPES['application/vnd.vendor+json']
     
     def test_get_api(self):
         found_site = get_api('hyperadmin')
         self.assertEqual(found_site, site)
 
+
+class ThrottleTestCase(unittest.TestCase):
+    def setUp(self):
+        cache.clear()
+        self.throttle = Throttle(throttle_at=100, timeframe=60)
+    
+    def test_concurrent_limit(self):
+        now = 60 * 1000.0
+        results = list()
+        
+        def check():
+            for index in range(10):
+                results.append(self.throttle.get_rate('concurrent', now=now) > self.throttle.throttle_at)
+        
+        threads = [threading.Thread(target=check) for index in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(results), 300)
+        self.assertEqual(results.count(False), 100)
+    
+    def test_sliding_window(self):
+        start = 60 * 1000.0
+        for index in range(100):
+            self.assertTrue(self.throttle.get_rate('sliding', now=start) <= 100)
+        self.assertTrue(self.throttle.get_rate('sliding', now=start + 59) > 100)
+        #half of the previous window overlaps the sliding window
+        self.assertEqual(self.throttle.get_rate('sliding', now=start + 90), 51.5)
+    
+    def test_throttle_check(self):
+        api_request = MagicMock()
+        api_request.user.pk = 1
+        del api_request.site.get_throttle_link
+        endpoint = MagicMock()
+        endpoint.get_url_name.return_value = 'throttled'
+        self.throttle.throttle_at = 1
+        
+        self.assertEqual(self.throttle.throttle_check(api_request, endpoint), None)
+        self.assertEqual(self.throttle.throttle_check(api_request, endpoint).status_code, 429)
+    
+    def get_request(self, user_id=1, method='GET'):
+        api_request = MagicMock()
+        api_request.user.pk = user_id
+        api_request.method = method
+        del api_request.site.get_throttle_link
+        return api_request
+    
+    def get_endpoint(self, url_name, resource_name):
+        endpoint = MagicMock()
+        endpoint.get_url_name.return_value = url_name
+        endpoint.resource.get_url_name.return_value = resource_name
+        return endpoint
+    
+    def test_costs(self):
+        throttle = Throttle(throttle_at=10, timeframe=60, costs={'export:GET': 5, 'POST': 2})
+        export = self.get_endpoint('export', 'items')
+        
+        self.assertEqual(throttle.get_cost(self.get_request(), export), 5)
+        self.assertEqual(throttle.get_cost(self.get_request(method='POST'), export), 2)
+        self.assertEqual(throttle.get_cost(self.get_request(), self.get_endpoint('list', 'items')), 1)
+        
+        self.assertEqual(throttle.throttle_check(self.get_request(), export), None)
+        self.assertEqual(throttle.throttle_check(self.get_request(), export), None)
+        self.assertEqual(throttle.throttle_check(self.get_request(), export).status_code, 429)
+    
+    def test_hierarchical_limits(self):
+        throttle = Throttle(limits=[('user', 4, 60), ('resource', 3, 60)])
+        list_endpoint = self.get_endpoint('items_list', 'items')
+        detail_endpoint = self.get_endpoint('items_detail', 'items')
+        other_endpoint = self.get_endpoint('others_list', 'others')
+        
+        self.assertEqual(throttle.throttle_check(self.get_request(), list_endpoint), None)
+        self.assertEqual(throttle.throttle_check(self.get_request(), detail_endpoint), None)
+        self.assertEqual(throttle.throttle_check(self.get_request(), list_endpoint), None)
+        #the resource limit is shared by the endpoints of the resource
+        self.assertEqual(throttle.throttle_check(self.get_request(), detail_endpoint).status_code, 429)
+        self.assertEqual(throttle.throttle_check(self.get_request(user_id=2), detail_endpoint), None)
+        #the rejected request was not counted against the user limit
+        self.assertEqual(throttle.throttle_check(self.get_request(), other_endpoint), None)
+        self.assertEqual(throttle.throttle_check(self.get_request(), other_endpoint).status_code, 429)
+    
+    def test_rejected_requests(self):
+        api_request = self.get_request()
+        endpoint = self.get_endpoint('rejected', 'items')
+        now = 60 * 1000.0
+        key = Throttle().get_window_key(Throttle().get_identifier(api_request, endpoint), 1000)
+        
+        with patch('hyperadmin.throttle.time') as time_module:
+            time_module.time.return_value = now
+            throttle = Throttle(throttle_at=2, timeframe=60)
+            for index in range(5):
+                throttle.throttle_check(api_request, endpoint)
+            self.assertEqual(cache.get(key), 2)
+            
+            cache.clear()
+            throttle = Throttle(throttle_at=2, timeframe=60, charge_rejected=True)
+            for index in range(5):
+                throttle.throttle_check(api_request, endpoint)
+            self.assertEqual(cache.get(key), 5)
+    
+    def test_expiration(self):
+        self.assertEqual(Throttle(timeframe=60).get_timeout(), 120)
+        self.assertEqual(Throttle(timeframe=60, expiration=3600).get_timeout(), 3600)
+        self.assertEqual(Throttle(timeframe=60, expiration=10).get_timeout(), 120)
+    
+    def test_local_counters(self):
+        throttle = Throttle(throttle_at=100, timeframe=60, sync_interval=30, batch_size=5)
+        now = 60 * 1000.0
+        key = throttle.get_window_key('local', 1000)
+        
+        for index in range(5):
+            self.assertEqual(throttle.get_rate('local', now=now), index + 1)
+        #increments are held back until the batch is full
+        self.assertEqual(cache.get(key), 1)
+        throttle.get_rate('local', now=now)
+        self.assertEqual(cache.get(key), 6)
+        
+        #or until the sync interval elapsed
+        throttle.get_rate('local', now=now + 1)
+        self.assertEqual(cache.get(key), 6)
+        cache.incr(key, 10)
+        self.assertEqual(throttle.get_rate('local', now=now + 31), 18)
+        self.assertEqual(cache.get(key), 18)
+    
+    def test_local_counters_rollover(self):
+        throttle = Throttle(throttle_at=100, timeframe=60, sync_interval=30, batch_size=10)
+        api_request = self.get_request()
+        endpoint = self.get_endpoint('rollover', 'items')
+        identifier = throttle.get_identifier(api_request, endpoint)
+        start = 60 * 1000.0
+        for window in range(200):
+            with patch('hyperadmin.throttle.time') as time_module:
+                time_module.time.return_value = start + window * 60
+                for index in range(3):
+                    self.assertEqual(throttle.throttle_check(api_request, endpoint), None)
+            if window == 1:
+                #the increments held back are synced once the window rolls over
+                self.assertEqual(cache.get(throttle.get_window_key(identifier, 1000)), 3)
+        self.assertEqual(cache.get(throttle.get_window_key(identifier, 1198)), 3)
+        self.assertEqual(len(throttle.local_counters.counters), 1)
+        
+        throttle.local_counters.last_prune = 0
+        throttle.local_counters.prune(120, start + 203 * 60)
+        self.assertEqual(cache.get(throttle.get_window_key(identifier, 1199)), 3)
+        self.assertEqual(len(throttle.local_counters.counters), 0)
+    
+    def test_retry_after(self):
+        throttle = Throttle(throttle_at=10, timeframe=60)
+        now = 60 * 1000.0
+        self.assertEqual(throttle.get_retry_after(0, 11, 0.5, 10, 60), 36)
+        self.assertEqual(throttle.get_retry_after(10, 5, 0.25, 10, 60), 15)
+        
+        api_request = self.get_request()
+        endpoint = self.get_endpoint('retry', 'items')
+        for index in range(10):
+            throttle.throttle_check(api_request, endpoint)
+        response = throttle.throttle_check(api_request, endpoint)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 66)
@@ -1,54 +1,288 @@
+import math
+import threading
 import time
 from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
 from django.http import HttpResponse
 
+from hyperadmin.metrics import metrics, throttled_requests
+
 
 class BaseThrottle(object):
     def throttle_check(self, api_request, endpoint):
         return None
 
+    def get_throttle_response(self, api_request, endpoint, retry_after=None):
+        """
+        Returns the link or response of a throttled request
+        """
+        if metrics.enabled:
+            throttled_requests.inc(endpoint=endpoint.get_url_name())
+        if hasattr(api_request.site, 'get_throttle_link'):
+            return api_request.site.get_throttle_link()
+        response = HttpResponse(status=429)
+        if retry_after is not None:
+            response['Retry-After'] = str(retry_after)
+        return response
+
+class LocalCounters(object):
+    """
+    In process tier of the throttle counters. Increments are batched and
+    added to the cache once `batch_size` is pending or every `sync_interval`
+    seconds, reads of the cache are reused for `sync_interval` seconds.
+    Between syncs the counters miss the requests served by other processes.
+    Counters are synced one last time when they are retired or pruned.
+    """
+    def __init__(self, sync_interval=1, batch_size=10):
+        self.sync_interval = sync_interval
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.counters = dict()
+        self.reads = dict()
+        self.last_prune = time.time()
+
+    def increment(self, key, amount, sync, now, retired_key=None):
+        """
+        Adds the amount to the counter of the key and returns its estimated
+        value. sync is called with the key and the pending amount and returns
+        the value of the shared counter. The first increment of a key retires
+        the counter of retired_key, ie the counter of the previous window.
+        """
+        with self.lock:
+            is_new = key not in self.counters
+            # [shared value, pending amount, time of the last sync, sync]
+            entry = self.counters.setdefault(key, [0, 0, 0, sync])
+            entry[1] += amount
+            pending = None
+            if entry[1] >= self.batch_size or now - entry[2] >= self.sync_interval:
+                pending = entry[1]
+                entry[1] = 0
+                entry[2] = now
+            else:
+                value = entry[0] + entry[1]
+        if pending is not None:
+            value = sync(key, pending)
+            with self.lock:
+                entry[0] = value
+                value += entry[1]
+        if is_new and retired_key is not None:
+            self.retire(retired_key)
+        return value
+
+    def retire(self, key):
+        """
+        Forgets the counter of the key, syncing its pending amount
+        """
+        with self.lock:
+            entry = self.counters.pop(key, None)
+        if entry is not None and entry[1]:
+            entry[3](key, entry[1])
+
+    def read(self, key, get, now):
+        with self.lock:
+            if key in self.reads and now - self.reads[key][1] < self.sync_interval:
+                return self.reads[key][0]
+        value = get(key)
+        with self.lock:
+            self.reads[key] = (value, now)
+        return value
+
+    def prune(self, max_age, now):
+        """
+        Retires the counters not synced in max_age seconds
+        """
+        with self.lock:
+            if now - self.last_prune < max_age:
+                return
+            self.last_prune = now
+            stale_keys = [key for key, entry in self.counters.iteritems()
+                          if now - entry[2] > max_age]
+            for key, (value, read_at) in self.reads.items():
+                if now - read_at > max_age:
+                    del self.reads[key]
+        for key in stale_keys:
+            self.retire(key)
+
 class Throttle(BaseThrottle):
-    def __init__(self, throttle_at=150, timeframe=3600, expiration=None):
+    """
+    Limits the requests of a user with sliding window counters. Requests
+    are counted per fixed window with atomic cache increments and the count
+    of the previous window is weighted by how much it overlaps the sliding
+    window, so every limit takes two integers in the cache whatever the rate.
+
+    Increments are atomic with memcached. The local memory cache increments
+    with a get and a set, those are serialized with a lock.
+
+    :param throttle_at: the limit of each user per endpoint
+    :param timeframe: the window of the limit in seconds
+    :param limits: a list of (scope, throttle_at, timeframe) replacing the
+        default limit. Scopes are `user` for the requests of a user to the
+        site, `resource` for a user per resource and `endpoint` for a user
+        per endpoint.
+    :param costs: a dictionary weighting requests, keyed by
+        "url_name:METHOD", url name or method. Requests cost 1 otherwise.
+    :param expiration: seconds the counters are kept in the cache, at least
+        two windows
+    :param sync_interval: enables the in process tier, syncing the counters
+        with the cache at most every given seconds
+    :param batch_size: increments the in process tier may hold back
+    :param charge_rejected: count the requests that are throttled, clients
+        retrying while throttled then stay throttled. By default the cost of
+        a rejected request is taken back.
+    """
+    cache_prefix = 'hyperadmin-throttle'
+    local_counters_class = LocalCounters
+
+    def __init__(self, throttle_at=150, timeframe=3600, expiration=None,
+                 limits=None, costs=None, sync_interval=None, batch_size=10,
+                 charge_rejected=False):
         self.throttle_at = throttle_at
         # In seconds, please.
         self.timeframe = timeframe
-        
-        if expiration is None:
-            # Expire in a week.
-            expiration = 604800
-        
-        self.expiration = int(expiration)
-    
+        self.expiration = expiration
+        self.limits = limits
+        self.costs = costs or {}
+        self.charge_rejected = charge_rejected
+        self.lock = threading.Lock()
+        self.local_counters = None
+        if sync_interval:
+            self.local_counters = self.local_counters_class(sync_interval, batch_size)
+
     def throttle_check(self, api_request, endpoint):
         """
         Returns a link if the request should be throttled
         """
-        key = self.get_identifier(api_request, endpoint)
-        
-        # Make sure something is there.
-        cache.add(key, [])
-        
-        # Weed out anything older than the timeframe.
-        minimum_time = int(time.time()) - int(self.timeframe)
-        times_accessed = [access for access in cache.get(key) if access >= minimum_time]
-        
-        if len(times_accessed) >= int(self.throttle_at):
-            # Throttle them.
-            if hasattr(api_request.site, 'get_throttle_link'):
-                return api_request.site.get_throttle_link()
-            return HttpResponse(status=429)
-        
-        times_accessed.append(int(time.time()))
-        cache.set(key, times_accessed, self.expiration)
+        now = time.time()
+        cost = self.get_cost(api_request, endpoint)
+        retry_after = None
+        counted = list()
+        for scope, throttle_at, timeframe in self.get_limits():
+            identifier = self.get_scope_identifier(scope, api_request, endpoint)
+            previous, current, elapsed = self.get_window_counts(identifier, now, cost, timeframe)
+            counted.append((identifier, timeframe))
+            if previous * (1 - elapsed) + current > int(throttle_at):
+                wait = self.get_retry_after(previous, current, elapsed, throttle_at, timeframe)
+                retry_after = max(retry_after, wait)
+        if retry_after is not None and not self.charge_rejected:
+            for identifier, timeframe in counted:
+                self.refund(identifier, now, cost, timeframe)
+        if self.local_counters is not None:
+            self.local_counters.prune(max([limit[2] for limit in self.get_limits()]) * 2, now)
+        if retry_after is not None:
+            return self.get_throttle_response(api_request, endpoint, retry_after=retry_after)
         return None
-    
+
+    def get_limits(self):
+        if self.limits:
+            return self.limits
+        return [('endpoint', self.throttle_at, self.timeframe)]
+
+    def get_cost(self, api_request, endpoint):
+        url_name = endpoint.get_url_name()
+        method = api_request.method.upper()
+        for key in ('%s:%s' % (url_name, method), url_name, method):
+            if key in self.costs:
+                return self.costs[key]
+        return 1
+
+    def get_scope_identifier(self, scope, api_request, endpoint):
+        if scope == 'user':
+            return 'user_%s' % self.user_id(api_request)
+        if scope == 'resource':
+            resource = getattr(endpoint, 'resource', endpoint)
+            return '%s_%s' % (resource.get_url_name(), self.user_id(api_request))
+        return self.get_identifier(api_request, endpoint)
+
+    def get_window_key(self, identifier, window):
+        return '%s:%s:%s' % (self.cache_prefix, identifier, window)
+
+    def get_cache(self):
+        return cache
+
+    def increment(self, key, amount=1, timeframe=None):
+        """
+        Atomically increments the counter of the key and returns its value
+        """
+        backend = self.get_cache()
+        if isinstance(backend, LocMemCache):
+            with self.lock:
+                return self._increment(backend, key, amount, timeframe)
+        return self._increment(backend, key, amount, timeframe)
+
+    def get_timeout(self, timeframe=None):
+        return max(int(timeframe or self.timeframe) * 2, int(self.expiration or 0))
+
+    def _increment(self, backend, key, amount, timeframe):
+        timeout = self.get_timeout(timeframe)
+        if amount > 0 and backend.add(key, amount, timeout):
+            return amount
+        try:
+            return backend.incr(key, amount)
+        except ValueError:
+            # Expired, there is nothing to take back from an expired counter
+            if amount <= 0:
+                return 0
+            backend.add(key, amount, timeout)
+            return amount
+
+    def get_window_counts(self, identifier, now, cost=1, timeframe=None):
+        """
+        Counts the request and returns the count of the previous window, the
+        count of the current window and the elapsed fraction of the current window
+        """
+        timeframe = int(timeframe or self.timeframe)
+        window = int(now // timeframe)
+        elapsed = (now - window * timeframe) / float(timeframe)
+        current_key = self.get_window_key(identifier, window)
+        previous_key = self.get_window_key(identifier, window - 1)
+        if self.local_counters is not None:
+            sync = lambda key, amount: self.increment(key, amount, timeframe)
+            current = self.local_counters.increment(current_key, cost, sync, now, retired_key=previous_key)
+            previous = self.local_counters.read(previous_key, self.get_cache().get, now) or 0
+        else:
+            current = self.increment(current_key, cost, timeframe)
+            previous = self.get_cache().get(previous_key) or 0
+        return previous, current, elapsed
+
+    def refund(self, identifier, now, cost=1, timeframe=None):
+        """
+        Takes back the cost counted for a rejected request
+        """
+        timeframe = int(timeframe or self.timeframe)
+        key = self.get_window_key(identifier, int(now // timeframe))
+        if self.local_counters is not None:
+            sync = lambda key, amount: self.increment(key, amount, timeframe)
+            self.local_counters.increment(key, -cost, sync, now)
+        else:
+            self.increment(key, -cost, timeframe)
+
+    def get_rate(self, identifier, now=None, cost=1, timeframe=None):
+        """
+        Counts the request and returns the estimated number of requests in
+        the sliding window ending now
+        """
+        if now is None:
+            now = time.time()
+        previous, current, elapsed = self.get_window_counts(identifier, now, cost, timeframe)
+        return previous * (1 - elapsed) + current
+
+    def get_retry_after(self, previous, current, elapsed, throttle_at, timeframe):
+        """
+        Returns the seconds until the estimated rate is back under the limit
+        """
+        if current >= throttle_at:
+            # wait for the next window to weigh the current one down
+            fraction = (1 - elapsed) + (1 - float(throttle_at) / current)
+        else:
+            fraction = (1 - float(throttle_at - current) / previous) - elapsed
+        return max(1, int(math.ceil(fraction * timeframe)))
+
     def get_identifier(self, api_request, endpoint):
         return '%s_%s' % (endpoint.get_url_name(), self.user_id(api_request))
-    
+
     def user_id(self, api_request):
         if api_request.user:
             if hasattr(api_request.user, 'pk'):
                 return  api_request.user.pk
             return api_request.user
         return ''
-
@@ -1,3 +1,5 @@
+import time
+
 from django import http
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -5,6 +7,8 @@ from django.utils.cache import add_never_cache_headers
 from django.utils.translation import ugettext_lazy as _
 
 from hyperadmin.links import Link
+from hyperadmin.instrumentation import timed_phase
+from hyperadmin.metrics import metrics, internal_requests, record_request
 
 
 class ConditionalAccessMixin(object):
@@ -51,6 +55,9 @@ class EndpointViewMixin(ConditionalAccessMixin):
         assert not self.api_request
         api_request = self.create_apirequest(request=request, url_args=args, url_kwargs=kwargs)
         endpoint = api_request.get_endpoint(self.get_url_name())
+        profiler = getattr(self.site, 'profiler', None)
+        if profiler is not None:
+            return profiler.profile(self.get_url_name(), endpoint.dispatch_api, api_request)
         return endpoint.dispatch_api(api_request)
     
     def internal_dispatch(self, **kwargs):
@@ -60,15 +67,40 @@ class EndpointViewMixin(ConditionalAccessMixin):
         assert not self.api_request
         api_request = self.create_internal_apirequest(**kwargs)
         endpoint = api_request.get_endpoint(self.get_url_name())
+        if metrics.enabled:
+            internal_requests.inc(endpoint=self.get_url_name())
         return endpoint.dispatch_api(api_request)
     
+    def time_phase(self, phase):
+        '''
+        Returns a context manager sending the `endpoint_phase` signal with the duration of the block
+        '''
+        return timed_phase(self, phase)
+    
     def dispatch_api(self, api_request):
         '''
         Execute the api request
         :rtype: HttpResponse
         '''
-        response = self.generate_api_response(api_request)
-        return self.normalize_response(response)
+        start = time.time()
+        instrumentation = api_request.start_instrumentation()
+        allocations = api_request.start_allocation_counter()
+        try:
+            with self.time_phase('dispatch'):
+                response = self.generate_api_response(api_request)
+                with self.time_phase('normalize_response'):
+                    response = self.normalize_response(response)
+        finally:
+            if instrumentation is not None:
+                instrumentation.stop()
+            if allocations is not None:
+                allocations.stop()
+                self.get_logger().debug('Allocations of %s: %s' % (self.get_url_name(), sorted(allocations.items())))
+        if instrumentation is not None and isinstance(response, http.HttpResponse):
+            instrumentation.add_headers(response)
+        if metrics.enabled:
+            record_request(self, api_request, response, time.time() - start)
+        return response
     
     def generate_api_response(self, api_request):
         '''
@@ -83,17 +115,21 @@ class EndpointViewMixin(ConditionalAccessMixin):
         self.args = api_request.url_args
         self.kwargs = api_request.url_kwargs
         
-        self.initialize_state()
+        with self.time_phase('initialize_state'):
+            self.initialize_state()
         
         assert self.state is not None
         
-        self.common_state.update(self.get_common_state_data())
+        with self.time_phase('common_state'):
+            self.common_state.update(self.get_common_state_data())
         
-        permission_response = self.api_permission_check(api_request, self)
+        with self.time_phase('permission_check'):
+            permission_response = self.api_permission_check(api_request, self)
         if permission_response is not None:
             return permission_response
         else:
-            return handler(api_request)
+            with self.time_phase('handler'):
+                return handler(api_request)
     
     def normalize_response(self, response_or_link):
         '''
@@ -0,0 +1,554 @@
+'''
+Benchmarks api requests against a synthetic site.
+
+A project of generated models is created in an in memory database: every
+model has a name, a choice field, a date, a foreign key to the previous model
+and an inline model pointing back at it. The models are registered on a
+`ResourceSite` along with the storage resources and every scenario is
+dispatched through the views of the site for each builtin media type::
+
+    python -m tests.benchmark --models=5 --rows=200 --iterations=20 --output=after.json
+    python -m tests.benchmark --models=5 --rows=200 --iterations=20 --compare=before.json
+
+With `--startup` the models are instead registered on a django admin site and
+the time to autoload them into a `ResourceSite`, eagerly and lazily, and to
+then build the URL patterns of the site is measured::
+
+    python -m tests.benchmark --startup --models=500 --iterations=3
+
+With `--export` the rows of a single model are wrapped in resource items and
+serialized with the JSON datatap, measuring the memory held by the items::
+
+    python -m tests.benchmark --export --rows=10000 --iterations=3
+
+With `--imports` hyperadmin is imported in fresh interpreters, timing the
+import, the first access of the default site and the cumulative import time
+of the slowest modules::
+
+    python -m tests.benchmark --imports --iterations=10
+
+Results are written as JSON: the latency percentiles and throughput, the
+queries and the allocations of one request of each scenario.
+'''
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+from optparse import OptionParser
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.test_settings')
+
+from django.conf import settings
+settings.DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+}
+
+from django.conf.urls.defaults import patterns, include, url
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.urlresolvers import resolve, set_urlconf
+from django.db import connection, models
+
+from hyperadmin import app_settings
+from hyperadmin.endpoints import MediaTypeRegistry
+from hyperadmin.instrumentation import count_allocations, percentile
+from hyperadmin.resources.models import ModelResource, InlineModelResource
+from hyperadmin.resources.models.autoload import DEFAULT_LOADER, clear_generated_resources
+from hyperadmin.sites import ResourceSite
+from hyperadmin.tests.common import SuperUserRequestFactory, count_queries
+
+
+APP_LABEL = 'benchmark'
+STATUS_CHOICES = [('draft', 'Draft'), ('published', 'Published'), ('archived', 'Archived')]
+
+#media types which wrap another or require parameters
+ACCEPT_HEADERS = {
+    'text/html-iframe-transport;level=1': 'text/html-iframe-transport;level=1,text/html',
+}
+QUERY_PARAMS = {
+    'text/javascript': 'callback=callback',
+}
+
+
+def create_models(count):
+    '''
+    Returns a list of (model, inline model) pairs
+    '''
+    pairs = list()
+    previous = None
+    for index in range(count):
+        name = 'Model%s' % index
+        attrs = {
+            '__module__': __name__,
+            'Meta': type('Meta', (object,), {'app_label': APP_LABEL}),
+            'name': models.CharField(max_length=100, db_index=True),
+            'status': models.CharField(max_length=20, choices=STATUS_CHOICES),
+            'created': models.DateTimeField(),
+        }
+        if previous is not None:
+            attrs['related'] = models.ForeignKey(previous, null=True, blank=True)
+        model = type(name, (models.Model,), attrs)
+        inline_model = type('%sEntry' % name, (models.Model,), {
+            '__module__': __name__,
+            'Meta': type('Meta', (object,), {'app_label': APP_LABEL}),
+            'parent': models.ForeignKey(model),
+            'value': models.IntegerField(),
+        })
+        pairs.append((model, inline_model))
+        previous = model
+    return pairs
+
+def create_tables(pairs):
+    cursor = connection.cursor()
+    seen_models = set()
+    for model, inline_model in pairs:
+        for table_model in (model, inline_model):
+            statements, pending = connection.creation.sql_create_model(table_model, no_style(), seen_models)
+            for statement in statements:
+                cursor.execute(statement)
+            seen_models.add(table_model)
+
+def populate(pairs, rows):
+    start = datetime.datetime(2010, 1, 1)
+    previous = None
+    for model, inline_model in pairs:
+        instances = list()
+        for index in range(rows):
+            kwargs = {'name': 'object %s' % index,
+                      'status': STATUS_CHOICES[index % len(STATUS_CHOICES)][0],
+                      'created': start + datetime.timedelta(days=index),}
+            if previous is not None:
+                kwargs['related_id'] = index % rows + 1
+            instances.append(model(**kwargs))
+        model.objects.bulk_create(instances)
+        inline_model.objects.bulk_create([inline_model(parent_id=index % rows + 1, value=index)
+                                          for index in range(rows * 2)])
+        previous = model
+
+def create_site(pairs):
+    site = ResourceSite(name='benchmark')
+    site.register_builtin_media_types()
+    for model, inline_model in pairs:
+        inline_class = type('%sInline' % inline_model.__name__, (InlineModelResource,), {
+            'model': inline_model,
+        })
+        resource_class = type('%sResource' % model.__name__, (ModelResource,), {
+            'inlines': [inline_class],
+            'list_display': ['name', 'status', 'created'],
+            'list_filter': ['status'],
+            'search_fields': ['name'],
+            'date_hierarchy': 'created',
+        })
+        site.register(model, resource_class, app_name=APP_LABEL)
+    site.install_storage_resources()
+    return site
+
+def create_admin_site(pairs):
+    from django.contrib.admin import AdminSite, ModelAdmin, TabularInline
+    admin_site = AdminSite(name='benchmark')
+    for model, inline_model in pairs:
+        inline_class = type('%sAdminInline' % inline_model.__name__, (TabularInline,), {
+            'model': inline_model,
+        })
+        admin_class = type('%sAdmin' % model.__name__, (ModelAdmin,), {
+            'inlines': [inline_class],
+            'list_display': ['name', 'status', 'created'],
+            'list_filter': ['status'],
+            'search_fields': ['name'],
+            'date_hierarchy': 'created',
+        })
+        admin_site.register(model, admin_class)
+    return admin_site
+
+def install_urls(site):
+    urlconf = types.ModuleType('benchmark_urls')
+    urlconf.urlpatterns = patterns('',
+        url(r'^hyper-admin/', include(site.urls)),
+    )
+    set_urlconf(urlconf)
+
+def get_media_types():
+    '''
+    Returns a media type recognized by each builtin media type class
+    '''
+    media_types = dict()
+    for media_type, media_type_class in MediaTypeRegistry(app_settings.MEDIA_TYPES).iteritems():
+        if media_type_class not in media_types or media_type == media_type_class.recognized_media_types[0]:
+            media_types[media_type_class] = media_type
+    return sorted(media_types.values())
+
+class Benchmark(object):
+    def __init__(self, models=3, rows=100, iterations=10, media_types=None):
+        self.model_count = models
+        self.rows = rows
+        self.iterations = iterations
+        self.media_types = media_types or get_media_types()
+
+    def setup(self):
+        call_command('syncdb', interactive=False, verbosity=0)
+        self.pairs = create_models(self.model_count)
+        create_tables(self.pairs)
+        populate(self.pairs, self.rows)
+        self.user = User.objects.create(username='benchmark', is_staff=True, is_active=True, is_superuser=True)
+        self.site = create_site(self.pairs)
+        install_urls(self.site)
+
+    def get_resource(self, index=-1):
+        return self.site.registry[self.pairs[index][0]]
+
+    def get_path(self, endpoint_name, query='', **kwargs):
+        endpoint = self.get_resource().endpoints[endpoint_name]
+        return self.site.reverse(endpoint.get_url_name(), **kwargs) + query
+
+    def get_list_path(self, resource):
+        return self.site.reverse(resource.endpoints['list'].get_url_name())
+
+    def get_form_data(self):
+        data = {'name': 'benchmark object',
+                'status': STATUS_CHOICES[0][0],
+                'created': '2012-01-01 00:00:00',}
+        if len(self.pairs) > 1:
+            data['related'] = '1'
+        return data
+
+    def get_scenarios(self):
+        '''
+        Returns a list of (name, method, path, data) for the requests to time
+        '''
+        storages = [resource for resource in self.site.registry.values()
+                    if getattr(resource, 'resource_name', None) == 'media']
+        last_page = (self.rows - 1) // self.get_resource().list_per_page + 1
+        scenarios = [
+            ('directory', 'get', self.get_list_path(self.site.get_index_endpoint()), None),
+            ('list', 'get', self.get_path('list'), None),
+            ('list_filtered', 'get', self.get_path('list', '?status__exact=%s' % STATUS_CHOICES[1][0]), None),
+            ('list_searched', 'get', self.get_path('list', '?q=object+1'), None),
+            ('list_paginated', 'get', self.get_path('list', '?p=%s' % last_page), None),
+            ('detail', 'get', self.get_path('detail', pk=1), None),
+            ('create', 'post', self.get_path('list'), self.get_form_data()),
+            ('update', 'post', self.get_path('detail', pk=1), self.get_form_data()),
+            ('options', 'options', self.get_path('list'), None),
+        ]
+        for storage in storages:
+            scenarios.append(('storage_list', 'get', self.get_list_path(storage), None))
+        return scenarios
+
+    def get_internal_scenarios(self):
+        '''
+        Returns a list of (name, callable) of internal api calls to time
+        '''
+        resource = self.get_resource()
+        return [
+            ('internal_list', lambda: resource.endpoints['list'].internal_dispatch()),
+            ('internal_detail', lambda: resource.endpoints['detail'].internal_dispatch(url_kwargs={'pk': 1})),
+        ]
+
+    def make_call(self, method, path, data, media_type):
+        factory = SuperUserRequestFactory(user=self.user, HTTP_ACCEPT=ACCEPT_HEADERS.get(media_type, media_type))
+        if media_type in QUERY_PARAMS:
+            path = '%s%s%s' % (path, '&' if '?' in path else '?', QUERY_PARAMS[media_type])
+        def call():
+            if data is None:
+                request = getattr(factory, method)(path)
+            else:
+                request = getattr(factory, method)(path, data)
+            match = resolve(request.path_info)
+            response = match.func(request, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        return call
+
+    def measure(self, name, media_type, call):
+        result = {'scenario': name,
+                  'media_type': media_type,
+                  'iterations': self.iterations,
+                  'errors': 0,}
+        try:
+            with count_queries() as queries:
+                with count_allocations() as allocations:
+                    response = call()
+        except Exception, error:
+            result['errors'] = self.iterations
+            result['error'] = repr(error)
+            return result
+        result['status_code'] = getattr(response, 'status_code', None)
+        result['queries'] = len(queries)
+        result['allocations'] = dict(allocations)
+
+        durations = list()
+        for iteration in range(self.iterations):
+            start = time.time()
+            try:
+                call()
+            except Exception:
+                result['errors'] += 1
+            durations.append(time.time() - start)
+        total = sum(durations)
+        result.update({
+            'mean_ms': total / len(durations) * 1000,
+            'p50_ms': percentile(durations, 50) * 1000,
+            'p90_ms': percentile(durations, 90) * 1000,
+            'max_ms': max(durations) * 1000,
+            'requests_per_second': total and len(durations) / total or None,
+        })
+        return result
+
+    def run(self):
+        results = list()
+        for media_type in self.media_types:
+            for name, method, path, data in self.get_scenarios():
+                results.append(self.measure(name, media_type, self.make_call(method, path, data, media_type)))
+        for name, call in self.get_internal_scenarios():
+            results.append(self.measure(name, 'internal', call))
+        return results
+
+    def get_report(self, results):
+        return {'commit': get_commit(),
+                'date': datetime.datetime.now().isoformat(),
+                'python': sys.version.split()[0],
+                'options': {'models': self.model_count,
+                            'rows': self.rows,
+                            'iterations': self.iterations,},
+                'results': results,}
+
+def get_item_size(item):
+    '''
+    Returns the bytes held by a resource item and its link collector, not
+    counting the instance it wraps
+    '''
+    size = sys.getsizeof(item)
+    if hasattr(item, '__dict__'):
+        size += sys.getsizeof(item.__dict__)
+    links = getattr(item, '_links', None) or getattr(item, '__dict__', {}).get('links')
+    if links is not None:
+        size += sys.getsizeof(links) + sys.getsizeof(getattr(links, '__dict__', {}))
+    return size
+
+class ExportBenchmark(Benchmark):
+    '''
+    Times wrapping every row of a model in resource items and serializing
+    them with the JSON datatap, and measures the memory held by the items
+    '''
+    def __init__(self, rows=10000, iterations=3):
+        super(ExportBenchmark, self).__init__(models=1, rows=rows, iterations=iterations)
+
+    def get_endpoint(self):
+        api_request = self.site.create_internal_apirequest(url_args=[], url_kwargs={})
+        return self.get_resource().endpoints['list'].fork(api_request=api_request)
+
+    def export(self):
+        from datatap.datataps import JSONDataTap
+        endpoint = self.get_endpoint()
+        instances = list(self.pairs[0][0].objects.all())
+        items = [endpoint.get_resource_item(instance) for instance in instances]
+        payload = io.BytesIO()
+        JSONDataTap(instream=endpoint.get_datatap(instream=items)).send(payload)
+        return items
+
+    def run(self):
+        result = self.measure('export', 'application/json', self.export)
+        items = self.export()
+        result['rows'] = len(items)
+        result['item_bytes'] = sum([get_item_size(item) for item in items])
+        result['bytes_per_item'] = result['item_bytes'] / float(len(items) or 1)
+        return [result]
+
+class StartupBenchmark(object):
+    '''
+    Times autoloading the models of an admin site and the first build of the
+    URL patterns, which materializes lazily registered resources
+    '''
+    def __init__(self, models=500, iterations=3):
+        self.model_count = models
+        self.iterations = iterations
+
+    def setup(self):
+        self.pairs = create_models(self.model_count)
+        self.admin_site = create_admin_site(self.pairs)
+
+    def measure(self, lazy):
+        result = {'scenario': lazy and 'startup_lazy' or 'startup_eager',
+                  'media_type': 'startup',
+                  'iterations': self.iterations,
+                  'models': self.model_count,}
+        register_durations = list()
+        resolve_durations = list()
+        for iteration in range(self.iterations):
+            #time generating the resource classes as well
+            clear_generated_resources()
+            site = ResourceSite(name='benchmark')
+            loader = DEFAULT_LOADER(root_endpoint=site, admin_site=self.admin_site, lazy=lazy)
+            with count_queries() as queries:
+                with count_allocations() as allocations:
+                    start = time.time()
+                    loader.register_resources()
+                    registered = time.time()
+                    site.get_urls()
+                    resolved = time.time()
+            register_durations.append(registered - start)
+            resolve_durations.append(resolved - registered)
+        result.update({
+            'queries': len(queries),
+            'allocations': dict(allocations),
+            'resources': len(site.registry),
+            'mean_ms': sum(register_durations) / len(register_durations) * 1000,
+            'first_resolution_ms': sum(resolve_durations) / len(resolve_durations) * 1000,
+        })
+        return result
+
+    def run(self):
+        return [self.measure(lazy=False), self.measure(lazy=True)]
+
+    def get_report(self, results):
+        return {'commit': get_commit(),
+                'date': datetime.datetime.now().isoformat(),
+                'python': sys.version.split()[0],
+                'options': {'models': self.model_count,
+                            'iterations': self.iterations,
+                            'startup': True,},
+                'results': results,}
+
+IMPORT_SCRIPT = '''
+import __builtin__, json, sys, time
+timings = dict()
+original_import = __builtin__.__import__
+
+def timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return original_import(name, *args, **kwargs)
+    start = time.time()
+    try:
+        return original_import(name, *args, **kwargs)
+    finally:
+        timings.setdefault(name, time.time() - start)
+
+__builtin__.__import__ = timed_import
+start = time.time()
+import hyperadmin
+imported = time.time() - start
+__builtin__.__import__ = original_import
+modules = len(sys.modules)
+start = time.time()
+hyperadmin.site.get_urls()
+json.dump({'import': imported, 'first_access': time.time() - start,
+           'modules': modules, 'timings': timings}, sys.stdout)
+'''
+
+class ImportBenchmark(object):
+    '''
+    Times importing hyperadmin in fresh interpreters along with the first
+    access of the default site, and reports the cumulative import time of
+    the slowest modules in the manner of `python -X importtime`
+    '''
+    def __init__(self, iterations=10, slowest=15):
+        self.iterations = iterations
+        self.slowest = slowest
+
+    def setup(self):
+        self.env = dict(os.environ)
+        self.cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def sample(self):
+        process = subprocess.Popen([sys.executable, '-W', 'ignore', '-c', IMPORT_SCRIPT],
+                                   stdout=subprocess.PIPE, env=self.env, cwd=self.cwd)
+        return json.loads(process.communicate()[0])
+
+    def run(self):
+        samples = [self.sample() for iteration in range(self.iterations)]
+        results = list()
+        for scenario in ('import', 'first_access'):
+            durations = [sample[scenario] * 1000 for sample in samples]
+            results.append({'scenario': scenario,
+                            'media_type': 'startup',
+                            'iterations': self.iterations,
+                            'queries': 0,
+                            'modules': samples[0]['modules'],
+                            'mean_ms': sum(durations) / len(durations),
+                            'p50_ms': percentile(durations, 50),
+                            'max_ms': max(durations),})
+        modules = dict()
+        for sample in samples:
+            for name, duration in sample['timings'].iteritems():
+                modules.setdefault(name, []).append(duration * 1000)
+        slowest = sorted([(sum(durations) / len(durations), name) for name, durations in modules.iteritems()], reverse=True)
+        results[0]['slowest_modules'] = [{'module': name, 'cumulative_ms': duration} for duration, name in slowest[:self.slowest]]
+        return results
+
+    def get_report(self, results):
+        return {'commit': get_commit(),
+                'date': datetime.datetime.now().isoformat(),
+                'python': sys.version.split()[0],
+                'options': {'iterations': self.iterations,
+                            'imports': True,},
+                'results': results,}
+
+def get_commit():
+    try:
+        process = subprocess.Popen(['git', 'rev-parse', '--short', 'HEAD'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        return process.communicate()[0].strip() or None
+    except OSError:
+        return None
+
+def compare(baseline, report, stream=sys.stdout):
+    '''
+    Writes the change of the mean latency and the queries of every scenario found in both reports
+    '''
+    previous = dict([((entry['scenario'], entry['media_type']), entry) for entry in baseline['results']])
+    stream.write('%-20s %-40s %10s %10s %8s %8s\n' % ('scenario', 'media type', 'before ms', 'after ms', 'change', 'queries'))
+    for entry in report['results']:
+        before = previous.get((entry['scenario'], entry['media_type']))
+        if before is None or 'mean_ms' not in before or 'mean_ms' not in entry:
+            continue
+        change = (entry['mean_ms'] - before['mean_ms']) / before['mean_ms'] * 100 if before['mean_ms'] else 0
+        stream.write('%-20s %-40s %10.2f %10.2f %+7.1f%% %3s->%-3s\n' % (
+            entry['scenario'], entry['media_type'], before['mean_ms'], entry['mean_ms'],
+            change, before['queries'], entry['queries']))
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--models', type='int', default=3, help='Number of generated models')
+    parser.add_option('--rows', type='int', default=100, help='Rows per generated model')
+    parser.add_option('--iterations', type='int', default=10, help='Timed requests per scenario')
+    parser.add_option('--media-type', action='append', dest='media_types', default=None,
+                      help='Only benchmark the given media type, may be repeated')
+    parser.add_option('--startup', action='store_true', default=False,
+                      help='Time autoloading the models from an admin site instead of requests')
+    parser.add_option('--export', action='store_true', default=False,
+                      help='Time exporting the rows of a model as resource items and measure their memory')
+    parser.add_option('--imports', action='store_true', default=False,
+                      help='Time importing hyperadmin in fresh interpreters instead of requests')
+    parser.add_option('--output', default=None, help='File to write the JSON results to, defaults to stdout')
+    parser.add_option('--compare', default=None, help='JSON results of a previous run to compare against')
+    options, args = parser.parse_args(argv)
+
+    if options.startup:
+        benchmark = StartupBenchmark(models=options.models, iterations=options.iterations)
+    elif options.export:
+        benchmark = ExportBenchmark(rows=options.rows, iterations=options.iterations)
+    elif options.imports:
+        benchmark = ImportBenchmark(iterations=options.iterations)
+    else:
+        benchmark = Benchmark(models=options.models, rows=options.rows,
+                              iterations=options.iterations, media_types=options.media_types)
+    benchmark.setup()
+    report = benchmark.get_report(benchmark.run())
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    elif not options.compare:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as baseline:
+            compare(json.load(baseline), report)
+
+if __name__ == '__main__':
+    main()